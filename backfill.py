@@ -0,0 +1,59 @@
+"""
+Backfill an absolute date range with the configuration of `main.py`.
+
+Plans the range into shards, leaves out hours already recorded in the state store,
+and downloads the rest in the chosen order with `--max-workers` concurrent
+requests, printing throughput and an estimated completion time as it goes. Runs
+every project in `AMP_PROJECTS` (or the single configured project). Interrupted
+backfills resume from the state store and the run journal.
+
+Usage:
+    python backfill.py --start 2025-01-01 --end 2025-03-31 [--order newest|oldest]
+        [--max-workers 8] [--shard-hours 24] [--no-compact]
+"""
+
+import argparse
+import datetime as dt
+import sys
+import main as pipeline_config
+from modules.backfill import BACKFILL_ORDERS, backfill_daydiffs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--start', type=dt.date.fromisoformat, required=True, help='First day, YYYY-MM-DD')
+    parser.add_argument('--end', type=dt.date.fromisoformat, required=True, help='Last day (inclusive), YYYY-MM-DD')
+    parser.add_argument('--order', choices=BACKFILL_ORDERS, default='newest', help='Which end of the range to fetch first')
+    parser.add_argument('--max-workers', type=int, default=pipeline_config.max_workers,
+                        help='Shards downloaded concurrently per project')
+    parser.add_argument('--shard-hours', type=int, default=24,
+                        help='Hours per Export API request (whole days mean fewer requests)')
+    parser.add_argument('--no-compact', action='store_true', help='Skip compaction of the backfilled days')
+    args = parser.parse_args()
+
+    try:
+        daydiffs = backfill_daydiffs(args.start, args.end, args.order)
+    except ValueError as err:
+        parser.error(str(err))
+
+    # Compact the backfilled days that are complete, as the hourly run does for recent days
+    compact_daydiffs = []
+    if pipeline_config.compact_daydiffs and not args.no_compact:
+        compact_daydiffs = [daydiff for daydiff in daydiffs if daydiff >= min(pipeline_config.compact_daydiffs)]
+
+    print(f'Backfilling {args.start} to {args.end} ({len(daydiffs)} days, {args.order} first)')
+    outcomes = pipeline_config.run_all(
+        run_daydiffs=daydiffs,
+        run_compact_daydiffs=compact_daydiffs,
+        run_shard_hours=args.shard_hours,
+        run_max_workers=args.max_workers,
+        report_progress=True
+    )
+    failed = [name or 'default' for name, outcome in outcomes.items() if outcome['result']['failed_uploads']]
+    if failed:
+        print(f'Files failed to upload for {", ".join(failed)}; rerun to retry them')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
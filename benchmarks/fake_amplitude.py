@@ -0,0 +1,240 @@
+"""
+Local stand-in for the Amplitude Export API, for benchmarks.
+
+Generates realistic Export API payloads: a zip holding one gzipped NDJSON file per
+hour (`<project>/<project>_<YYYY-MM-DD>_<H>#0.json.gz`). The events have the usual
+top-level fields and nested `event_properties`/`user_properties` of configurable
+width. Payloads are deterministic for a given window and seed, cached on disk, and
+served by a threaded HTTP server that supports `Range` requests like the real API.
+"""
+
+import datetime as dt
+import gzip
+import hashlib
+import http.server
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+EVENT_TYPES = ['page_view', 'click', 'session_start', 'sign_up', 'purchase', 'video_play']
+COUNTRIES = [('United Kingdom', 'England', 'London'), ('Germany', 'Berlin', 'Berlin'), ('France', 'Ile-de-France', 'Paris')]
+
+
+def generate_event(rng: random.Random, event_time: dt.datetime, property_width: int) -> Dict[str, Any]:
+    """
+    Builds one synthetic Amplitude event.
+
+    Args:
+        rng (random.Random): Seeded random generator.
+        event_time (dt.datetime): Event timestamp.
+        property_width (int): Number of keys in `event_properties`/`user_properties`.
+
+    Returns:
+        Dict[str, Any]: Event shaped like an Export API record.
+    """
+    country, region, city = rng.choice(COUNTRIES)
+    session_id = int(event_time.timestamp() * 1000) - rng.randint(0, 1800000)
+    return {
+        'uuid': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        'event_id': rng.randint(1, 500),
+        'session_id': session_id,
+        'event_type': rng.choice(EVENT_TYPES),
+        'event_time': event_time.strftime('%Y-%m-%d %H:%M:%S.%f'),
+        'server_upload_time': (event_time + dt.timedelta(seconds=2)).strftime('%Y-%m-%d %H:%M:%S.%f'),
+        'client_event_time': event_time.strftime('%Y-%m-%d %H:%M:%S.%f'),
+        'user_id': f'user_{rng.randint(1, 50000)}',
+        'device_id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        'amplitude_id': rng.randint(10 ** 11, 10 ** 12),
+        'platform': 'Web',
+        'os_name': rng.choice(['Chrome', 'Firefox', 'Safari']),
+        'os_version': str(rng.randint(100, 130)),
+        'device_type': rng.choice(['Mac', 'Windows', 'iPhone', None]),
+        'device_family': rng.choice(['Mac', 'Windows', 'Apple iPhone']),
+        'country': country,
+        'region': region,
+        'city': city,
+        'ip_address': f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}',
+        'language': 'English',
+        'event_properties': {
+            f'[Amplitude] Property {i}': f'value-{rng.randint(0, 1000)}' for i in range(property_width)
+        },
+        'user_properties': {
+            f'initial_utm_{i}': f'utm-{rng.randint(0, 50)}' for i in range(property_width)
+        },
+        'group_properties': {},
+        'groups': {},
+        'data': {'path': '/2/httpapi'},
+    }
+
+
+def build_export_zip(
+    path: str,
+    start: dt.datetime,
+    end: dt.datetime,
+    events_per_hour: int,
+    property_width: int = 10,
+    project_id: int = 123456,
+    seed: int = 0
+) -> int:
+    """
+    Writes an Export API style zip for the inclusive hour window [start, end].
+
+    Args:
+        path (str): Output zip path.
+        start (dt.datetime): First hour.
+        end (dt.datetime): Last hour (inclusive).
+        events_per_hour (int): Events generated per hour.
+        property_width (int): Keys per nested properties object.
+        project_id (int): Project id used in member names.
+        seed (int): Base random seed.
+
+    Returns:
+        int: Size of the zip in bytes.
+    """
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as zip_ref:
+        hour = start
+        while hour <= end:
+            rng = random.Random(f'{seed}-{hour:%Y%m%dT%H}')
+            lines = []
+            for _ in range(events_per_hour):
+                event_time = hour + dt.timedelta(microseconds=rng.randint(0, 3600 * 10 ** 6 - 1))
+                lines.append(json.dumps(generate_event(rng, event_time, property_width)))
+            member = f'{project_id}/{project_id}_{hour:%Y-%m-%d}_{hour.hour}#0.json.gz'
+            zip_ref.writestr(member, gzip.compress(('\n'.join(lines) + '\n').encode(), compresslevel=6))
+            hour += dt.timedelta(hours=1)
+    return os.path.getsize(path)
+
+
+class FakeExportServer:
+    """
+    Threaded HTTP server emulating `GET /api/2/export?start=...&end=...`.
+    """
+
+    def __init__(
+        self,
+        events_per_hour: int = 1000,
+        property_width: int = 10,
+        latency_seconds: float = 0.0,
+        seed: int = 0,
+        cache_dir: Optional[str] = None
+    ) -> None:
+        """
+        Args:
+            events_per_hour (int): Events generated per hour of the requested window.
+            property_width (int): Keys per nested properties object.
+            latency_seconds (float): Artificial delay before each response.
+            seed (int): Base random seed.
+            cache_dir (Optional[str]): Where generated zips are cached. Defaults to a temp dir.
+        """
+        self.events_per_hour = events_per_hour
+        self.property_width = property_width
+        self.latency_seconds = latency_seconds
+        self.seed = seed
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix='fake_amplitude_')
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Export endpoint URL of the running server."""
+        return f'http://127.0.0.1:{self._server.server_port}/api/2/export'
+
+    def payload_path(self, start: str, end: str) -> str:
+        """
+        Returns the cached zip for a window, generating it on first request.
+
+        Args:
+            start (str): First hour, formatted `%Y%m%dT%H`.
+            end (str): Last hour (inclusive), formatted `%Y%m%dT%H`.
+
+        Returns:
+            str: Path of the zip.
+        """
+        key = hashlib.md5(f'{start}-{end}-{self.events_per_hour}-{self.property_width}-{self.seed}'.encode()).hexdigest()
+        path = os.path.join(self.cache_dir, key + '.zip')
+        with self._lock:
+            if not os.path.exists(path):
+                build_export_zip(
+                    path + '.tmp',
+                    dt.datetime.strptime(start, '%Y%m%dT%H'),
+                    dt.datetime.strptime(end, '%Y%m%dT%H'),
+                    self.events_per_hour,
+                    self.property_width,
+                    seed=self.seed
+                )
+                os.replace(path + '.tmp', path)
+        return path
+
+    def _handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; without TCP_NODELAY a kept-alive
+            # connection stalls each response on delayed ACKs (~40 ms)
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                with server._lock:
+                    server.requests += 1
+                query = parse_qs(urlparse(self.path).query)
+                if 'start' not in query or 'end' not in query:
+                    self.send_error(400, 'start and end are required')
+                    return
+                if server.latency_seconds:
+                    time.sleep(server.latency_seconds)
+
+                path = server.payload_path(query['start'][0], query['end'][0])
+                size = os.path.getsize(path)
+                offset = 0
+                range_header = self.headers.get('Range')
+                if range_header and range_header.startswith('bytes='):
+                    offset = int(range_header[len('bytes='):].split('-')[0])
+                    if offset >= size:
+                        self.send_error(416)
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {offset}-{size - 1}/{size}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'application/zip')
+                self.send_header('Content-Length', str(size - offset))
+                self.end_headers()
+
+                with open(path, 'rb') as file:
+                    file.seek(offset)
+                    while True:
+                        chunk = file.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> 'FakeExportServer':
+        """Starts serving in a background thread."""
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeExportServer':
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
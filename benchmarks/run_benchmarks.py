@@ -0,0 +1,250 @@
+"""
+Benchmark the pipeline stages against local stand-ins for Amplitude and S3.
+
+Serves synthetic Export API payloads from `fake_amplitude.FakeExportServer` and
+uploads to an in-process moto S3 (default) or a MinIO/S3-compatible endpoint, so
+no real credentials or network are needed. Runs in a scratch working directory:
+
+1. `extract_gzip_amplitude`    -> stage.extract
+2. `stream_zip_to_s3`          -> stage.stream_upload (zips kept for the next stages)
+3. `parse_gzip_amplitude`      -> stage.parse
+4. `load_amp_json`             -> stage.upload
+5. `pipeline.run_pipeline`     -> stage.pipeline (steps 1, 3 and 4 overlapped; not part
+                                  of stage.total, its own counters go to `pipeline_metrics`)
+
+Results (config, per-stage timers, counters, peak RSS) are written as JSON to
+`benchmarks/results/`. Pass `--compare` with an earlier result to print per-stage
+deltas and fail on regressions.
+
+Usage:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/run_benchmarks.py [--days 1] [--events-per-hour 2000] [--compare benchmarks/results/baseline.json]
+    python benchmarks/run_benchmarks.py --s3-endpoint http://localhost:9000   # MinIO, credentials from AWS_* env vars
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from fake_amplitude import FakeExportServer  # noqa: E402
+from modules.metrics import RunMetrics  # noqa: E402
+
+STAGES = ['stage.extract', 'stage.stream_upload', 'stage.parse', 'stage.upload', 'stage.total', 'stage.pipeline']
+
+
+@contextlib.contextmanager
+def s3_backend(bucket: str, endpoint_url: Optional[str]) -> Iterator[Dict[str, Optional[str]]]:
+    """
+    Provides S3 credentials for the benchmark bucket, creating the bucket if needed.
+
+    Args:
+        bucket (str): Bucket name.
+        endpoint_url (Optional[str]): S3-compatible endpoint (e.g. MinIO). None uses moto.
+
+    Yields:
+        Dict[str, Optional[str]]: `api_keys` in the shape `modules.load_data_to_s3` expects.
+    """
+    if endpoint_url:
+        api_keys = {
+            'Access_key_ID': os.getenv('AWS_ACCESS_KEY_ID', 'minioadmin'),
+            'Secret_access_key': os.getenv('AWS_SECRET_ACCESS_KEY', 'minioadmin'),
+            'AWS_BUCKET_NAME': bucket,
+            'Endpoint_url': endpoint_url,
+        }
+        mock = contextlib.nullcontext()
+    else:
+        try:
+            from moto import mock_aws
+        except ImportError as err:
+            raise ImportError('The moto S3 backend requires `pip install -r benchmarks/requirements.txt`') from err
+        api_keys = {'Access_key_ID': 'testing', 'Secret_access_key': 'testing', 'AWS_BUCKET_NAME': bucket}
+        mock = mock_aws()
+
+    from modules.load_data_to_s3 import get_s3_client
+    with mock:
+        s3 = get_s3_client(api_keys)
+        try:
+            s3.create_bucket(Bucket=bucket, CreateBucketConfiguration={'LocationConstraint': s3.meta.region_name})
+        except s3.exceptions.BucketAlreadyOwnedByYou:
+            pass
+        yield api_keys
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Runs every stage once against the local stand-ins.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+
+    Returns:
+        Dict[str, Any]: Benchmark config, environment and metrics summary.
+    """
+    from modules.extract_amplitude_files import extract_gzip_amplitude, plan_shards
+    from modules.load_data_to_s3 import build_transfer_config, load_amp_json
+    from modules.parse_gzip_to_json import parse_gzip_amplitude
+    from modules.pipeline import run_pipeline
+    from modules.stream_zip_to_s3 import stream_zip_to_s3
+
+    metrics = RunMetrics(run_id=args.run_id)
+    pipeline_metrics = RunMetrics(run_id=args.run_id)
+    daydiffs = list(range(1, args.days + 1))
+    amp_keys = {'AMP_API_KEY': 'benchmark', 'AMP_SECRET_KEY': 'benchmark'}
+    work_dir = tempfile.mkdtemp(prefix='amp_benchmark_')
+    cwd = os.getcwd()
+
+    server = FakeExportServer(
+        events_per_hour=args.events_per_hour,
+        property_width=args.property_width,
+        latency_seconds=args.latency_ms / 1000,
+        cache_dir=os.path.join(work_dir, 'payloads')
+    )
+    os.makedirs(server.cache_dir)
+    # Generate the payloads up front so the extract timing measures transfer, not synthesis
+    for shard_start, shard_end in plan_shards(daydiffs, args.shard_hours):
+        server.payload_path(f'{shard_start:%Y%m%dT%H}', f'{shard_end:%Y%m%dT%H}')
+    try:
+        with server, s3_backend(args.bucket, args.s3_endpoint) as s3_keys:
+            os.chdir(work_dir)
+            with metrics.timer('stage.total'):
+                with metrics.timer('stage.extract'):
+                    extract_gzip_amplitude(
+                        daydiffs, 1, 10, amp_keys,
+                        shard_hours=args.shard_hours,
+                        max_workers=args.workers,
+                        metrics=metrics,
+                        url=server.url
+                    )
+                with metrics.timer('stage.stream_upload'):
+                    stream_zip_to_s3(
+                        'benchmark-stream', s3_keys,
+                        output_codec=args.codec,
+                        delete_zip=False,
+                        metrics=metrics,
+                        max_workers=args.upload_workers
+                    )
+                with metrics.timer('stage.parse'):
+                    parse_gzip_amplitude(
+                        delete_zip=True, output_codec=args.codec, metrics=metrics, parse_workers=args.parse_workers
+                    )
+                with metrics.timer('stage.upload'):
+                    load_amp_json('benchmark-load', s3_keys, args.upload_workers, build_transfer_config(), metrics=metrics)
+            with metrics.timer('stage.pipeline'):
+                run_pipeline(
+                    daydiffs, 1, 10, amp_keys, 'benchmark-pipeline', s3_keys,
+                    shard_hours=args.shard_hours,
+                    max_workers=args.workers,
+                    output_codec=args.codec,
+                    parse_workers=args.parse_workers,
+                    upload_workers=args.upload_workers,
+                    metrics=pipeline_metrics,
+                    url=server.url
+                )
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    config = {key: value for key, value in vars(args).items() if key not in ('compare', 'output', 'run_id', 'threshold', 'min_delta_seconds')}
+    return {
+        'config': config,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'metrics': metrics.summary(),
+        'pipeline_metrics': pipeline_metrics.summary(),
+    }
+
+
+def compare_results(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float,
+    min_delta_seconds: float = 0.05
+) -> bool:
+    """
+    Prints per-stage timings against a baseline result.
+
+    Args:
+        current (Dict[str, Any]): Result of this run.
+        baseline (Dict[str, Any]): Earlier result to compare with.
+        threshold (float): Relative slowdown (e.g. 0.2 for 20%) counted as a regression.
+        min_delta_seconds (float): Absolute slowdown below which a stage is treated as noise.
+
+    Returns:
+        bool: True if any stage regressed beyond the threshold.
+    """
+    baseline_config = baseline.get('config', {})
+    if any(baseline_config.get(key, value) != value for key, value in current['config'].items()):
+        print('Warning: benchmark config differs from the baseline; deltas may not be comparable')
+
+    regressed = False
+    print(f'{"stage":<22}{"baseline s":>12}{"current s":>12}{"delta":>10}')
+    for stage in STAGES:
+        before = baseline['metrics']['timers'].get(stage, {}).get('total_seconds')
+        after = current['metrics']['timers'].get(stage, {}).get('total_seconds')
+        if before is None or after is None:
+            continue
+        delta = (after - before) / before if before else 0.0
+        flag = ''
+        if delta > threshold and after - before > min_delta_seconds:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f'{stage:<22}{before:>12.3f}{after:>12.3f}{delta:>+10.1%}{flag}')
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', type=int, default=1, help='Full days of data to extract')
+    parser.add_argument('--events-per-hour', type=int, default=2000, help='Synthetic events per hour')
+    parser.add_argument('--property-width', type=int, default=10, help='Keys per event/user properties object')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Artificial Export API latency per request')
+    parser.add_argument('--shard-hours', type=int, default=6, help='Hours per Export API request')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent shard downloads')
+    parser.add_argument('--parse-workers', type=int, default=None, help='Parse processes (default: one per CPU)')
+    parser.add_argument('--upload-workers', type=int, default=16, help='Concurrent S3 uploads')
+    parser.add_argument('--codec', default='gzip', choices=['none', 'gzip', 'zstd'], help='Output codec')
+    parser.add_argument('--bucket', default='amp-benchmark', help='S3 bucket name')
+    parser.add_argument('--s3-endpoint', default=None, help='S3-compatible endpoint (e.g. MinIO); default is moto')
+    parser.add_argument('--run-id', default=None, help='Result name; defaults to the start time')
+    parser.add_argument('--output', default=None, help='Result path; defaults to benchmarks/results/<run id>.json')
+    parser.add_argument('--compare', default=None, help='Earlier result JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown counted as a regression')
+    parser.add_argument('--min-delta-seconds', type=float, default=0.05, help='Slowdowns smaller than this are noise')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = run_benchmark(args)
+    print(f'Benchmark finished in {time.perf_counter() - start:.1f}s')
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{result["metrics"]["run_id"]}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(result, file, indent=2)
+    print(f'Benchmark result written to {output}')
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare_results(result, baseline, args.threshold, args.min_delta_seconds):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Cold-start import budget check for the hourly job.
+
+Imports the pipeline modules used by `main.py` in a fresh interpreter with
+`python -X importtime`, then fails if the total import time exceeds the budget or
+if a heavy dependency (pandas, boto3, pyarrow, ...) is imported at startup instead
+of lazily by the stage that needs it.
+
+Usage:
+    python check_import_time.py [--budget-ms 150] [--runs 3]
+"""
+
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Modules imported by main.py at startup
+STARTUP_MODULES = [
+    'dotenv',
+    'modules.compact_s3',
+    'modules.load_data_to_s3',
+    'modules.state_store',
+    'modules.dedupe',
+    'modules.extract_amplitude_files',
+    'modules.fanout_events',
+    'modules.http_client',
+    'modules.metrics',
+    'modules.backfill',
+    'modules.checkpoint',
+    'modules.parse_gzip_to_json',
+    'modules.pipeline',
+    'modules.projects',
+    'modules.stream_zip_to_s3',
+    'modules.upload_manifest',
+    'modules.validate_events',
+]
+
+# Dependencies that must only be imported lazily
+HEAVY_MODULES = ['pandas', 'numpy', 'boto3', 'botocore', 'requests', 'pyarrow', 'zstandard']
+
+
+def measure_imports(modules: List[str]) -> Tuple[int, Dict[str, int]]:
+    """
+    Imports `modules` in a fresh interpreter with `-X importtime`.
+
+    Args:
+        modules (List[str]): Modules to import.
+
+    Returns:
+        Tuple[int, Dict[str, int]]: Total import time in microseconds, and the
+            cumulative time of every imported module (by module name).
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    total_us = 0
+    cumulative: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        # Format: "import time:      self [us] |   cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        cumulative_us = int(cumulative_us)
+        cumulative[name.strip()] = cumulative_us
+        # Top-level imports are not indented, so their cumulative times add up to the total
+        if not name[1:].startswith(' '):
+            total_us += cumulative_us
+    return total_us, cumulative
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--budget-ms', type=float, default=150.0, help='Maximum total import time in ms')
+    parser.add_argument('--runs', type=int, default=3, help='Runs to take the best of (reduces noise)')
+    parser.add_argument('--top', type=int, default=10, help='Slowest modules to print')
+    args = parser.parse_args()
+
+    best_total_us = None
+    best_cumulative: Dict[str, int] = {}
+    for _ in range(max(1, args.runs)):
+        total_us, cumulative = measure_imports(STARTUP_MODULES)
+        if best_total_us is None or total_us < best_total_us:
+            best_total_us, best_cumulative = total_us, cumulative
+
+    print(f'Startup import time: {best_total_us / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)')
+    for name, cumulative_us in sorted(best_cumulative.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'  {cumulative_us / 1000:8.1f} ms  {name}')
+
+    failed = False
+    heavy = sorted(name for name in best_cumulative if name.split('.')[0] in HEAVY_MODULES)
+    if heavy:
+        print(f'FAIL: heavy modules imported at startup: {", ".join(heavy)}')
+        failed = True
+    if best_total_us / 1000 > args.budget_ms:
+        print('FAIL: startup import time exceeds budget')
+        failed = True
+    if not failed:
+        print('OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -103,34 +103,33 @@ for daydiff in daydiffs:
 
             print('Written zipped data')
 
-            # Create temp dir and unzip
-            temp_dir = tempfile.mkdtemp()
-
-            with zipfile.ZipFile(filepathzip, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-                log_times.append(dt.datetime.now())
-                log_items.append(filepathzip)
-                log_descriptions.append(log_desriptions_dict['extract'])
-
-            # Find the first subfolder in the temp dir (day folder)
-            day_folder = os.listdir(temp_dir)[0]
-            day_path = os.path.join(temp_dir, day_folder)
-
-            # Walk through extracted gzip files
-            for root, _, files in os.walk(day_path):
-                for file in files:
-                    if file.endswith('.gz'):
-                        print(file)
-                        gz_path = os.path.join(root, file)
-                        json_filename = file[:-3]  # Remove .gz
-                        output_path = os.path.join(directory, json_filename)
-
-                        # Decompress .gz to .json
-                        with gzip.open(gz_path, 'rb') as gz_file, open(output_path, 'wb') as out_file:
-                            shutil.copyfileobj(gz_file, out_file)
-                            log_times.append(dt.datetime.now())
-                            log_items.append(output_path)
-                            log_descriptions.append(log_desriptions_dict['copy'])
+            # Unzip into a temp dir that is removed however the block exits
+            with tempfile.TemporaryDirectory() as temp_dir:
+                with zipfile.ZipFile(filepathzip, 'r') as zip_ref:
+                    zip_ref.extractall(temp_dir)
+                    log_times.append(dt.datetime.now())
+                    log_items.append(filepathzip)
+                    log_descriptions.append(log_desriptions_dict['extract'])
+
+                # Find the first subfolder in the temp dir (day folder)
+                day_folder = os.listdir(temp_dir)[0]
+                day_path = os.path.join(temp_dir, day_folder)
+
+                # Walk through extracted gzip files
+                for root, _, files in os.walk(day_path):
+                    for file in files:
+                        if file.endswith('.gz'):
+                            print(file)
+                            gz_path = os.path.join(root, file)
+                            json_filename = file[:-3]  # Remove .gz
+                            output_path = os.path.join(directory, json_filename)
+
+                            # Decompress .gz to .json
+                            with gzip.open(gz_path, 'rb') as gz_file, open(output_path, 'wb') as out_file:
+                                shutil.copyfileobj(gz_file, out_file)
+                                log_times.append(dt.datetime.now())
+                                log_items.append(output_path)
+                                log_descriptions.append(log_desriptions_dict['copy'])
 
             # Optionally delete zip file
             if delete_zip:
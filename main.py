@@ -6,60 +6,438 @@ Steps:
 2. Parse extracted `.gz` files to `.json`.
 3. Upload final `.json` data and logs to an S3 bucket.
 
+By default the three steps are pipelined (`modules/pipeline.py`): each shard is
+parsed and uploaded as soon as it downloads, through bounded queues.
+
+Heavy dependencies (boto3, pyarrow, requests) are imported only by the stage that
+uses them; `python check_import_time.py` guards the cold-start import budget.
+
+Runs are incremental: hours already ingested are recorded in a state manifest
+(`logs/amp_extract_state.json`, synced to S3) and are not requested again. Within
+a run, finished shards, members and uploads are journaled
+(`logs/amp_run_checkpoint.jsonl`), so a rerun after a crash resumes mid-way.
+
+Several Amplitude projects (in either data region) can be extracted by one run
+(`modules/projects.py`): each has its own credentials, endpoint, S3 prefix, local
+directories, state and metrics, and pipelined projects run concurrently.
+
 Environment Variables:
 - AMP_API_KEY: Amplitude API key
 - AMP_SECRET_KEY: Amplitude secret key
-- AMP_DATA_REGION: Amplitude data region
+- AMP_DATA_REGION: Amplitude data region ('eu' or 'us', default 'eu')
+- AMP_PROJECTS: Optional comma-separated project names; each reads AMP_API_KEY_<NAME>,
+  AMP_SECRET_KEY_<NAME> and optionally AMP_DATA_REGION_<NAME>, AMP_S3_PREFIX_<NAME>
 - S3_USER_ACCESS_KEY: AWS access key
 - S3_USER_SECRET_KEY: AWS secret key
 - AWS_BUCKET_NAME: S3 bucket name
+- AMP_PROMETHEUS_TEXTFILE: Optional path for a Prometheus textfile of run metrics
 """
 
-from datetime import datetime
+import datetime as dt
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 import modules.load_data_to_s3 as ld
+import modules.state_store as sts
+from modules.backfill import BackfillProgress
+from modules.checkpoint import CHECKPOINT_PATH, RunCheckpoint
+from modules.compact_s3 import compact_days
+from modules.dedupe import INDEX_DIR, UuidDeduplicator, dedupe_data_dir
 from modules.extract_amplitude_files import extract_gzip_amplitude
-from modules.parse_gzip_to_json import parse_gzip_amplitude
+from modules.http_client import get_http_client
+from modules.fanout_events import FANOUT_TABLES
+from modules.metrics import RunMetrics
+from modules.parse_gzip_to_json import create_parse_executor, parse_gzip_amplitude
+from modules.pipeline import run_pipeline
+from modules.projects import load_projects, run_projects, scoped_key, scoped_path
+from modules.stream_zip_to_s3 import stream_zip_to_s3
+from modules.upload_manifest import MANIFEST_PATH
+from modules.validate_events import SCHEMA_PATH, VALIDATION_DIR, SchemaTracker, upload_validation_files
 
 # Load environment variables from .env file
 load_dotenv()
 
 # ----------------------------
-# Amplitude API Configuration
+# S3 Upload Configuration
 # ----------------------------
-api_keys = {
-    'AMP_API_KEY': os.getenv('AMP_API_KEY'),
-    'AMP_SECRET_KEY': os.getenv('AMP_SECRET_KEY'),
-    'AMP_DATA_REGION': os.getenv('AMP_DATA_REGION')
+s3filepath_base = 'python-import'  # Event prefix; named projects default to <base>/<name>
+s3_api_keys = {
+    'Access_key_ID': os.getenv('S3_USER_ACCESS_KEY'),
+    'Secret_access_key': os.getenv('S3_USER_SECRET_KEY'),
+    'AWS_BUCKET_NAME': os.getenv('AWS_BUCKET_NAME')
 }
 
+# ----------------------------
+# Amplitude API Configuration
+# ----------------------------
+# One project from AMP_API_KEY/AMP_SECRET_KEY/AMP_DATA_REGION, or every project in AMP_PROJECTS
+projects = load_projects(s3filepath_base)
+state_s3_key = 'state/amp_extract_state.json'
+upload_manifest_s3_key = 'state/amp_upload_manifest.json'
+dedupe_index_s3_prefix = 'state/dedupe'  # Seen-uuid indexes (dedupe_events), one object per event day
+event_schema_s3_key = 'state/amp_event_schema.json'  # Baseline schema for drift reports
+validation_s3_prefix = 'validation'  # Quarantined lines and drift reports (outside the event prefix)
+skip_unchanged_uploads = True  # Skip files already in S3 with identical content (parse + load path; does not apply when streaming_pipeline is on)
+upload_workers = 16          # Files uploaded concurrently
+multipart_chunksize = 16 * 1024 * 1024  # Multipart threshold and part size (bytes)
+multipart_concurrency = 4    # Parallel parts per multipart upload
+key_layout = 'flat'          # 'flat' (<base>/<file>) or 'hive' (<base>/dt=YYYY-MM-DD/hour=HH/<file>)
+# Days back whose hourly objects are merged into part files ('hive' only), e.g. [2]. A day is
+# briefly in S3 as both hourly objects and parts, so loads must read only one (schema_example.sql)
+compact_daydiffs = []
+compact_target_size = 128 * 1024 * 1024  # Target size of each compacted part (bytes)
+
 # Parameters for extraction
-daydiffs = [1]                # List of how many days back to pull from
-wait_time = 5                # Time between retries (seconds)
-total_wait_time = 10         # Max total wait time per API attempt (seconds)
-delete_zip = True            # Option to remove zip files after extraction
+daydiffs = [0, 1]             # List of how many days back to pull from (0 is today)
+wait_time = 2                # Initial retry delay (seconds), backed off exponentially with jitter
+total_wait_time = 300        # Max total retry wait per shard (seconds)
+delete_zip = True            # Remove zip files once parsed or streamed (kept zips are parsed again by later runs)
+shard_hours = 6              # Hours of data per Export API request
+max_workers = 4              # Shards downloaded concurrently
+max_requests_per_second = 2  # Cap on request starts, to respect Amplitude rate limits
+http_pool_size = 16          # Keep-alive Export API connections per host (at least max_workers x concurrent projects)
+http2 = False                # HTTP/2 for Export API requests (needs httpx[http2]; otherwise pooled HTTP/1.1)
+adaptive_rate_limit = True   # Back off concurrency/rate on 429s and latency spikes, grow back when healthy
+availability_lag_hours = 2   # Amplitude exports an hour roughly this long after it ends
+no_data_settle_hours = 24    # Empty (404) shards are recorded as done only this long after they end
+state_retain_days = 30       # Completed shards kept in the state file at least this long, so short runs don't prune a paused backfill
+streaming_pipeline = True    # Stream zip members straight to S3 instead of via data/ (not with validate_events or fan_out_events); members are never skipped as unchanged
+output_codec = 'gzip'        # 'none' (raw .json), 'gzip' (passthrough .json.gz) or 'zstd'
+zstd_level = 3               # Compression level when output_codec is 'zstd'
+gzip_level = 6               # Compression level when gzip output is re-encoded (validation, fan-out, dedupe, compaction)
+output_format = 'json'       # 'json' or 'parquet' (parquet goes through the parse + load path)
+parse_workers = None         # Processes used to decompress zip members (None: one per CPU)
+dedupe_events = False        # Drop events whose uuid was already emitted (parse + load path, JSON only)
+# Quarantine events missing uuid/event_time/event_type and report schema drift. Validation runs in
+# the parse step, so turning it on also turns off streaming uploads: every member is decompressed,
+# parsed line by line and written to data/ before upload, which costs CPU, local disk and run time
+validate_events = False
+fan_out_events = False       # Split events into events/, event_properties/ and user_properties/ tables (parse path, JSON only)
+pipelined = True             # Overlap extract, parse and upload per shard (not with dedupe_events)
+pipeline_queue_size = 2      # Zips allowed to wait between pipelined stages (bounds local disk use)
+max_local_bytes = None       # Cap on zips + parsed files on local disk, e.g. 2 * 1024 ** 3 (pipelined runs; None: no cap)
+max_concurrent_projects = 4  # Projects extracted at the same time (pipelined runs; others run one by one)
+prometheus_textfile = os.getenv('AMP_PROMETHEUS_TEXTFILE')  # Optional .prom output path (one file per named project)
 
-# Step 1: Extract .zip files from Amplitude Export API
-extract_gzip_amplitude(daydiffs, wait_time, total_wait_time, api_keys)
+# Streaming uploads skip the parse step, where dedupe, validation and fan-out happen
+streaming = (streaming_pipeline and output_format == 'json'
+             and not dedupe_events and not validate_events and not fan_out_events)
 
-# Step 2: Parse extracted .gz into .json files
-parse_gzip_amplitude(delete_zip=False)
 
-# ----------------------------
-# S3 Upload Configuration
-# ----------------------------
-s3filepath_base = 'python-import'
-api_keys = {
-    'Access_key_ID': os.getenv('S3_USER_ACCESS_KEY'),
-    'Secret_access_key': os.getenv('S3_USER_SECRET_KEY'),
-    'AWS_BUCKET_NAME': os.getenv('AWS_BUCKET_NAME')
-}
+def run_project(
+    project: Dict[str, Any],
+    parse_executor: Optional[ProcessPoolExecutor] = None,
+    run_daydiffs: Optional[List[int]] = None,
+    run_compact_daydiffs: Optional[List[int]] = None,
+    run_shard_hours: Optional[int] = None,
+    run_max_workers: Optional[int] = None,
+    report_progress: bool = False
+) -> Dict[str, Any]:
+    """
+    Extracts, parses and uploads one project, then records its state and metrics.
+
+    Args:
+        project (Dict[str, Any]): Project, see `modules.projects.load_projects`.
+        parse_executor (Optional[ProcessPoolExecutor]): Parse process pool shared by all projects (pipelined runs).
+        run_daydiffs (Optional[List[int]]): Days back to extract, in request order. Defaults to `daydiffs`.
+        run_compact_daydiffs (Optional[List[int]]): Days back to compact. Defaults to `compact_daydiffs`.
+        run_shard_hours (Optional[int]): Hours per request shard. Defaults to `shard_hours`.
+        run_max_workers (Optional[int]): Shards downloaded concurrently. Defaults to `max_workers`.
+        report_progress (bool): Print progress, throughput and ETA as shards download
+            (see `modules/backfill.py`).
+
+    Returns:
+        Dict[str, Any]: `shards` (count) and `failed_uploads` (local paths or `zip:member` names).
+    """
+    run_daydiffs = daydiffs if run_daydiffs is None else run_daydiffs
+    run_compact_daydiffs = compact_daydiffs if run_compact_daydiffs is None else run_compact_daydiffs
+    run_shard_hours = run_shard_hours or shard_hours
+    run_max_workers = run_max_workers or max_workers
+    progress = BackfillProgress(label=project['name']) if report_progress else None
+    # Connections are shared by every shard, retry and project
+    http_client = get_http_client(http_pool_size, http2)
+    api_keys = project['api_keys']
+    project_base = project['s3filepath_base']
+    # Per-run metrics: JSON summary under logs/, plus an optional Prometheus textfile
+    run_id = dt.datetime.now().strftime(r'%Y%m%dT%H%M%S')
+    metrics = RunMetrics(
+        run_id=run_id if project['name'] is None else f"{run_id}_{project['name']}",
+        labels=None if project['name'] is None else {'project': project['name']}
+    )
+    state_path = scoped_path(project, sts.STATE_PATH)
+    project_state_s3_key = scoped_key(project, state_s3_key)
+
+    # Step 0: Load the incremental state so already-ingested hours are skipped
+    with metrics.timer('stage.state_load'):
+        sts.download_state_from_s3(project_state_s3_key, s3_api_keys, state_path)
+        completed_hours = sts.get_completed_hours(sts.load_state(state_path))
+
+    # Journal of finished work, so a rerun after a crash resumes where this run stopped
+    checkpoint = RunCheckpoint(scoped_path(project, CHECKPOINT_PATH), fingerprint={
+        's3filepath_base': project_base,
+        'output_codec': output_codec,
+        'zstd_level': zstd_level,
+        'gzip_level': gzip_level,
+        'output_format': output_format,
+        'key_layout': key_layout,
+        'dedupe_events': dedupe_events,
+        'validate_events': validate_events,
+        'fan_out_events': fan_out_events,
+    })
+    schema_tracker = SchemaTracker() if validate_events else None
+    manifest_path = scoped_path(project, MANIFEST_PATH)
+    manifest_s3_key = scoped_key(project, upload_manifest_s3_key)
+    # Entries older than the furthest day requested (plus a day for UTC vs local dates) are never checked again
+    manifest_retain_days = max(run_daydiffs) + 1 if run_daydiffs else None
+
+    transfer_config = ld.build_transfer_config(
+        multipart_threshold=multipart_chunksize,
+        multipart_chunksize=multipart_chunksize,
+        max_concurrency=multipart_concurrency
+    )
+
+    if pipelined and not dedupe_events:
+        # Steps 1-3 overlapped: each shard is parsed and uploaded as soon as it downloads
+        with metrics.timer('stage.pipeline'):
+            shard_results, failed_uploads = run_pipeline(
+                run_daydiffs, wait_time, total_wait_time, api_keys,
+                project_base, s3_api_keys,
+                shard_hours=run_shard_hours,
+                max_workers=run_max_workers,
+                max_requests_per_second=max_requests_per_second,
+                adaptive_rate_limit=adaptive_rate_limit,
+                completed_hours=completed_hours,
+                availability_lag_hours=availability_lag_hours,
+                streaming=streaming,
+                output_codec=output_codec,
+                zstd_level=zstd_level,
+                gzip_level=gzip_level,
+                output_format=output_format,
+                parse_workers=parse_workers,
+                upload_workers=upload_workers,
+                transfer_config=transfer_config,
+                key_layout=key_layout,
+                skip_unchanged=skip_unchanged_uploads,
+                manifest_s3_key=manifest_s3_key,
+                delete_zip=delete_zip,
+                queue_size=pipeline_queue_size,
+                metrics=metrics,
+                checkpoint=checkpoint,
+                schema_tracker=schema_tracker,
+                fan_out=fan_out_events,
+                max_local_bytes=max_local_bytes,
+                zip_dir=project['zip_dir'],
+                data_dir=project['data_dir'],
+                manifest_path=manifest_path,
+                manifest_retain_days=manifest_retain_days,
+                executor=parse_executor,
+                on_plan=progress.plan if progress is not None else None,
+                on_result=progress.shard_done if progress is not None else None,
+                http_client=http_client
+            )
+    else:
+        # Step 1: Extract .zip files from Amplitude Export API
+        with metrics.timer('stage.extract'):
+            shard_results = extract_gzip_amplitude(
+                run_daydiffs, wait_time, total_wait_time, api_keys,
+                shard_hours=run_shard_hours,
+                max_workers=run_max_workers,
+                max_requests_per_second=max_requests_per_second,
+                adaptive_rate_limit=adaptive_rate_limit,
+                completed_hours=completed_hours,
+                availability_lag_hours=availability_lag_hours,
+                metrics=metrics,
+                checkpoint=checkpoint,
+                zip_dir=project['zip_dir'],
+                on_result=progress.shard_done if progress is not None else None,
+                on_plan=progress.plan if progress is not None else None,
+                http_client=http_client
+            )
+
+        # Skip parse and upload entirely when nothing new was downloaded
+        zip_dir = project['zip_dir']
+        has_new_data = os.path.isdir(zip_dir) and any(f.endswith('.zip') for f in os.listdir(zip_dir))
+
+        if not has_new_data:
+            print('No new data to parse or upload')
+            failed_uploads = []
+        elif streaming:
+            # Steps 2-3: Decompress each zip member on the fly and upload it directly
+            with metrics.timer('stage.stream_upload'):
+                failed_uploads = stream_zip_to_s3(
+                    project_base, s3_api_keys,
+                    output_codec=output_codec,
+                    zstd_level=zstd_level,
+                    delete_zip=delete_zip,
+                    metrics=metrics,
+                    key_layout=key_layout,
+                    checkpoint=checkpoint,
+                    zip_dir=zip_dir,
+                    max_workers=upload_workers
+                )
+        else:
+            # Step 2: Parse extracted .gz into .json files
+            with metrics.timer('stage.parse'):
+                # Parsed zips go, so a later run does not parse them again
+                parse_gzip_amplitude(
+                    delete_zip=delete_zip,
+                    output_codec=output_codec,
+                    zstd_level=zstd_level,
+                    gzip_level=gzip_level,
+                    output_format=output_format,
+                    metrics=metrics,
+                    parse_workers=parse_workers,
+                    checkpoint=checkpoint,
+                    schema_tracker=schema_tracker,
+                    fan_out=fan_out_events,
+                    zip_dir=zip_dir,
+                    data_dir=project['data_dir']
+                )
+
+            # Step 2b: Drop events already emitted by earlier (overlapping) runs
+            deduplicator = None
+            if dedupe_events:
+                deduplicator = UuidDeduplicator(
+                    scoped_path(project, INDEX_DIR),
+                    api_keys=s3_api_keys,
+                    s3_prefix=scoped_key(project, dedupe_index_s3_prefix)
+                )
+            if deduplicator is not None:
+                with metrics.timer('stage.dedupe'):
+                    dedupe_data_dir(
+                        deduplicator, project['data_dir'], metrics=metrics,
+                        zstd_level=zstd_level, gzip_level=gzip_level
+                    )
+
+            # Step 3: Upload JSON data files to S3
+            with metrics.timer('stage.upload'):
+                failed_uploads = ld.load_amp_json(
+                    project_base, s3_api_keys, upload_workers, transfer_config,
+                    metrics=metrics,
+                    skip_unchanged=skip_unchanged_uploads,
+                    manifest_s3_key=manifest_s3_key,
+                    key_layout=key_layout,
+                    checkpoint=checkpoint,
+                    data_dir=project['data_dir'],
+                    manifest_path=manifest_path,
+                    manifest_retain_days=manifest_retain_days
+                )
+
+            # Only remember uuids as emitted once their files are in S3
+            if deduplicator is not None:
+                deduplicator.rollback(failed_uploads)
+                deduplicator.commit()
+                deduplicator.upload_to_s3()
+                deduplicator.close()
+
+    # Step 3b: Report schema drift (files are shipped to S3 once every project is done)
+    if schema_tracker is not None:
+        with metrics.timer('stage.validate_report'):
+            schema_tracker.write_report(
+                schema_path=scoped_path(project, SCHEMA_PATH),
+                report_dir=VALIDATION_DIR if project['name'] is None else os.path.join(VALIDATION_DIR, project['name']),
+                api_keys=s3_api_keys,
+                schema_s3_key=scoped_key(project, event_schema_s3_key),
+                metrics=metrics
+            )
+
+    # Step 4: Record ingested shards, only once every file has reached S3
+    if not failed_uploads:
+        with metrics.timer('stage.state_save'):
+            # Hours older than the furthest day requested (or the retention floor), plus the settle window,
+            # are never asked for again
+            retain_days = max(max(run_daydiffs) + 1, state_retain_days) if run_daydiffs else None
+            retain_hours = retain_days * 24 + no_data_settle_hours if retain_days else None
+            sts.mark_shards_completed(
+                sts.completed_shards(shard_results, no_data_settle_hours), state_path, retain_hours
+            )
+            sts.upload_state_to_s3(project_state_s3_key, s3_api_keys, state_path)
+
+    # Step 4b: Merge small hourly objects of complete days into target-size files
+    if key_layout == 'hive' and run_compact_daydiffs:
+        with metrics.timer('stage.compact'):
+            today = dt.date.today()
+            # Fan-out tables each have their own prefix
+            compact_bases = [f'{project_base}/{table}' for table in FANOUT_TABLES] if fan_out_events else [project_base]
+            for compact_base in compact_bases:
+                compact_days(
+                    compact_base, s3_api_keys,
+                    [str(today - dt.timedelta(days=daydiff)) for daydiff in run_compact_daydiffs],
+                    target_size=compact_target_size,
+                    metrics=metrics,
+                    checkpoint=checkpoint,
+                    temp_dir=project['compact_dir'],
+                    zstd_level=zstd_level,
+                    gzip_level=gzip_level
+                )
+
+    # The run is fully recorded in the state store; keep the journal only if something failed
+    if failed_uploads:
+        checkpoint.close()
+    else:
+        checkpoint.complete()
+
+    # Step 5: Write the run summary
+    metrics.write_json()
+    if prometheus_textfile:
+        textfile = prometheus_textfile
+        if project['name'] is not None:
+            # The textfile collector reads every .prom file in its directory
+            stem, extension = os.path.splitext(prometheus_textfile)
+            textfile = f"{stem}_{project['name']}{extension}"
+        metrics.write_prometheus_textfile(textfile)
+    return {'shards': len(shard_results), 'failed_uploads': failed_uploads}
+
+
+def run_all(**run_project_kwargs: Any) -> Dict[Optional[str], Dict[str, Any]]:
+    """
+    Runs every project (concurrently when pipelined), then ships validation files and logs.
+
+    Args:
+        **run_project_kwargs (Any): Passed to `run_project` for every project.
+
+    Returns:
+        Dict[Optional[str], Dict[str, Any]]: Outcome per project, see `modules.projects.run_projects`.
+
+    Raises:
+        Exception: The first project error, once every project has finished and the logs are uploaded.
+    """
+    concurrent = pipelined and not dedupe_events and len(projects) > 1
+
+    # Concurrent projects share one parse pool, started before any project thread exists
+    parse_executor = create_parse_executor(parse_workers) if concurrent and not streaming else None
+    try:
+        outcomes = run_projects(
+            projects,
+            partial(run_project, parse_executor=parse_executor, **run_project_kwargs),
+            max_concurrent_projects if concurrent else 1
+        )
+    finally:
+        if parse_executor is not None:
+            parse_executor.shutdown(cancel_futures=True)
+
+    for name, outcome in outcomes.items():
+        label = name or 'default'
+        if outcome['status'] == 'success':
+            result = outcome['result']
+            print(f"Project {label}: {result['shards']} shards, {len(result['failed_uploads'])} failed uploads")
+        else:
+            print(f"Project {label}: failed ({outcome['error']!r})")
+
+    # Step 5b: Ship quarantined lines and drift reports, then upload logs (CSV) and run summaries (JSON) to S3
+    if validate_events:
+        upload_validation_files(s3_api_keys, validation_s3_prefix)
+    remove_local = False
+    ld.load_logs_csv(s3filepath_base, s3_api_keys, remove_local)
+
+    errors = [outcome['error'] for outcome in outcomes.values() if outcome['status'] == 'error']
+    if errors:
+        raise errors[0]
+    return outcomes
 
-# Step 3: Upload JSON data files to S3
-ld.load_amp_json(s3filepath_base, api_keys)
 
-# Step 4: Upload logs (CSV format) to S3
-filepath_base = 'logs'
-remove_local = False
-ld.load_logs_csv(s3filepath_base, api_keys, remove_local)
+# Guarded so that parse worker processes started with 'spawn' (Windows) do not re-run the pipeline
+if __name__ == '__main__':
+    run_all()
@@ -0,0 +1,157 @@
+"""
+Backfill planning and progress for large date ranges.
+
+A backfill is an ordinary run over an absolute date range: the range becomes the
+`daydiffs` of the run, hours already in the state store are left out when the
+shards are planned, and what remains is downloaded in the chosen order by the
+usual bounded download pool (and, when pipelined, parsed and uploaded as it lands).
+
+- 'newest' first makes recent data usable soonest.
+- 'oldest' first fills the range from its start, which suits downstream loads
+  that assume time order.
+
+`BackfillProgress` follows the shards as they download and prints throughput and
+an estimated completion time, so a long backfill can be left to run.
+"""
+
+import datetime as dt
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+BACKFILL_ORDERS = ('newest', 'oldest')
+
+
+def backfill_daydiffs(
+    start_date: dt.date,
+    end_date: dt.date,
+    order: str = 'newest',
+    today: Optional[dt.date] = None
+) -> List[int]:
+    """
+    Converts an inclusive date range into `daydiffs`, in download order.
+
+    Args:
+        start_date (dt.date): First day to backfill.
+        end_date (dt.date): Last day to backfill (inclusive).
+        order (str): 'newest' (most recent day first) or 'oldest'.
+        today (Optional[dt.date]): Day counted as daydiff 0. Defaults to today.
+
+    Returns:
+        List[int]: How many days back each day is, in the order to request them.
+
+    Raises:
+        ValueError: If the range is empty, ends in the future or the order is unknown.
+    """
+    if order not in BACKFILL_ORDERS:
+        raise ValueError(f"Unknown backfill order '{order}', expected one of {list(BACKFILL_ORDERS)}")
+    today = today or dt.date.today()
+    if start_date > end_date:
+        raise ValueError(f'Backfill start {start_date} is after its end {end_date}')
+    if end_date > today:
+        raise ValueError(f'Backfill end {end_date} is in the future')
+    daydiffs = list(range((today - end_date).days, (today - start_date).days + 1))
+    return daydiffs if order == 'newest' else daydiffs[::-1]
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h{minutes:02d}m' if hours else f'{minutes}m{seconds:02d}s'
+
+
+class BackfillProgress:
+    """
+    Thread-safe progress of a backfill, reported every `report_every` seconds.
+
+    Pass `plan` as `on_plan` and `shard_done` as `on_result` to the extract or
+    pipeline functions.
+    """
+
+    def __init__(self, label: Optional[str] = None, report_every: float = 30.0) -> None:
+        """
+        Args:
+            label (Optional[str]): Prefix of each report line, e.g. the project name.
+            report_every (float): Seconds between reports; the last shard is always reported.
+        """
+        self.label = label
+        self.report_every = report_every
+        self.total_shards = 0
+        self.total_hours = 0
+        self.shards_done = 0
+        self.hours_done = 0
+        self.shards_failed = 0
+        self.bytes_downloaded = 0
+        self._started = time.perf_counter()
+        self._last_report = self._started
+        self._lock = threading.Lock()
+
+    def plan(self, shards: List[Tuple[dt.datetime, dt.datetime]]) -> None:
+        """
+        Records the planned shards (already-ingested hours are not part of them).
+
+        Args:
+            shards (List[Tuple[dt.datetime, dt.datetime]]): (start hour, inclusive end hour) per shard.
+        """
+        with self._lock:
+            self.total_shards = len(shards)
+            self.total_hours = sum(int((end - start).total_seconds() // 3600) + 1 for start, end in shards)
+            self._started = self._last_report = time.perf_counter()
+        print(f'{self._prefix()}{self.total_shards} shards ({self.total_hours} hours) to backfill')
+
+    def shard_done(self, result: Dict[str, Any]) -> None:
+        """
+        Counts one downloaded (or failed, or empty) shard, reporting if one is due.
+
+        Args:
+            result (Dict[str, Any]): Shard result, see `extract_shard`.
+        """
+        start = dt.datetime.strptime(result['start'], r'%Y%m%dT%H')
+        end = dt.datetime.strptime(result['end'], r'%Y%m%dT%H')
+        nbytes = 0
+        if result['status'] == 'success' and os.path.exists(result['filepath']):
+            nbytes = os.path.getsize(result['filepath'])
+
+        with self._lock:
+            self.shards_done += 1
+            self.hours_done += int((end - start).total_seconds() // 3600) + 1
+            self.shards_failed += result['status'] == 'failed'
+            self.bytes_downloaded += nbytes
+            now = time.perf_counter()
+            due = now - self._last_report >= self.report_every or self.shards_done == self.total_shards
+            if due:
+                self._last_report = now
+                line = self.report_line(now)
+        if due:
+            print(line)
+
+    def report_line(self, now: Optional[float] = None) -> str:
+        """
+        Summarises progress, throughput and estimated completion.
+
+        Args:
+            now (Optional[float]): `time.perf_counter()` value to report at. Defaults to now.
+
+        Returns:
+            str: e.g. `web: backfill 120/360 shards (33.3%), 2880/8640 hours, 1.4 GB,
+                4.2 shards/min, 24.5 MB/s, ETA 57m10s (14:32) after 28m40s`.
+        """
+        elapsed = max((now or time.perf_counter()) - self._started, 1e-9)
+        percent = 100.0 * self.hours_done / self.total_hours if self.total_hours else 100.0
+        hours_per_second = self.hours_done / elapsed
+        remaining = (self.total_hours - self.hours_done) / hours_per_second if hours_per_second else None
+        eta = 'ETA unknown'
+        if remaining is not None:
+            finish = dt.datetime.now() + dt.timedelta(seconds=remaining)
+            eta = f'ETA {_format_duration(remaining)} ({finish:%H:%M})' if remaining else 'done'
+        failed = f', {self.shards_failed} failed' if self.shards_failed else ''
+        return (
+            f'{self._prefix()}backfill {self.shards_done}/{self.total_shards} shards ({percent:.1f}%){failed}, '
+            f'{self.hours_done}/{self.total_hours} hours, {self.bytes_downloaded / 1e9:.2f} GB, '
+            f'{60 * self.shards_done / elapsed:.1f} shards/min, {self.bytes_downloaded / 1e6 / elapsed:.1f} MB/s, '
+            f'{eta} after {_format_duration(elapsed)}'
+        )
+
+    def _prefix(self) -> str:
+        return f'{self.label}: ' if self.label else ''
@@ -0,0 +1,192 @@
+"""
+Crash-safe checkpoint journal for a pipeline run.
+
+Each finished unit of work is appended to `logs/amp_run_checkpoint.jsonl` as one
+JSON line, flushed and fsynced before the work it covers is cleaned up:
+
+- ('extract', 'START-END'): a shard was downloaded (or had no data)
+- ('parse', 'zip:member'): a zip member was written to `data/`, with its outputs
+- ('upload', key): a file (or streamed member) is in S3
+- ('compact', part key): a compacted part and its source keys, written just
+  before the part is uploaded (S3 makes the part appear atomically)
+
+If a run dies part-way (OOM, eviction, an S3 error), the journal survives and the
+next run resumes from it: journaled shards are not downloaded again, members whose
+outputs still exist locally or are already uploaded are not parsed again, uploaded
+files are not sent again, and a compacted part whose sources were not yet deleted
+has them deleted rather than merged a second time. Other units are journaled only
+after they complete, so at worst the unit in flight at the crash is redone.
+
+The first line records a fingerprint of the output settings; a journal written
+with different settings is discarded. `complete()` removes the journal once the
+run's hours are recorded in the state store.
+
+The journal lives on local disk next to the zips and files it describes. If the
+disk is lost, so is that work, and the S3 state and upload manifest cover resume.
+"""
+
+import datetime as dt
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+CHECKPOINT_PATH = os.path.join('logs', 'amp_run_checkpoint.jsonl')
+
+STAGES = ('extract', 'parse', 'upload', 'compact')
+
+
+class RunCheckpoint:
+    """
+    Append-only journal of completed units of work, shared by every stage (and
+    thread) of a run.
+    """
+
+    def __init__(self, checkpoint_path: str = CHECKPOINT_PATH, fingerprint: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Opens the journal, resuming an unfinished run recorded with the same fingerprint.
+
+        Args:
+            checkpoint_path (str): Local path of the JSONL journal.
+            fingerprint (Optional[Dict[str, Any]]): Settings that change what a unit
+                produces (e.g. output codec, key layout). A journal with a different
+                fingerprint is discarded.
+        """
+        self.checkpoint_path = checkpoint_path
+        self.fingerprint = fingerprint or {}
+        self._lock = threading.Lock()
+        self._units: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._uploaded_paths: Set[str] = set()
+
+        header, records = self._read()
+        if header is not None and header.get('fingerprint') == self.fingerprint:
+            for record in records:
+                self._add(record)
+            counts = {stage: sum(s == stage for s, _ in self._units) for stage in STAGES}
+            print(f"Resuming run started at {header['started_at']}: "
+                  + ', '.join(f'{count} {stage}' for stage, count in counts.items()) + ' units done')
+            self._file = open(checkpoint_path, 'a')
+        else:
+            if header is not None:
+                print('Discarding checkpoint journal written with different settings')
+            os.makedirs(os.path.dirname(checkpoint_path) or '.', exist_ok=True)
+            self._file = open(checkpoint_path, 'w')
+            self._append({'fingerprint': self.fingerprint, 'started_at': dt.datetime.now().isoformat()})
+
+    def _read(self) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        if not os.path.exists(self.checkpoint_path):
+            return None, []
+        lines = []
+        with open(self.checkpoint_path, 'r') as file:
+            for line in file:
+                try:
+                    lines.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Torn write at the moment of the crash; that unit is redone
+                    break
+        if not lines:
+            return None, []
+        return lines[0], lines[1:]
+
+    def _add(self, record: Dict[str, Any]) -> None:
+        self._units[(record['stage'], record['unit'])] = record
+        if record['stage'] == 'upload' and record.get('filepath'):
+            self._uploaded_paths.add(record['filepath'])
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def get(self, stage: str, unit: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the journal record of a completed unit.
+
+        Args:
+            stage (str): One of `STAGES`.
+            unit (str): Unit identifier within the stage.
+
+        Returns:
+            Optional[Dict[str, Any]]: The record, or None if the unit has not completed.
+        """
+        with self._lock:
+            return self._units.get((stage, unit))
+
+    def record(self, stage: str, unit: str, **data: Any) -> None:
+        """
+        Durably records a completed unit. Call before cleaning up anything the unit
+        consumed (e.g. deleting the uploaded local file).
+
+        Args:
+            stage (str): One of `STAGES`.
+            unit (str): Unit identifier within the stage.
+            **data (Any): JSON-serialisable details needed to resume (e.g. `outputs`).
+        """
+        record = {'stage': stage, 'unit': unit, **data}
+        with self._lock:
+            self._append(record)
+            self._add(record)
+
+    def records(self, stage: str) -> List[Dict[str, Any]]:
+        """
+        Returns every completed unit of a stage, in the order they were recorded.
+
+        Args:
+            stage (str): One of `STAGES`.
+
+        Returns:
+            List[Dict[str, Any]]: Journal records.
+        """
+        with self._lock:
+            return [record for (s, _), record in self._units.items() if s == stage]
+
+    def parse_done(self, filepathzip: str, member: str) -> bool:
+        """
+        Returns whether a zip member need not be parsed again: it was parsed, and
+        each of its outputs is either still on disk or already uploaded.
+
+        Args:
+            filepathzip (str): Path of the zip file.
+            member (str): Name of the `.gz` member.
+
+        Returns:
+            bool: True if the member can be skipped.
+        """
+        record = self.get('parse', f'{filepathzip}:{member}')
+        if record is None:
+            return False
+        with self._lock:
+            return all(os.path.exists(path) or path in self._uploaded_paths for path in record['outputs'])
+
+    def pending_uploads(self, uploads: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        Drops uploads already journaled, removing any local copy left behind by a
+        crash between the upload and the local delete.
+
+        Args:
+            uploads (List[Tuple[str, str]]): (local path, S3 key) pairs.
+
+        Returns:
+            List[Tuple[str, str]]: Uploads still to do, in input order.
+        """
+        pending = []
+        for filepath, key in uploads:
+            if self.get('upload', key) is None:
+                pending.append((filepath, key))
+            elif os.path.exists(filepath):
+                os.remove(filepath)
+        if len(pending) < len(uploads):
+            print(f'Resuming: {len(uploads) - len(pending)}/{len(uploads)} files already uploaded')
+        return pending
+
+    def close(self) -> None:
+        """Closes the journal file, leaving it in place for the next run."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def complete(self) -> None:
+        """Removes the journal once the run is fully recorded in the state store."""
+        self.close()
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
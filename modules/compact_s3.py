@@ -0,0 +1,241 @@
+"""
+Compaction of small hourly event objects in S3.
+
+With the 'hive' key layout, each hour of events lands in
+`<base>/dt=YYYY-MM-DD/hour=HH/` as one or more small objects. This job merges a
+day's hourly JSON objects into a few target-size files,
+`<base>/dt=YYYY-MM-DD/part-NNNNN.json[.gz|.zst]`, and then deletes the hourly
+sources. Warehouse loads then list and open a handful of objects per day instead
+of dozens.
+
+Merging decodes each source and re-encodes the result in the same codec, adding
+a newline between sources that lack one, so the output is valid NDJSON. Part
+numbers continue from existing parts, so late data for a compacted day is
+compacted into a new part.
+
+Only compact days that are complete (past the Export API availability lag). Loads
+should read either the hourly objects or the compacted parts of a day, never both.
+Parquet partitions are left as they are.
+"""
+
+import os
+import re
+import shutil
+from contextlib import closing, nullcontext
+from typing import Any, Dict, List, Optional
+from . import output_codecs as codecs
+from .checkpoint import RunCheckpoint
+from .load_data_to_s3 import build_transfer_config, get_s3_client
+from .metrics import RunMetrics
+from .upload_manifest import list_objects
+
+DEFAULT_TARGET_SIZE = 128 * 1024 * 1024
+# Scratch directory for parts being merged; cleared on start, so a killed run leaves nothing behind for long
+COMPACT_DIR = 'compact_tmp'
+
+_PART_NAME = re.compile(r'/part-(\d{5})\.json')
+
+
+def plan_batches(objects: List[Dict[str, Any]], target_size: int) -> List[List[Dict[str, Any]]]:
+    """
+    Groups objects, in order, into batches of roughly `target_size` bytes.
+
+    Args:
+        objects (List[Dict[str, Any]]): Objects with a `size` key, in merge order.
+        target_size (int): Target (stored) size per batch in bytes.
+
+    Returns:
+        List[List[Dict[str, Any]]]: Non-empty batches; a batch exceeds the target only
+            when a single object does.
+    """
+    batches: List[List[Dict[str, Any]]] = []
+    batch_size = 0
+    for obj in objects:
+        if not batches or (batch_size + obj['size'] > target_size and batch_size > 0):
+            batches.append([])
+            batch_size = 0
+        batches[-1].append(obj)
+        batch_size += obj['size']
+    return batches
+
+
+def _delete_objects(s3_client: Any, bucket: str, keys: List[str]) -> None:
+    # DeleteObjects takes at most 1000 keys per request
+    for i in range(0, len(keys), 1000):
+        s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]], 'Quiet': True}
+        )
+
+
+def compact_day(
+    s3filepath_base: str,
+    api_keys: Dict[str, str],
+    day: str,
+    target_size: int = DEFAULT_TARGET_SIZE,
+    delete_sources: bool = True,
+    metrics: Optional[RunMetrics] = None,
+    checkpoint: Optional[RunCheckpoint] = None,
+    temp_dir: str = COMPACT_DIR,
+    zstd_level: int = 3,
+    gzip_level: int = 6
+) -> List[str]:
+    """
+    Merges the hourly JSON objects of one day into target-size part files.
+
+    Args:
+        s3filepath_base (str): Base path in the S3 bucket (as used for uploads).
+        api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
+            - 'Access_key_ID'
+            - 'Secret_access_key'
+            - 'AWS_BUCKET_NAME'
+        day (str): Day to compact, 'YYYY-MM-DD'.
+        target_size (int): Target stored size of each part in bytes. Defaults to 128 MiB.
+        delete_sources (bool): Delete the hourly objects once their part is uploaded.
+            Defaults to True.
+        metrics (Optional[RunMetrics]): Receives the `compact.part` timer and
+            `compact.objects_in`/`compact.parts_written`/`compact.bytes_in`/`compact.bytes_out` counters.
+        checkpoint (Optional[RunCheckpoint]): Run journal. Each part is recorded with its
+            sources before it is uploaded; if a crash leaves an uploaded part with its
+            sources, they are deleted rather than compacted a second time.
+        temp_dir (str): Local directory parts are built in (emptied first). Defaults to
+            'compact_tmp'.
+        zstd_level (int): Compression level for `.json.zst` parts. Defaults to 3.
+        gzip_level (int): Compression level for `.json.gz` parts. Defaults to 6.
+
+    Returns:
+        List[str]: Keys of the part files written.
+    """
+    s3_client = get_s3_client(api_keys)
+    bucket = api_keys['AWS_BUCKET_NAME']
+    day_prefix = f'{s3filepath_base}/dt={day}/'
+
+    listed = list_objects(s3_client, bucket, [day_prefix])
+    if checkpoint is not None:
+        # Finish parts uploaded before a crash: their sources are already merged
+        for record in checkpoint.records('compact'):
+            leftover = [key for key in record['sources'] if key in listed]
+            if record['unit'] in listed and leftover:
+                print(f"Resuming: deleting {len(leftover)} objects already compacted into {record['unit']}")
+                _delete_objects(s3_client, bucket, leftover)
+                for key in leftover:
+                    del listed[key]
+    next_part = 1 + max((int(m.group(1)) for m in map(_PART_NAME.search, listed) if m), default=-1)
+
+    # Hourly JSON sources, grouped by codec since a part holds a single codec
+    sources_by_codec: Dict[str, List[Dict[str, Any]]] = {}
+    for key in sorted(listed):
+        if '/hour=' not in key or not key.endswith(('.json', '.json.gz', '.json.zst')):
+            continue
+        sources_by_codec.setdefault(codecs.codec_from_filename(key), []).append({'key': key, **listed[key]})
+    if not sources_by_codec:
+        print(f'Nothing to compact under {day_prefix}')
+        return []
+
+    transfer_config = build_transfer_config()
+    parts = []
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    try:
+        for codec, sources in sorted(sources_by_codec.items()):
+            for batch in plan_batches(sources, target_size):
+                part_key = f'{day_prefix}part-{next_part:05d}.json{codecs.OUTPUT_CODECS[codec]["suffix"]}'
+                part_path = os.path.join(temp_dir, os.path.basename(part_key))
+                next_part += 1
+
+                with metrics.timer('compact.part') if metrics is not None else nullcontext():
+                    # Decode each source and append it to one re-encoded NDJSON file
+                    with codecs.open_encoded_writer(part_path, codec, zstd_level, gzip_level) as part_file:
+                        for source in batch:
+                            body = s3_client.get_object(Bucket=bucket, Key=source['key'])['Body']
+                            with closing(body), closing(codecs.decode_stream(body, codec)) as source_file:
+                                last_byte = b'\n'
+                                while True:
+                                    chunk = source_file.read(1024 * 1024)
+                                    if not chunk:
+                                        break
+                                    part_file.write(chunk)
+                                    last_byte = chunk[-1:]
+                                if last_byte != b'\n':
+                                    part_file.write(b'\n')
+
+                    # Journaled ahead of the upload: if the part then exists, its sources are merged
+                    if checkpoint is not None and delete_sources:
+                        checkpoint.record('compact', part_key, sources=[source['key'] for source in batch])
+                    s3_client.upload_file(
+                        Filename=part_path,
+                        Bucket=bucket,
+                        Key=part_key,
+                        ExtraArgs=codecs.get_upload_extra_args(part_key),
+                        Config=transfer_config
+                    )
+                parts.append(part_key)
+                print(f'Compacted {len(batch)} objects into {part_key}')
+                if metrics is not None:
+                    metrics.increment('compact.objects_in', len(batch))
+                    metrics.increment('compact.parts_written')
+                    metrics.increment('compact.bytes_in', sum(source['size'] for source in batch))
+                    metrics.increment('compact.bytes_out', os.path.getsize(part_path))
+                os.remove(part_path)
+
+                # Sources go only once their part is safely in S3
+                if delete_sources:
+                    _delete_objects(s3_client, bucket, [source['key'] for source in batch])
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return parts
+
+
+def compact_days(
+    s3filepath_base: str,
+    api_keys: Dict[str, str],
+    days: List[str],
+    target_size: int = DEFAULT_TARGET_SIZE,
+    delete_sources: bool = True,
+    metrics: Optional[RunMetrics] = None,
+    checkpoint: Optional[RunCheckpoint] = None,
+    temp_dir: str = COMPACT_DIR,
+    zstd_level: int = 3,
+    gzip_level: int = 6
+) -> Dict[str, List[str]]:
+    """
+    Compacts several days in turn (see `compact_day`).
+
+    Args:
+        s3filepath_base (str): Base path in the S3 bucket.
+        api_keys (Dict[str, str]): Dictionary of AWS credentials.
+        days (List[str]): Days to compact, 'YYYY-MM-DD'.
+        target_size (int): Target stored size of each part in bytes.
+        delete_sources (bool): Delete hourly objects once compacted.
+        metrics (Optional[RunMetrics]): Receives compaction timers and counters.
+        checkpoint (Optional[RunCheckpoint]): Run journal of parts already written.
+        temp_dir (str): Local directory parts are built in.
+        zstd_level (int): Compression level for `.json.zst` parts.
+        gzip_level (int): Compression level for `.json.gz` parts.
+
+    Returns:
+        Dict[str, List[str]]: Part keys written, by day.
+    """
+    return {
+        day: compact_day(
+            s3filepath_base, api_keys, day, target_size, delete_sources, metrics, checkpoint, temp_dir,
+            zstd_level, gzip_level
+        )
+        for day in days
+    }
+
+
+if __name__ == '__main__':
+    import datetime as dt
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    api_keys = {
+        'Access_key_ID': os.getenv('S3_USER_ACCESS_KEY'),
+        'Secret_access_key': os.getenv('S3_USER_SECRET_KEY'),
+        'AWS_BUCKET_NAME': os.getenv('AWS_BUCKET_NAME')
+    }
+    # Compact the last complete days
+    today = dt.date.today()
+    days = [str(today - dt.timedelta(days=daydiff)) for daydiff in [2, 3]]
+    compact_days('python-import', api_keys, days)
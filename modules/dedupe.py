@@ -0,0 +1,288 @@
+"""
+Event-level deduplication across overlapping extraction windows.
+
+Hourly runs and manual backfills can export the same Amplitude event (`uuid`)
+more than once. This stage sits between parse and upload and drops events whose
+`uuid` has already been emitted. It keeps an exact, on-disk index of seen uuids
+per event day: one SQLite file per day under `logs/dedupe/`, holding 16-byte
+uuid keys in a WITHOUT ROWID table.
+
+Events are handled in fixed-size batches, so memory stays bounded however many
+events a day holds. Newly seen uuids are stored as pending, tagged with the file
+they were kept in, until `commit()` is called for the files that uploaded.
+`rollback()` forgets the uuids of files that failed, so those events are emitted
+again by the next run, and pending uuids left behind by a crashed run are dropped
+when an index is opened.
+
+With `api_keys` and `s3_prefix`, each day's index is fetched from S3 when first
+opened and uploaded back by `upload_to_s3()`, like the state store, so
+ephemeral containers share one index.
+"""
+
+import os
+import sqlite3
+import uuid as uuid_lib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from . import fast_json
+from . import output_codecs as codecs
+from .load_data_to_s3 import get_s3_client
+from .metrics import RunMetrics
+
+INDEX_DIR = os.path.join('logs', 'dedupe')
+
+
+def _uuid_key(value: str) -> bytes:
+    try:
+        return uuid_lib.UUID(value).bytes
+    except (ValueError, AttributeError, TypeError):
+        return str(value).encode()
+
+
+class UuidDeduplicator:
+    """
+    Filters NDJSON event lines, dropping events whose `uuid` was already seen on
+    the same event day (in this run or a previous one).
+    """
+
+    def __init__(
+        self,
+        index_dir: str = INDEX_DIR,
+        batch_size: int = 10000,
+        api_keys: Optional[Dict[str, str]] = None,
+        s3_prefix: Optional[str] = None
+    ) -> None:
+        """
+        Args:
+            index_dir (str): Directory holding one SQLite index per event day.
+            batch_size (int): Lines looked up and inserted per batch.
+            api_keys (Optional[Dict[str, str]]): AWS credentials (see `get_s3_client`) of
+                the bucket the indexes are synced with. None keeps them local only.
+            s3_prefix (Optional[str]): S3 prefix of the synced indexes, e.g. 'state/dedupe'.
+        """
+        self.index_dir = index_dir
+        self.batch_size = batch_size
+        self.api_keys = api_keys
+        self.s3_prefix = s3_prefix
+        self.kept = 0
+        self.dropped = 0
+        self._connections: Dict[str, sqlite3.Connection] = {}
+        os.makedirs(index_dir, exist_ok=True)
+
+    def _index_path(self, day: str) -> str:
+        return os.path.join(self.index_dir, f'uuids_{day}.sqlite')
+
+    def _download(self, day: str) -> None:
+        from botocore.exceptions import ClientError
+
+        s3_key = f'{self.s3_prefix}/uuids_{day}.sqlite'
+        try:
+            get_s3_client(self.api_keys).download_file(self.api_keys['AWS_BUCKET_NAME'], s3_key, self._index_path(day))
+            # A local WAL belongs to the replaced file
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(self._index_path(day) + suffix):
+                    os.remove(self._index_path(day) + suffix)
+        except ClientError as err:
+            print(f'No dedupe index downloaded from {s3_key}: {err}')
+
+    def _connection(self, day: str) -> sqlite3.Connection:
+        if day not in self._connections:
+            if self.api_keys is not None and self.s3_prefix:
+                self._download(day)
+            connection = sqlite3.connect(self._index_path(day))
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS seen (uuid BLOB PRIMARY KEY) WITHOUT ROWID')
+            # File a uuid was kept in, until that file is committed; indexes made before it lack the column
+            if 'pending' not in [row[1] for row in connection.execute('PRAGMA table_info(seen)')]:
+                connection.execute('ALTER TABLE seen ADD COLUMN pending TEXT')
+            connection.execute('CREATE INDEX IF NOT EXISTS seen_pending ON seen (pending) WHERE pending IS NOT NULL')
+            # Pending uuids of a run that crashed before committing were never uploaded
+            connection.execute('DELETE FROM seen WHERE pending IS NOT NULL')
+            connection.commit()
+            self._connections[day] = connection
+        return self._connections[day]
+
+    def _filter_batch(self, batch: List[Tuple[bytes, Optional[str], Optional[bytes]]], source: str) -> List[bytes]:
+        # Group the batch's uuids by event day
+        by_day: Dict[str, List[bytes]] = {}
+        for _, day, key in batch:
+            if key is not None:
+                by_day.setdefault(day, []).append(key)
+
+        # Look up which uuids each day's index already holds
+        already_seen = set()
+        for day, keys in by_day.items():
+            connection = self._connection(day)
+            unique_keys = list(set(keys))
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = connection.execute(f'SELECT uuid FROM seen WHERE uuid IN ({placeholders})', chunk)
+                already_seen.update((day, row[0]) for row in rows)
+
+        kept_lines = []
+        new_keys: Dict[str, List[Tuple[bytes, str]]] = {}
+        for line, day, key in batch:
+            if key is None:
+                # No uuid to dedupe on - pass through untouched
+                kept_lines.append(line)
+                continue
+            if (day, key) in already_seen:
+                self.dropped += 1
+                continue
+            already_seen.add((day, key))
+            new_keys.setdefault(day, []).append((key, source))
+            kept_lines.append(line)
+        self.kept += len(kept_lines)
+
+        for day, keys in new_keys.items():
+            self._connection(day).executemany('INSERT OR IGNORE INTO seen (uuid, pending) VALUES (?, ?)', keys)
+        return kept_lines
+
+    def filter_lines(self, lines: Iterable[bytes], source: str = '') -> Iterator[bytes]:
+        """
+        Yields the lines whose event has not been seen before, in input order.
+
+        Args:
+            lines (Iterable[bytes]): NDJSON lines (one event per line).
+            source (str): File the kept lines are written to, which `commit()` and
+                `rollback()` refer to.
+
+        Yields:
+            bytes: Lines of events not seen before. Blank lines are dropped, and
+                lines that do not parse or have no `uuid` are passed through.
+        """
+        batch = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                event = fast_json.loads(line)
+                event_uuid = event.get('uuid')
+                event_time = event.get('event_time')
+            except (ValueError, AttributeError):
+                event_uuid = None
+                event_time = None
+            day = event_time[:10] if isinstance(event_time, str) and len(event_time) >= 10 else 'unknown'
+            key = _uuid_key(event_uuid) if event_uuid else None
+            batch.append((line, day, key))
+
+            if len(batch) >= self.batch_size:
+                yield from self._filter_batch(batch, source)
+                batch = []
+        if batch:
+            yield from self._filter_batch(batch, source)
+
+    def dedupe_file(self, path: str, zstd_level: int = 3, gzip_level: int = 6) -> Tuple[int, int]:
+        """
+        Rewrites an NDJSON event file (`.json`, `.json.gz` or `.json.zst`) in place
+        without duplicate events, keeping its codec. Empty results delete the file.
+
+        Args:
+            path (str): File to deduplicate.
+            zstd_level (int): Compression level when rewriting a `.json.zst` file.
+            gzip_level (int): Compression level when rewriting a `.json.gz` file.
+
+        Returns:
+            Tuple[int, int]: (events kept, events dropped) for this file.
+        """
+        kept_before, dropped_before = self.kept, self.dropped
+        codec = codecs.codec_from_filename(path)
+        tmp_path = path + '.dedupe'
+        with codecs.open_decoded(path, codec) as in_file, codecs.open_encoded_writer(tmp_path, codec, zstd_level, gzip_level) as out_file:
+            for line in self.filter_lines(in_file, path):
+                out_file.write(line if line.endswith(b'\n') else line + b'\n')
+
+        # Pending uuids survive a crash, so the next open can drop them
+        for connection in self._connections.values():
+            connection.commit()
+        kept = self.kept - kept_before
+        if kept:
+            os.replace(tmp_path, path)
+        else:
+            os.remove(tmp_path)
+            os.remove(path)
+        return kept, self.dropped - dropped_before
+
+    def commit(self, sources: Optional[Iterable[str]] = None) -> None:
+        """
+        Records the uuids kept in the given files as emitted. Call once they have uploaded.
+
+        Args:
+            sources (Optional[Iterable[str]]): Files passed to `dedupe_file` (or sources
+                passed to `filter_lines`). None commits every pending uuid.
+        """
+        self._resolve('UPDATE seen SET pending = NULL', sources)
+
+    def rollback(self, sources: Optional[Iterable[str]] = None) -> None:
+        """
+        Forgets the uuids kept in the given files, so their events are emitted again next run.
+
+        Args:
+            sources (Optional[Iterable[str]]): Files whose upload failed. None forgets
+                every pending uuid.
+        """
+        self._resolve('DELETE FROM seen', sources)
+
+    def _resolve(self, statement: str, sources: Optional[Iterable[str]]) -> None:
+        for connection in self._connections.values():
+            if sources is None:
+                connection.execute(f'{statement} WHERE pending IS NOT NULL')
+            else:
+                connection.executemany(f'{statement} WHERE pending = ?', [(source,) for source in sources])
+            connection.commit()
+
+    def upload_to_s3(self) -> None:
+        """Uploads the index of every day opened by this run to `s3_prefix`, if set."""
+        if self.api_keys is None or not self.s3_prefix:
+            return
+        s3_client = get_s3_client(self.api_keys)
+        for day, connection in self._connections.items():
+            # Fold the WAL into the main file, which is all that is uploaded
+            connection.commit()
+            connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            s3_key = f'{self.s3_prefix}/uuids_{day}.sqlite'
+            s3_client.upload_file(self._index_path(day), self.api_keys['AWS_BUCKET_NAME'], s3_key)
+        print(f'Uploaded {len(self._connections)} dedupe indexes to {self.s3_prefix}')
+
+    def close(self) -> None:
+        """Closes every index. Pending uuids are dropped when the index is next opened."""
+        for connection in self._connections.values():
+            connection.close()
+        self._connections = {}
+
+
+def dedupe_data_dir(
+    deduplicator: UuidDeduplicator,
+    data_dir: str = 'data',
+    metrics: Optional[RunMetrics] = None,
+    zstd_level: int = 3,
+    gzip_level: int = 6
+) -> Tuple[int, int]:
+    """
+    Deduplicates every NDJSON event file under `data_dir` in place.
+
+    Args:
+        deduplicator (UuidDeduplicator): Deduplicator holding the seen-uuid indexes.
+        data_dir (str): Directory written by the parse stage.
+        metrics (Optional[RunMetrics]): Receives `dedupe.events_kept`/`dedupe.events_dropped`.
+        zstd_level (int): Compression level for rewritten `.json.zst` files, as used by the parse stage.
+        gzip_level (int): Compression level for rewritten `.json.gz` files.
+
+    Returns:
+        Tuple[int, int]: Total (events kept, events dropped).
+    """
+    total_kept = 0
+    total_dropped = 0
+    for root, _, filenames in os.walk(data_dir):
+        for filename in sorted(filenames):
+            if not filename.endswith(('.json', '.json.gz', '.json.zst')):
+                continue
+            kept, dropped = deduplicator.dedupe_file(os.path.join(root, filename), zstd_level, gzip_level)
+            total_kept += kept
+            total_dropped += dropped
+    if metrics is not None:
+        metrics.increment('dedupe.events_kept', total_kept)
+        metrics.increment('dedupe.events_dropped', total_dropped)
+    print(f'Deduplicated {data_dir}: kept {total_kept} events, dropped {total_dropped} duplicates')
+    return total_kept, total_dropped
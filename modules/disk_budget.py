@@ -0,0 +1,100 @@
+"""
+Local disk budget for pipelined runs on small runners.
+
+Ephemeral containers (e.g. a Kestra `WorkingDirectory` task) have little scratch
+space, while a multi-day backfill can download and decompress far more than that.
+`DiskBudget` counts the bytes a run holds on local disk, i.e. downloaded zips and
+parsed files waiting for upload, and the pipelined runner blocks on it:
+
+- Downloads wait before starting a request while the budget is used up. Zips are
+  released once their files are all uploaded.
+- The parse stage waits before starting a member while the budget is used up and
+  parsed files are waiting for upload. They are released as they upload.
+
+The parse stage waits only while uploads have something to drain, so it always
+makes progress, and so does every zip. A run can overshoot the cap by the zips and
+members already in flight when the cap is reached (at most one per download and
+parse worker), so set the cap below the free space by that margin.
+"""
+
+import threading
+import time
+from typing import Optional
+from .metrics import RunMetrics
+
+
+class DiskBudget:
+    """
+    Thread-safe count of local bytes held by a run, against a cap.
+    """
+
+    def __init__(self, max_bytes: int, metrics: Optional[RunMetrics] = None) -> None:
+        """
+        Args:
+            max_bytes (int): Local bytes the run may hold before downloads and parsing wait.
+            metrics (Optional[RunMetrics]): Receives the `disk.download_wait`/`disk.parse_wait`
+                timers and the `disk.peak_bytes` gauge.
+        """
+        self.max_bytes = max(1, max_bytes)
+        self.metrics = metrics
+        self.used = 0
+        self.pending_upload = 0
+        self.peak = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _wait(self, name: str, drainable: bool) -> None:
+        started = time.perf_counter()
+        with self._cond:
+            while not self._closed and self.used >= self.max_bytes and (self.pending_upload or not drainable):
+                self._cond.wait()
+        if self.metrics is not None:
+            self.metrics.observe(f'disk.{name}_wait', time.perf_counter() - started)
+
+    def wait_for_download(self) -> None:
+        """Blocks a download until the run holds less than the cap."""
+        self._wait('download', drainable=False)
+
+    def wait_for_parse(self) -> None:
+        """
+        Blocks parsing of a member until the run holds less than the cap, or until no
+        parsed file is left waiting for upload (nothing else would free space).
+        """
+        self._wait('parse', drainable=True)
+
+    def add(self, nbytes: int, pending_upload: bool = False) -> None:
+        """
+        Counts bytes written to local disk.
+
+        Args:
+            nbytes (int): Bytes written.
+            pending_upload (bool): The bytes are parsed files that the upload stage will
+                remove (rather than zips).
+        """
+        with self._cond:
+            self.used += nbytes
+            if pending_upload:
+                self.pending_upload += nbytes
+            self.peak = max(self.peak, self.used)
+        if self.metrics is not None:
+            self.metrics.set_gauge('disk.peak_bytes', self.peak)
+
+    def release(self, nbytes: int, pending_upload: bool = False) -> None:
+        """
+        Stops counting bytes that were removed (or handed off) from local disk.
+
+        Args:
+            nbytes (int): Bytes released, as passed to `add`.
+            pending_upload (bool): As passed to `add`.
+        """
+        with self._cond:
+            self.used -= nbytes
+            if pending_upload:
+                self.pending_upload -= nbytes
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """Wakes every waiter and stops blocking, e.g. when a stage has failed."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
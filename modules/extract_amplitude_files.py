@@ -3,112 +3,540 @@
 
 import datetime as dt
 import os
+import re
 import time  # for waiting and retrying
-import requests as rq
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 from . import logginghelper as lgs
-from typing import List, Dict
+from . import retry
+from .checkpoint import RunCheckpoint
+from .http_client import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, HttpClient, get_http_client
+from .metrics import RunMetrics
+from .rate_limiter import AdaptiveRateLimiter
+from typing import Any, Callable, List, Dict, Optional, Set, Tuple
 
+# Export API endpoint per data region (AMP_DATA_REGION)
+EXPORT_URLS = {
+    'us': r'https://amplitude.com/api/2/export',
+    'eu': r'https://analytics.eu.amplitude.com/api/2/export',
+}
+# Endpoint used when no region is set
+EXPORT_URL = EXPORT_URLS['eu']
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-')
 
-def extract_gzip_amplitude(
-    daydiffs: List[int],
-    wait_time: int,
-    total_wait_time: int,
-    api_keys: Dict[str, str]
-) -> None:
+
+def _content_range_start(response: Any) -> Optional[int]:
     """
-    Extracts zipped data from the Amplitude Export API for specified days
-    and saves the files locally. Logs actions and errors for traceability.
+    Returns the first byte offset of a partial (206) response.
 
     Args:
-        daydiffs (List[int]): List of integers representing how many days back to extract.
-        wait_time (int): Seconds to wait between retry attempts.
-        total_wait_time (int): Maximum total wait time in seconds before giving up.
-        api_keys (Dict[str, str]): A dictionary containing Amplitude API credentials.
+        response (Any): Response with a `Content-Range: bytes <first>-<last>/<total>` header.
+
+    Returns:
+        Optional[int]: The first byte, or None if the header is missing or malformed.
+    """
+    match = _CONTENT_RANGE.match(response.headers.get('Content-Range') or '')
+    return int(match.group(1)) if match else None
+
+
+def stream_export_to_file(
+    url: str,
+    params: Dict[str, str],
+    auth: Tuple[str, str],
+    filepathzip: str,
+    chunk_size: int = 1024 * 1024,
+    metrics: Optional[RunMetrics] = None,
+    timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+    on_response: Optional[Callable[[Any], None]] = None,
+    client: Optional[HttpClient] = None
+) -> int:
+    """
+    Streams an Export API response to disk in chunks so memory use stays flat
+    regardless of the export size.
+
+    The body is written to `<filepathzip>.part` and atomically renamed to
+    `filepathzip` once complete. If a `.part` file is left over from an
+    interrupted transfer, an HTTP Range request is used to resume from its size.
+    A partial response whose `Content-Range` does not start at that size discards
+    the `.part` file and downloads the export from the start.
+
+    Args:
+        url (str): Export API endpoint.
+        params (Dict[str, str]): Query parameters (`start`, `end`).
+        auth (Tuple[str, str]): Basic auth (API key, secret key).
+        filepathzip (str): Final path of the downloaded zip file.
+        chunk_size (int): Bytes read from the socket per chunk.
+        metrics (Optional[RunMetrics]): Receives `extract.bytes_downloaded`.
+        timeout (Tuple[float, float]): (connect, read) timeouts in seconds.
+        on_response (Optional[Callable[[Any], None]]): Called with the response once its
+            headers arrive, before the body is read or the status is checked.
+        client (Optional[HttpClient]): Pooled client the request is sent with. Defaults
+            to the shared client (see `http_client.get_http_client`).
+
+    Returns:
+        int: Total size in bytes of the completed file.
 
     Raises:
-        Exception: If max wait time is exceeded or API consistently fails.
+        requests.HTTPError: If the API returns an error status.
+        requests.Timeout: If connecting or a read stalls past `timeout`.
     """
-    url = r'https://analytics.eu.amplitude.com/api/2/export'
+    client = client or get_http_client()
+    part_path = filepathzip + '.part'
+    while True:
+        resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={resume_from}-'} if resume_from else {}
 
-    # Define base time and local directories
-    start_current_day = dt.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    directoryzip = 'datazip/'
-    directory = 'data/'
+        with client.get(url, params=params, auth=auth, headers=headers, stream=True, timeout=timeout) as response:
+            if on_response is not None:
+                on_response(response)
+            if response.status_code == 416:
+                # Stale partial file that no longer matches the export - start over next attempt
+                os.remove(part_path)
+            response.raise_for_status()
 
-    # Ensure required directories exist
-    os.makedirs("logs", exist_ok=True)
-    os.makedirs(directory, exist_ok=True)
-    os.makedirs(directoryzip, exist_ok=True)
+            # Server ignored the Range header and sent the full body, so overwrite
+            if resume_from and response.status_code != 206:
+                resume_from = 0
+            # Appending a body that starts anywhere else would corrupt the zip, so start over
+            if resume_from and _content_range_start(response) != resume_from:
+                print(f"Range response starts at {response.headers.get('Content-Range')!r}, "
+                      f'not byte {resume_from}; downloading {filepathzip} again')
+                os.remove(part_path)
+                continue
+
+            bytes_downloaded = 0
+            try:
+                with open(part_path, 'ab' if resume_from else 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            file.write(chunk)
+                            bytes_downloaded += len(chunk)
+            finally:
+                if metrics is not None:
+                    metrics.increment('extract.bytes_downloaded', bytes_downloaded)
+        break
+
+    os.replace(part_path, filepathzip)
+    return os.path.getsize(filepathzip)
+
+
+def export_url(region: Optional[str] = None) -> str:
+    """
+    Returns the Export API endpoint of an Amplitude data region.
+
+    Args:
+        region (Optional[str]): 'us' or 'eu' (case-insensitive). None or empty selects
+            `EXPORT_URL` (EU).
+
+    Returns:
+        str: Export API URL.
+
+    Raises:
+        ValueError: If the region is unknown.
+    """
+    if not region:
+        return EXPORT_URL
+    if region.strip().lower() not in EXPORT_URLS:
+        raise ValueError(f"Unknown Amplitude data region '{region}', expected one of {list(EXPORT_URLS)}")
+    return EXPORT_URLS[region.strip().lower()]
+
+
+def latest_available_hour(availability_lag_hours: Optional[int] = None) -> Optional[dt.datetime]:
+    """
+    Returns the last hour Amplitude has finished exporting.
+
+    Args:
+        availability_lag_hours (Optional[int]): Hours after its end that an hour becomes
+            available. None means no limit.
+
+    Returns:
+        Optional[dt.datetime]: Start of the last available hour, or None for no limit.
+    """
+    if availability_lag_hours is None:
+        return None
+    current_hour = dt.datetime.now().replace(minute=0, second=0, microsecond=0)
+    return current_hour - dt.timedelta(hours=availability_lag_hours + 1)
+
+
+def plan_shards(
+    daydiffs: List[int],
+    shard_hours: int = 24,
+    start_current_day: Optional[dt.datetime] = None,
+    completed_hours: Optional[Set[str]] = None,
+    latest_hour: Optional[dt.datetime] = None
+) -> List[Tuple[dt.datetime, dt.datetime]]:
+    """
+    Splits each requested day into contiguous shards of at most `shard_hours` hours,
+    leaving out hours that are already ingested or not yet available.
+
+    Args:
+        daydiffs (List[int]): How many days back from today to extract (0 is today).
+        shard_hours (int): Maximum hours per shard, between 1 and 24.
+        start_current_day (Optional[dt.datetime]): Midnight of the current day.
+            Defaults to today.
+        completed_hours (Optional[Set[str]]): Hours (`%Y%m%dT%H`) to skip because
+            they have already been ingested.
+        latest_hour (Optional[dt.datetime]): Last hour that may be requested; later
+            hours are skipped. Defaults to no limit.
+
+    Returns:
+        List[Tuple[dt.datetime, dt.datetime]]: (start hour, inclusive end hour) per shard.
+    """
+    if not 1 <= shard_hours <= 24:
+        raise ValueError(f'shard_hours must be between 1 and 24, got {shard_hours}')
+    if start_current_day is None:
+        start_current_day = dt.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    completed_hours = completed_hours or set()
+
+    shards = []
+    for daydiff in daydiffs:
+        start_daydiff_day = start_current_day - dt.timedelta(days=daydiff)
 
-    # Setup logging
-    log_path = os.path.join("logs", "amp_extract_logs.csv")
+        # Hours of this day still to fetch
+        pending = []
+        for hour in range(24):
+            hour_start = start_daydiff_day + dt.timedelta(hours=hour)
+            if latest_hour is not None and hour_start > latest_hour:
+                break
+            if dt.datetime.strftime(hour_start, r'%Y%m%dT%H') not in completed_hours:
+                pending.append(hour_start)
+
+        # Group contiguous pending hours into shards of at most shard_hours
+        shard_start = None
+        shard_end = None
+        for hour_start in pending:
+            if (
+                shard_start is not None
+                and hour_start == shard_end + dt.timedelta(hours=1)
+                and hour_start - shard_start < dt.timedelta(hours=shard_hours)
+            ):
+                shard_end = hour_start
+                continue
+            if shard_start is not None:
+                shards.append((shard_start, shard_end))
+            shard_start = shard_end = hour_start
+        if shard_start is not None:
+            shards.append((shard_start, shard_end))
+    return shards
+
+
+def extract_shard(
+    shard_start: dt.datetime,
+    shard_end: dt.datetime,
+    url: str,
+    auth: Tuple[str, str],
+    retry_policy: retry.RetryPolicy,
+    directoryzip: str = 'datazip/',
+    stream: bool = True,
+    chunk_size: int = 1024 * 1024,
+    limiter: Optional[AdaptiveRateLimiter] = None,
+    metrics: Optional[RunMetrics] = None,
+    timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+    client: Optional[HttpClient] = None
+) -> Dict[str, Any]:
+    """
+    Downloads a single (start, end) hour window from the Export API to a zip file,
+    retrying transient failures as scheduled by `retry_policy`.
+
+    Args:
+        shard_start (dt.datetime): First hour of the shard.
+        shard_end (dt.datetime): Last hour of the shard (inclusive).
+        url (str): Export API endpoint.
+        auth (Tuple[str, str]): Basic auth (API key, secret key).
+        retry_policy (retry.RetryPolicy): Backoff and per-status retry rules.
+        directoryzip (str): Directory the zip file is written to.
+        stream (bool): Stream the response to disk instead of buffering it.
+        chunk_size (int): Bytes per chunk when streaming.
+        limiter (Optional[AdaptiveRateLimiter]): Shared rate and concurrency limiter,
+            told how each request went.
+        metrics (Optional[RunMetrics]): Receives the `extract.shard` timer and request,
+            retry, byte and shard outcome counters.
+        timeout (Tuple[float, float]): (connect, read) timeouts in seconds.
+        client (Optional[HttpClient]): Pooled client requests are sent with, so retries
+            reuse its open connections. Defaults to the shared client.
+
+    Returns:
+        Dict[str, Any]: Shard result with keys `start`, `end`, `filepath`, `status`
+            ('success', 'no_data' or 'failed'), `attempts`, `error` and `logs`, where
+            `logs` is a (log_times, log_items, log_descriptions) tuple for this shard.
+    """
     log_times = []
     log_items = []
     log_descriptions = []
     log_desriptions_dict, log_items_dict = lgs.get_log_descs_and_items_dict()
 
-    # Loop through each day offset and extract corresponding zipped data
-    for daydiff in daydiffs:
-        start_daydiff_day = start_current_day - dt.timedelta(days=daydiff)
-        end_daydiff_day = start_daydiff_day.replace(hour=23)
+    start_time = dt.datetime.strftime(shard_start, r'%Y%m%dT%H')
+    end_time = dt.datetime.strftime(shard_end, r'%Y%m%dT%H')
+    params = {'start': start_time, 'end': end_time}
 
-        start_time = dt.datetime.strftime(start_daydiff_day, r'%Y%m%dT%H')
-        end_time = dt.datetime.strftime(end_daydiff_day, r'%Y%m%dT%H')
-        params = {'start': start_time, 'end': end_time}
+    # Both ends in the name, so shards of different sizes never share a zip or a .part file
+    filenamezip = 'amp' + start_time + '-' + end_time + '.zip'
+    filepathzip = directoryzip + filenamezip
+    waited_time = 0.0
+    attempts = 0
+    status = 'failed'
+    error = None
+    action = None
+    shard_started = time.perf_counter()
+    client = client or get_http_client()
 
-        filenamezip = 'amp' + start_time + '.zip'
-        filepathzip = directoryzip + filenamezip
-        waited_time = 0
+    while True:
+        try:
+            if limiter is not None:
+                request_started = limiter.acquire()
+            attempts += 1
+            if metrics is not None:
+                metrics.increment('extract.requests')
 
-        while waited_time < total_wait_time:
-            try:
-                # Call API with basic auth and get the content
-                response = rq.get(url, params=params, auth=(api_keys['AMP_API_KEY'], api_keys['AMP_SECRET_KEY']))
-                log_times.append(dt.datetime.now())
-                log_items.append(log_items_dict['api'])
-                log_descriptions.append(log_desriptions_dict['get'])
+            # Status and time to headers, reported to the limiter whatever the outcome
+            response_info = {}
 
-                response.raise_for_status()
+            def record_response(response: Any) -> None:
+                response_info['status'] = response.status_code
+                response_info['latency'] = response.elapsed.total_seconds()
 
-                # Write binary zip content to file
-                with open(filepathzip, 'wb') as file:
-                    file.write(response.content)
+            request_error = None
+            try:
+                if stream:
+                    # Stream the body to disk, resuming any partial download
+                    stream_export_to_file(
+                        url, params, auth, filepathzip, chunk_size, metrics, timeout, record_response, client
+                    )
                     log_times.append(dt.datetime.now())
-                    log_items.append(filepathzip)
-                    log_descriptions.append(log_desriptions_dict['create'])
+                    log_items.append(log_items_dict['api'])
+                    log_descriptions.append(log_desriptions_dict['get'])
+                else:
+                    # Call API with basic auth and get the content
+                    response = client.get(url, params=params, auth=auth, timeout=timeout)
+                    record_response(response)
+                    log_times.append(dt.datetime.now())
+                    log_items.append(log_items_dict['api'])
+                    log_descriptions.append(log_desriptions_dict['get'])
 
-                print('Written zipped data')
-                break
+                    response.raise_for_status()
+
+                    # Write binary zip content to file
+                    with open(filepathzip, 'wb') as file:
+                        file.write(response.content)
+                    if metrics is not None:
+                        metrics.increment('extract.bytes_downloaded', len(response.content))
+            except Exception as err:
+                request_error = err
+                raise
+            finally:
+                if limiter is not None:
+                    limiter.release(
+                        request_started, response_info.get('status'), response_info.get('latency'), request_error
+                    )
+
+            log_times.append(dt.datetime.now())
+            log_items.append(filepathzip)
+            log_descriptions.append(log_desriptions_dict['create'])
+
+            print(f'Written zipped data for {start_time}-{end_time}')
+            status = 'success'
+            error = None
+            break
 
-            except Exception as e:
-                # Log error and retry info
-                log_times.append(dt.datetime.now())
-                log_items.append(log_items_dict['error'])
-                log_descriptions.append(e)
+        except Exception as e:
+            # Log the error; the status (if any) comes from the exception, never a stale response
+            log_times.append(dt.datetime.now())
+            log_items.append(log_items_dict['error'])
+            log_descriptions.append(e)
+            error = str(e)
+            print(f'Error ({start_time}-{end_time}): {e}')
 
-                print(f'Error {response.status_code}, {response.text}\n{e}')
-                print(f'Trying again, waiting {wait_time}s, total time waited {waited_time}s.')
+            action = retry_policy.classify(e)
+            if action == retry.NO_DATA:
+                print(f'No data available for {start_time}-{end_time}')
+                status = 'no_data'
+                break
 
-                waited_time += wait_time
-                time.sleep(wait_time)
+            delay = retry_policy.next_delay(e, attempts, waited_time)
+            if delay is None:
+                break
 
-                log_times.append(dt.datetime.now())
-                log_items.append(log_items_dict['wait'])
-                log_descriptions.append(f'{log_desriptions_dict["wait"]} {wait_time}s ({waited_time}s out of {wait_time}s)')
+            print(f'Trying again, waiting {delay:.1f}s, total time waited {waited_time:.1f}s.')
+            if metrics is not None:
+                metrics.increment('extract.retries')
+                metrics.increment('extract.retry_wait_seconds', delay)
+            time.sleep(delay)
+            waited_time += delay
 
-        # Timeout warning
-        if waited_time >= total_wait_time:
-            print(f'Timeout. Total time waited {waited_time}s.')
             log_times.append(dt.datetime.now())
-            log_items.append(log_items_dict['timeout'])
-            log_descriptions.append(f'{log_desriptions_dict["timeout"]} ({waited_time}s out of {wait_time}s)')
+            log_items.append(log_items_dict['wait'])
+            log_descriptions.append(
+                f'{log_desriptions_dict["wait"]} {delay:.1f}s ({waited_time:.1f}s out of {retry_policy.max_elapsed}s)'
+            )
 
-    # Final logging of all actions
-    lgs.create_and_combine_logs(log_times, log_items, log_descriptions)
+    # Give-up warning
+    if status == 'failed':
+        if action == retry.FAIL:
+            print(f'Not retrying ({start_time}-{end_time}): error is not retryable.')
+        else:
+            print(f'Timeout ({start_time}-{end_time}). Total time waited {waited_time:.1f}s.')
+        log_times.append(dt.datetime.now())
+        log_items.append(log_items_dict['timeout'])
+        log_descriptions.append(
+            f'{log_desriptions_dict["timeout"]} ({waited_time:.1f}s out of {retry_policy.max_elapsed}s)'
+        )
+
+    if metrics is not None:
+        metrics.observe('extract.shard', time.perf_counter() - shard_started)
+        outcome = {'success': 'succeeded', 'no_data': 'no_data', 'failed': 'failed'}[status]
+        metrics.increment(f'extract.shards_{outcome}')
+
+    return {
+        'start': start_time,
+        'end': end_time,
+        'filepath': filepathzip,
+        'status': status,
+        'attempts': attempts,
+        'error': error,
+        'logs': (log_times, log_items, log_descriptions),
+    }
+
+
+def extract_gzip_amplitude(
+    daydiffs: List[int],
+    wait_time: int,
+    total_wait_time: int,
+    api_keys: Dict[str, str],
+    stream: bool = True,
+    chunk_size: int = 1024 * 1024,
+    shard_hours: int = 24,
+    max_workers: int = 1,
+    max_requests_per_second: Optional[float] = None,
+    adaptive_rate_limit: bool = True,
+    completed_hours: Optional[Set[str]] = None,
+    availability_lag_hours: Optional[int] = None,
+    metrics: Optional[RunMetrics] = None,
+    url: Optional[str] = None,
+    retry_policy: Optional[retry.RetryPolicy] = None,
+    timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    checkpoint: Optional[RunCheckpoint] = None,
+    before_download: Optional[Callable[[], None]] = None,
+    zip_dir: str = 'datazip',
+    on_plan: Optional[Callable[[List[Tuple[dt.datetime, dt.datetime]]], None]] = None,
+    http_client: Optional[HttpClient] = None
+) -> List[Dict[str, Any]]:
+    """
+    Extracts zipped data from the Amplitude Export API for specified days
+    and saves the files locally. Logs actions and errors for traceability.
+
+    Each day is split into `shard_hours`-hour shards which are downloaded
+    concurrently on a bounded thread pool, so a failed shard is retried on its
+    own rather than re-requesting the whole day.
+
+    Args:
+        daydiffs (List[int]): List of integers representing how many days back to extract.
+            Days are requested in this order (e.g. ascending for newest first).
+        wait_time (int): Initial retry delay in seconds; later retries back off exponentially.
+        total_wait_time (int): Maximum total wait time per shard in seconds before giving up.
+        api_keys (Dict[str, str]): A dictionary containing Amplitude API credentials
+            ('AMP_API_KEY', 'AMP_SECRET_KEY' and optionally 'AMP_DATA_REGION').
+        stream (bool): Stream the response to disk in chunks (with resume) instead of
+            buffering the whole export in memory. Defaults to True.
+        chunk_size (int): Bytes per chunk when streaming. Defaults to 1 MiB.
+        shard_hours (int): Hours per request shard (1-24). Defaults to 24 (one request per day).
+        max_workers (int): Maximum number of shards downloaded at the same time. Defaults to 1.
+        max_requests_per_second (Optional[float]): Cap on request starts per second across
+            all workers, to stay under Amplitude's rate limits. Defaults to no cap.
+        adaptive_rate_limit (bool): Back the concurrency and request rate off on 429s,
+            timeouts and latency spikes, and grow them back (up to `max_workers` and
+            `max_requests_per_second`) while responses are healthy. Defaults to True.
+        completed_hours (Optional[Set[str]]): Hours (`%Y%m%dT%H`) already ingested, e.g.
+            from `state_store.get_completed_hours`. These are not requested again.
+        availability_lag_hours (Optional[int]): If set, hours that finished less than this
+            many hours ago are skipped, as Amplitude has not finished exporting them yet.
+        metrics (Optional[RunMetrics]): Receives per-shard timers and counters.
+        url (Optional[str]): Export API endpoint. Defaults to the endpoint of
+            `api_keys['AMP_DATA_REGION']` (see `export_url`).
+        retry_policy (Optional[retry.RetryPolicy]): Retry rules. Defaults to exponential
+            backoff from `wait_time` within a `total_wait_time` budget.
+        timeout (Tuple[float, float]): (connect, read) timeouts in seconds.
+        on_result (Optional[Callable[[Dict[str, Any]], None]]): Called from the download
+            thread with each shard result as soon as the shard finishes. A callback that
+            blocks (e.g. on a full queue) holds that download slot, which is how the
+            pipelined runner applies backpressure.
+        checkpoint (Optional[RunCheckpoint]): Run journal. Shards it records as done are
+            not downloaded again (their result has `attempts` 0), and newly finished
+            shards are recorded in it.
+        before_download (Optional[Callable[[], None]]): Called from the download thread
+            before each shard is requested. A callback that blocks (e.g. until there is
+            local disk to spare) delays that download.
+        zip_dir (str): Directory the zips are written to. Defaults to 'datazip'.
+        on_plan (Optional[Callable]): Called with the planned (start, end) shards before
+            any is downloaded, e.g. to report progress against them.
+        http_client (Optional[HttpClient]): Pooled keep-alive client shared by all shards.
+            Defaults to the process-wide client with a pool of at least `max_workers`.
+
+    Returns:
+        List[Dict[str, Any]]: One result per shard, in shard order (see `extract_shard`).
+    """
+    # Define local directories
+    directoryzip = os.path.join(zip_dir, '')
+
+    # Ensure required directories exist
+    os.makedirs("logs", exist_ok=True)
+    os.makedirs(directoryzip, exist_ok=True)
+
+    url = url or export_url(api_keys.get('AMP_DATA_REGION'))
+    http_client = http_client or get_http_client(max(DEFAULT_POOL_SIZE, max_workers))
+    auth = (api_keys['AMP_API_KEY'], api_keys['AMP_SECRET_KEY'])
+    limiter = AdaptiveRateLimiter(
+        max_workers, max_requests_per_second, adaptive=adaptive_rate_limit, metrics=metrics
+    )
+    if retry_policy is None:
+        retry_policy = retry.RetryPolicy(base_delay=wait_time, max_elapsed=total_wait_time)
+    latest_hour = latest_available_hour(availability_lag_hours)
+    shards = plan_shards(daydiffs, shard_hours, completed_hours=completed_hours, latest_hour=latest_hour)
+    print(f'Planned {len(shards)} shards')
+    if on_plan is not None:
+        on_plan(shards)
+
+    def download(shard: Tuple[dt.datetime, dt.datetime]) -> Dict[str, Any]:
+        unit = f'{shard[0]:%Y%m%dT%H}-{shard[1]:%Y%m%dT%H}'
+        done = checkpoint.get('extract', unit) if checkpoint is not None else None
+        if done is not None:
+            # Downloaded before a crash; the zip is still on disk, or already processed and deleted
+            result = {
+                'start': f'{shard[0]:%Y%m%dT%H}', 'end': f'{shard[1]:%Y%m%dT%H}', 'filepath': done['filepath'],
+                'status': done['status'], 'attempts': 0, 'error': None, 'logs': ([], [], []),
+            }
+            if metrics is not None:
+                metrics.increment('extract.shards_resumed')
+        else:
+            if before_download is not None:
+                before_download()
+            result = extract_shard(
+                shard[0], shard[1], url, auth, retry_policy,
+                directoryzip, stream, chunk_size, limiter, metrics, timeout, http_client
+            )
+            if checkpoint is not None and result['status'] in ('success', 'no_data'):
+                checkpoint.record('extract', unit, filepath=result['filepath'], status=result['status'])
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    # Download shards on a bounded pool; map keeps results, and so logs, in shard order
+    results = []
+    with lgs.LogBuffer() as log_buffer, ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for result in executor.map(download, shards):
+            results.append(result)
+            log_buffer.extend(*result['logs'])
+
+    failed = [r for r in results if r['status'] == 'failed']
+    no_data = sum(r['status'] == 'no_data' for r in results)
+    print(f'Extracted {len(results) - len(failed) - no_data}/{len(results)} shards ({no_data} with no data)')
+    for result in failed:
+        print(f"Shard {result['start']}-{result['end']} failed after {result['attempts']} attempts: {result['error']}")
+    return results
 
 
 if __name__ == '__main__':
+    from dotenv import load_dotenv
+
     # Load credentials and call the function
     load_dotenv()
     api_keys = {
@@ -118,7 +546,7 @@ if __name__ == '__main__':
     }
 
     daydiffs = [1, 2]
-    wait_time = 5
-    total_wait_time = 10
+    wait_time = 2
+    total_wait_time = 300
 
     extract_gzip_amplitude(daydiffs, wait_time, total_wait_time, api_keys)
@@ -0,0 +1,185 @@
+"""
+Fan-out of Amplitude events into the warehouse's normalized tables.
+
+`schema_example.sql` splits each event into `amp_events` plus tables of
+`event_properties` and `user_properties` keyed by a hash, re-scanning every raw
+event on each rebuild. With fan-out, the parse step does that split once, while it
+streams each NDJSON line, and writes three files per hourly member:
+
+- `data/events/<file>`: the event, with `event_properties` and `user_properties`
+  replaced by `event_properties_id` and `user_properties_id`
+- `data/event_properties/<file>`: `{"event_properties_id", "event_properties"}` rows
+- `data/user_properties/<file>`: `{"user_properties_id", "user_properties"}` rows
+
+An id is the BLAKE2b-128 hex digest of the blob serialised with sorted keys, so the
+same properties get the same id in every run and process. A per-process LRU of
+recently written ids keeps repeated blobs (the common case: a user's properties
+rarely change between events) from being written again. Ids enter the LRU only once
+the files holding their blobs are closed, so a member that fails part-way cannot make
+later members skip blobs it never finished writing. There is one LRU per output
+directory, so runs that share a worker pool (e.g. several projects) each get
+every blob written to their own tables. The LRU is bounded, and
+separate processes have separate caches, so a blob can still appear more than once
+across files; load the property tables with MERGE or `SELECT DISTINCT` on the id.
+
+Uses `orjson` when installed (see `fast_json`).
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Iterable, Optional, Set
+from . import fast_json
+
+# Property blobs split out of each event, and the id column that replaces them
+PROPERTY_FIELDS = {'event_properties': 'event_properties_id', 'user_properties': 'user_properties_id'}
+FANOUT_TABLES = ('events',) + tuple(PROPERTY_FIELDS)
+DEFAULT_CACHE_SIZE = 100000
+
+_caches: Dict[str, 'PropertyCache'] = {}
+
+
+def property_id(canonical: bytes) -> str:
+    """
+    Returns the stable id of a property blob.
+
+    Args:
+        canonical (bytes): The blob serialised with sorted keys and no whitespace.
+
+    Returns:
+        str: 32-character hex digest.
+    """
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+
+class PropertyCache:
+    """
+    Bounded LRU of property ids this process has written to finished files.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """
+        Args:
+            max_size (int): Ids remembered; the least recently seen is evicted first.
+        """
+        self.max_size = max_size
+        self._ids: 'OrderedDict[str, None]' = OrderedDict()
+
+    def seen(self, blob_id: str) -> bool:
+        """
+        Returns whether an id was written recently, marking it as recently used if so.
+
+        Args:
+            blob_id (str): Property id.
+
+        Returns:
+            bool: True if the id is cached (its blob need not be written again).
+        """
+        if blob_id in self._ids:
+            self._ids.move_to_end(blob_id)
+            return True
+        return False
+
+    def add(self, blob_ids: Iterable[str]) -> None:
+        """
+        Remembers ids whose blobs are now in a finished file.
+
+        Args:
+            blob_ids (Iterable[str]): Property ids.
+        """
+        for blob_id in blob_ids:
+            self._ids[blob_id] = None
+            self._ids.move_to_end(blob_id)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+
+def get_property_cache(scope: str = '', max_size: int = DEFAULT_CACHE_SIZE) -> PropertyCache:
+    """
+    Returns the process-wide property cache of an output directory, so that a parse
+    worker skips blobs already written for earlier members.
+
+    Args:
+        scope (str): Output directory the blobs are written to.
+        max_size (int): Cache size, used when the cache is first created.
+
+    Returns:
+        PropertyCache: The shared cache.
+    """
+    if scope not in _caches:
+        _caches[scope] = PropertyCache(max_size)
+    return _caches[scope]
+
+
+class EventFanout:
+    """
+    Splits NDJSON event lines into event rows and deduplicated property rows.
+    """
+
+    def __init__(self, writers: Dict[str, BinaryIO], cache: Optional[PropertyCache] = None) -> None:
+        """
+        Args:
+            writers (Dict[str, BinaryIO]): Writable stream per table in `FANOUT_TABLES`.
+            cache (Optional[PropertyCache]): Ids already written. Defaults to the process-wide
+                cache of the default scope.
+        """
+        self.writers = writers
+        self.cache = cache if cache is not None else get_property_cache()
+        self.rows = dict.fromkeys(FANOUT_TABLES, 0)
+        self.blobs_skipped = 0
+        # Ids written to this file, cached only once it is finished (see `commit`)
+        self.written: Set[str] = set()
+
+    def write_line(self, line: bytes) -> None:
+        """
+        Fans out one event. Lines that are blank, do not parse or are not objects
+        are skipped (validate first to quarantine them).
+
+        Args:
+            line (bytes): One NDJSON line.
+        """
+        try:
+            event = fast_json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(event, dict):
+            return
+
+        for field, id_field in PROPERTY_FIELDS.items():
+            blob = event.pop(field, None)
+            if blob is None:
+                event[id_field] = None
+                continue
+            canonical = fast_json.dumps(blob, sort_keys=True)
+            blob_id = property_id(canonical)
+            event[id_field] = blob_id
+            if blob_id in self.written or self.cache.seen(blob_id):
+                self.blobs_skipped += 1
+            else:
+                self.written.add(blob_id)
+                self.writers[field].write(
+                    b'{"' + id_field.encode() + b'":"' + blob_id.encode() + b'","'
+                    + field.encode() + b'":' + canonical + b'}\n'
+                )
+                self.rows[field] += 1
+        self.writers['events'].write(fast_json.dumps(event) + b'\n')
+        self.rows['events'] += 1
+
+    def write_lines(self, lines: Iterable[bytes]) -> None:
+        """
+        Fans out every line of a stream.
+
+        Args:
+            lines (Iterable[bytes]): NDJSON lines, e.g. a decompressed file object.
+        """
+        for line in lines:
+            if line.strip():
+                self.write_line(line)
+
+    def commit(self) -> None:
+        """
+        Adds the ids written by this fan-out to the cache. Call once its files are
+        closed, so a file that fails part-way does not leave later members skipping
+        blobs that never reached a finished file.
+        """
+        self.cache.add(self.written)
+        self.written = set()
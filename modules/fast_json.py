@@ -0,0 +1,43 @@
+"""
+JSON helpers for the per-event hot paths (validation, dedupe, fan-out, Parquet).
+
+Uses `orjson` when installed (several times faster than `json`, see
+`requirements-optional.txt`), else the standard library with the same compact
+output. Both read bytes and write UTF-8 bytes.
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+
+    loads = orjson.loads
+
+    def dumps(value: Any, sort_keys: bool = False) -> bytes:
+        """
+        Serialises a value as compact UTF-8 JSON.
+
+        Args:
+            value (Any): Value to serialise.
+            sort_keys (bool): Sort object keys, for a canonical form of the value.
+
+        Returns:
+            bytes: The JSON document.
+        """
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS if sort_keys else None)
+except ImportError:
+    loads = json.loads
+
+    def dumps(value: Any, sort_keys: bool = False) -> bytes:
+        """
+        Serialises a value as compact UTF-8 JSON.
+
+        Args:
+            value (Any): Value to serialise.
+            sort_keys (bool): Sort object keys, for a canonical form of the value.
+
+        Returns:
+            bytes: The JSON document.
+        """
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False, sort_keys=sort_keys).encode()
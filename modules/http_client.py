@@ -0,0 +1,193 @@
+"""
+Pooled HTTP client for Export API requests.
+
+A module-level `requests.get` opens a new TCP and TLS connection for every attempt.
+`HttpClient` keeps connections alive in a shared pool instead, so shards and
+retries reuse the handshakes already made:
+
+- The default backend is `requests`. One `HTTPAdapter` (a thread-safe urllib3
+  pool) is shared by a `requests.Session` per thread, since sessions themselves
+  are not guaranteed to be thread-safe. Size the pool to the concurrent downloads.
+  Connections beyond it are opened and dropped rather than waited for.
+- With `http2=True` and `httpx[http2]` installed, an `httpx.Client` multiplexes
+  requests to each host over HTTP/2. Without it, the client falls back to
+  `requests` and says so.
+
+Every request has (connect, read) timeouts, so a stalled socket raises and is
+retried instead of hanging a download thread. Responses are requested with
+`Accept-Encoding: identity`: the export is already a zip, and a content-encoded
+body would break byte offsets of resumed (Range) downloads.
+"""
+
+import datetime as dt
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_POOL_SIZE = 16
+# (connect, read) timeouts in seconds; the read timeout applies per socket read, not to the whole body
+DEFAULT_TIMEOUT = (10.0, 300.0)
+DEFAULT_HEADERS = {'Accept-Encoding': 'identity'}
+
+# One client per (pool size, HTTP/2), shared by every download in the process
+_clients: Dict[Tuple[int, bool], 'HttpClient'] = {}
+_clients_lock = threading.Lock()
+
+
+class _Http2Response:
+    """
+    Presents an `httpx.Response` with the parts of the `requests.Response` interface
+    the extract code uses.
+    """
+
+    def __init__(self, response: Any, elapsed: dt.timedelta) -> None:
+        """
+        Args:
+            response (Any): The `httpx.Response`.
+            elapsed (dt.timedelta): Time from sending the request to its headers arriving,
+                like `requests.Response.elapsed` (httpx only knows it once the body is read).
+        """
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.elapsed = elapsed
+
+    @property
+    def content(self) -> bytes:
+        return self._response.read()
+
+    def iter_content(self, chunk_size: int = 1024 * 1024) -> Any:
+        return self._response.iter_bytes(chunk_size)
+
+    def raise_for_status(self) -> None:
+        try:
+            self._response.raise_for_status()
+        except Exception as err:
+            # Retry rules read the status and headers from `error.response`
+            if getattr(err, 'response', None) is self._response:
+                err.response = self
+            raise
+
+    def close(self) -> None:
+        self._response.close()
+
+    def __enter__(self) -> '_Http2Response':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class HttpClient:
+    """
+    Keep-alive HTTP client with a bounded connection pool, safe to share between threads.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, http2: bool = False) -> None:
+        """
+        Args:
+            pool_size (int): Connections kept alive per host. Should be at least the
+                number of concurrent downloads.
+            http2 (bool): Use HTTP/2 through `httpx` when it (and `h2`) is installed.
+        """
+        self.pool_size = max(1, pool_size)
+        self.http2 = False
+        self._local = threading.local()
+        self._adapter = None
+        self._httpx_client = None
+
+        if http2:
+            try:
+                import httpx
+
+                self._httpx_client = httpx.Client(
+                    http2=True,
+                    headers=DEFAULT_HEADERS,
+                    limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size),
+                    follow_redirects=True
+                )
+                self.http2 = True
+            except ImportError:
+                print('HTTP/2 needs httpx[http2]; using pooled HTTP/1.1 (requests)')
+        if self._httpx_client is None:
+            from requests.adapters import HTTPAdapter
+
+            # Retries are scheduled by `retry.RetryPolicy`, not by urllib3
+            self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+
+    def _session(self) -> Any:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            self._local.session = session
+        return session
+
+    def get(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        auth: Optional[Tuple[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT
+    ) -> Any:
+        """
+        Sends a GET request over a pooled connection.
+
+        Args:
+            url (str): Request URL.
+            params (Optional[Dict[str, str]]): Query parameters.
+            auth (Optional[Tuple[str, str]]): Basic auth (user, password).
+            headers (Optional[Dict[str, str]]): Extra headers.
+            stream (bool): Return once the headers arrive and read the body lazily
+                (`iter_content`). Close the response (or use it as a context manager)
+                to return its connection to the pool.
+            timeout (Tuple[float, float]): (connect, read) timeouts in seconds.
+
+        Returns:
+            Any: A `requests.Response`, or an equivalent wrapper of the HTTP/2 response.
+        """
+        if self._httpx_client is not None:
+            import httpx
+
+            request = self._httpx_client.build_request(
+                'GET', url, params=params, headers=headers,
+                timeout=httpx.Timeout(timeout[1], connect=timeout[0])
+            )
+            started = time.perf_counter()
+            response = self._httpx_client.send(request, auth=auth, stream=True)
+            elapsed = dt.timedelta(seconds=time.perf_counter() - started)
+            if not stream:
+                response.read()
+            return _Http2Response(response, elapsed)
+        return self._session().get(url, params=params, auth=auth, headers=headers, stream=stream, timeout=timeout)
+
+    def close(self) -> None:
+        """Closes every pooled connection."""
+        if self._httpx_client is not None:
+            self._httpx_client.close()
+        if self._adapter is not None:
+            self._adapter.close()
+
+
+def get_http_client(pool_size: int = DEFAULT_POOL_SIZE, http2: bool = False) -> HttpClient:
+    """
+    Returns the process-wide HTTP client for the given settings, creating it on first use.
+
+    Args:
+        pool_size (int): Connections kept alive per host.
+        http2 (bool): Prefer HTTP/2 (see `HttpClient`).
+
+    Returns:
+        HttpClient: The shared client.
+    """
+    with _clients_lock:
+        if (pool_size, http2) not in _clients:
+            _clients[(pool_size, http2)] = HttpClient(pool_size, http2)
+        return _clients[(pool_size, http2)]
+
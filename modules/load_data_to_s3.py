@@ -2,66 +2,296 @@
 Module to upload JSON and log CSV files to AWS S3.
 
 This script defines two functions:
-- load_amp_json(): uploads JSON data files from the 'data/' directory.
+- load_amp_json(): uploads JSON data files from the data directory ('data/' by default).
 - load_logs_csv(): uploads log CSV files from the 'logs/' directory.
 
+Both go through upload_files(), which uploads many files concurrently on a bounded
+thread pool, sharing one pooled S3 client and one TransferConfig.
+
+boto3 is imported lazily, on first use, so importing this module is cheap.
+
 Credentials must be provided via environment variables or passed into the functions.
 """
 
 import os
-from typing import Dict
-from botocore.exceptions import ClientError
-import boto3
+import posixpath
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from .checkpoint import RunCheckpoint
+from .metrics import RunMetrics
+from .output_codecs import get_upload_extra_args
+from .s3_layout import event_file_key
+
+if TYPE_CHECKING:
+    from boto3.s3.transfer import TransferConfig
 
+# One client per credential set, shared by every upload in the process
+_s3_clients: Dict[Tuple[str, str, Optional[str], int], Any] = {}
+_s3_clients_lock = threading.Lock()
 
-def load_amp_json(s3filepath_base: str, api_keys: Dict[str, str]) -> None:
+
+def get_s3_client(api_keys: Dict[str, str], max_pool_connections: int = 32):
     """
-    Uploads all `.json` files from the `data/` directory to a specified S3 path,
-    and deletes each local file after a successful upload.
+    Returns a process-wide S3 client for the given credentials, creating it on first
+    use. boto3 clients are thread-safe, so one client (and its connection pool) is
+    shared by all upload threads.
 
     Args:
-        s3filepath_base (str): Base path in the S3 bucket to upload the files.
         api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
             - 'Access_key_ID'
             - 'Secret_access_key'
-            - 'AWS_BUCKET_NAME'
+            - 'Endpoint_url' (optional, for S3-compatible stores such as MinIO)
+        max_pool_connections (int): Size of the client's HTTP connection pool. Should be
+            at least the number of upload workers times the transfer concurrency.
+
+    Returns:
+        botocore.client.S3: The shared S3 client.
     """
-    filepath_base = 'data'
-    filenames = os.listdir(filepath_base)
-    print(filenames)
-    print(api_keys)
-
-    # Create S3 client
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=api_keys['Access_key_ID'],
-        aws_secret_access_key=api_keys['Secret_access_key'],
-        region_name='eu-north-1'
+    import boto3
+    from botocore.config import Config
+
+    endpoint_url = api_keys.get('Endpoint_url')
+    cache_key = (api_keys['Access_key_ID'], api_keys['Secret_access_key'], endpoint_url, max_pool_connections)
+    with _s3_clients_lock:
+        if cache_key not in _s3_clients:
+            _s3_clients[cache_key] = boto3.session.Session().client(
+                's3',
+                aws_access_key_id=api_keys['Access_key_ID'],
+                aws_secret_access_key=api_keys['Secret_access_key'],
+                region_name='eu-north-1',
+                endpoint_url=endpoint_url,
+                config=Config(max_pool_connections=max_pool_connections)
+            )
+        return _s3_clients[cache_key]
+
+
+def build_transfer_config(
+    multipart_threshold: int = 16 * 1024 * 1024,
+    multipart_chunksize: int = 16 * 1024 * 1024,
+    max_concurrency: int = 4
+) -> 'TransferConfig':
+    """
+    Builds the TransferConfig shared by all uploads.
+
+    Args:
+        multipart_threshold (int): Files at least this size use multipart upload.
+        multipart_chunksize (int): Part size for multipart uploads.
+        max_concurrency (int): Parallel parts per multipart upload.
+
+    Returns:
+        TransferConfig: boto3 transfer settings.
+    """
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=multipart_threshold,
+        multipart_chunksize=multipart_chunksize,
+        max_concurrency=max_concurrency
     )
 
-    for filename in filenames:
-        try:
-            filepath = filepath_base + '/' + filename
-            s3_path = s3filepath_base + '/' + filename
 
-            print(filepath, s3_path)
+def upload_files(
+    uploads: List[Tuple[str, str]],
+    api_keys: Dict[str, str],
+    max_workers: int = 16,
+    transfer_config: Optional['TransferConfig'] = None,
+    remove_local: bool = False,
+    metrics: Optional[RunMetrics] = None,
+    checkpoint: Optional[RunCheckpoint] = None
+) -> List[Dict[str, Any]]:
+    """
+    Uploads many local files to S3 concurrently with one shared client. Event files
+    get a Content-Type, and a Content-Encoding matching their `.gz`/`.zst` suffix.
 
+    Args:
+        uploads (List[Tuple[str, str]]): (local path, S3 key) pairs.
+        api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
+            - 'Access_key_ID'
+            - 'Secret_access_key'
+            - 'AWS_BUCKET_NAME'
+        max_workers (int): Maximum number of files uploaded at the same time.
+        transfer_config (Optional[TransferConfig]): Multipart settings. Defaults to
+            `build_transfer_config()`.
+        remove_local (bool): If True, deletes each local file after a successful upload.
+        metrics (Optional[RunMetrics]): Receives the `upload.file` timer and
+            `upload.bytes_uploaded`/`upload.files_uploaded`/`upload.files_failed` counters.
+        checkpoint (Optional[RunCheckpoint]): Run journal each successful upload is
+            recorded in, before its local file is removed.
+
+    Returns:
+        List[Dict[str, Any]]: One result per upload, in input order, with keys
+            `filepath`, `key`, `status` ('success' or 'failed'), `bytes`, `seconds`
+            and `error`.
+    """
+    from boto3.exceptions import Boto3Error
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    transfer_config = transfer_config or build_transfer_config()
+    max_workers = max(1, max_workers)
+    s3_client = get_s3_client(api_keys, max_pool_connections=max_workers * transfer_config.max_request_concurrency)
+    bucket = api_keys['AWS_BUCKET_NAME']
+
+    def upload_one(upload: Tuple[str, str]) -> Dict[str, Any]:
+        filepath, s3_path = upload
+        start = time.perf_counter()
+        result = {'filepath': filepath, 'key': s3_path, 'status': 'failed', 'bytes': 0, 'seconds': 0.0, 'error': None}
+        try:
+            result['bytes'] = os.path.getsize(filepath)
             s3_client.upload_file(
                 Filename=filepath,
-                Bucket=api_keys['AWS_BUCKET_NAME'],
+                Bucket=bucket,
                 Key=s3_path,
+                ExtraArgs=get_upload_extra_args(s3_path),
+                Config=transfer_config
             )
+            if checkpoint is not None:
+                checkpoint.record('upload', s3_path, filepath=filepath)
+            if remove_local:
+                os.remove(filepath)
+            result['status'] = 'success'
+        # upload_file wraps S3 errors in S3UploadFailedError (a Boto3Error)
+        except (Boto3Error, BotoCoreError, ClientError, OSError) as err:
+            result['error'] = str(err)
+            print(f"Upload failed: {filepath} -> {s3_path}: {err}")
+        result['seconds'] = time.perf_counter() - start
+        if metrics is not None:
+            metrics.observe('upload.file', result['seconds'])
+            if result['status'] == 'success':
+                metrics.increment('upload.bytes_uploaded', result['bytes'])
+                metrics.increment('upload.files_uploaded')
+            else:
+                metrics.increment('upload.files_failed')
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(upload_one, uploads))
+
+    succeeded = [r for r in results if r['status'] == 'success']
+    total_bytes = sum(r['bytes'] for r in succeeded)
+    print(f"Uploaded {len(succeeded)}/{len(results)} files ({total_bytes} bytes)")
+    return results
+
+
+def data_file_key(filepath: str, s3filepath_base: str, data_dir: str = 'data', key_layout: str = 'flat') -> str:
+    """
+    Returns the S3 key of a parsed file under `data_dir`.
+
+    Args:
+        filepath (str): Local path inside `data_dir`.
+        s3filepath_base (str): Base path in the S3 bucket.
+        data_dir (str): Local data directory.
+        key_layout (str): Layout for hourly JSON files, see `s3_layout`.
+
+    Returns:
+        str: S3 key. Files already partitioned locally (Parquet output) keep their relative
+            path. Files in a table subdirectory (fan-out output, e.g. `data/events/`) go
+            under that table's prefix, laid out like hourly JSON files.
+    """
+    relative_path = os.path.relpath(filepath, data_dir).replace(os.sep, '/')
+    directory, filename = posixpath.split(relative_path)
+    if directory.startswith('dt='):
+        return s3filepath_base + '/' + relative_path
+    if directory:
+        return event_file_key(s3filepath_base + '/' + directory, filename, key_layout)
+    return event_file_key(s3filepath_base, relative_path, key_layout)
+
+
+def load_amp_json(
+    s3filepath_base: str,
+    api_keys: Dict[str, str],
+    max_workers: int = 16,
+    transfer_config: Optional['TransferConfig'] = None,
+    metrics: Optional[RunMetrics] = None,
+    skip_unchanged: bool = False,
+    manifest_s3_key: Optional[str] = None,
+    key_layout: str = 'flat',
+    checkpoint: Optional[RunCheckpoint] = None,
+    data_dir: str = 'data',
+    manifest_path: Optional[str] = None,
+    manifest_retain_days: Optional[int] = None
+) -> List[str]:
+    """
+    Uploads all `.json` (or `.json.gz`/`.json.zst`/`.parquet`) files from the `data_dir`
+    directory to a specified S3 path, and deletes each local file after a successful
+    upload. Subdirectories (such as Parquet partitions) are mirrored in the S3 key,
+    and hourly JSON files are placed according to `key_layout`.
+
+    With `skip_unchanged`, files whose key already exists in S3 with the same content
+    are not uploaded again (see `upload_manifest`), e.g. when rerunning after a
+    partial failure.
+
+    Args:
+        s3filepath_base (str): Base path in the S3 bucket to upload the files.
+        api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
+            - 'Access_key_ID'
+            - 'Secret_access_key'
+            - 'AWS_BUCKET_NAME'
+        max_workers (int): Maximum number of files uploaded at the same time.
+        transfer_config (Optional[TransferConfig]): Multipart settings shared by all uploads.
+        metrics (Optional[RunMetrics]): Receives upload timers and counters.
+        skip_unchanged (bool): Skip files already in S3 with identical content. Defaults to False.
+        manifest_s3_key (Optional[str]): Key the upload manifest is synced to, when
+            `skip_unchanged` is set. None keeps the manifest local.
+        key_layout (str): 'flat' uploads hourly JSON files directly under `s3filepath_base`;
+            'hive' places them under `dt=YYYY-MM-DD/hour=HH/`. Defaults to 'flat'.
+        checkpoint (Optional[RunCheckpoint]): Run journal. Files it records as uploaded
+            are not sent again, and new uploads are recorded.
+        data_dir (str): Local directory holding the parsed files. Defaults to 'data'.
+        manifest_path (Optional[str]): Local path of the upload manifest. Defaults to
+            `upload_manifest.MANIFEST_PATH`.
+        manifest_retain_days (Optional[int]): Days of event dates kept in the upload
+            manifest (see `UploadManifest`). None keeps every entry.
+
+    Returns:
+        List[str]: Local paths of files that failed to upload.
+    """
+    filepath_base = data_dir
+
+    # Walk recursively so partitioned output (e.g. dt=.../hour=.../) keeps its layout
+    uploads = []
+    for root, _, filenames in os.walk(filepath_base):
+        for filename in sorted(filenames):
+            filepath = os.path.join(root, filename)
+            uploads.append((filepath, data_file_key(filepath, s3filepath_base, filepath_base, key_layout)))
+    print(f"{len(uploads)} files to upload from {filepath_base}")
+
+    if checkpoint is not None:
+        uploads = checkpoint.pending_uploads(uploads)
+
+    transfer_config = transfer_config or build_transfer_config()
+    manifest = None
+    if skip_unchanged:
+        from .upload_manifest import MANIFEST_PATH, UploadManifest
+
+        manifest = UploadManifest(
+            api_keys, manifest_path=manifest_path or MANIFEST_PATH, s3_key=manifest_s3_key,
+            retain_days=manifest_retain_days
+        )
+        uploads, skipped = manifest.filter_unchanged(uploads, transfer_config, max_workers, metrics)
+        for filepath, s3_path in skipped:
+            if checkpoint is not None:
+                checkpoint.record('upload', s3_path, filepath=filepath)
             os.remove(filepath)
-            print("Upload succeeded")
-        except ClientError as err:
-            print(f"Upload failed: {err}")
 
-    print(s3_client)
+    results = upload_files(
+        uploads, api_keys, max_workers, transfer_config, remove_local=True, metrics=metrics, checkpoint=checkpoint
+    )
+    if manifest is not None:
+        manifest.record_uploads(results)
+    return [r['filepath'] for r in results if r['status'] != 'success']
 
 
-def load_logs_csv(s3filepath_base: str, api_keys: Dict[str, str], remove_local: bool = False) -> None:
+def load_logs_csv(
+    s3filepath_base: str,
+    api_keys: Dict[str, str],
+    remove_local: bool = False,
+    max_workers: int = 4
+) -> None:
     """
-    Uploads log `.csv` files from the `logs/` directory to a specified S3 path.
+    Uploads log `.csv` files and JSON run summaries from the `logs/` directory
+    to a specified S3 path.
 
     Args:
         s3filepath_base (str): Base path in the S3 bucket to upload the logs.
@@ -70,39 +300,18 @@ def load_logs_csv(s3filepath_base: str, api_keys: Dict[str, str], remove_local:
             - 'Secret_access_key'
             - 'AWS_BUCKET_NAME'
         remove_local (bool): If True, deletes local files after successful upload.
+        max_workers (int): Maximum number of files uploaded at the same time.
     """
     filepath_base = 'logs'
-    filenames = os.listdir(filepath_base)
+    # State and manifest JSON under logs/ are synced to their own keys, so only run summaries go here
+    filenames = [
+        f for f in os.listdir(filepath_base)
+        if f.endswith('.csv') or (f.startswith('amp_run_summary_') and f.endswith('.json'))
+    ]
     print(filenames)
-    print(api_keys)
-
-    # Create S3 client
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=api_keys['Access_key_ID'],
-        aws_secret_access_key=api_keys['Secret_access_key'],
-        region_name='eu-north-1'
-    )
-
-    for filename in filenames:
-        try:
-            filepath = filepath_base + '/' + filename
-            s3_path = s3filepath_base + '/' + filename
-
-            print(filepath, s3_path)
-
-            s3_client.upload_file(
-                Filename=filepath,
-                Bucket=api_keys['AWS_BUCKET_NAME'],
-                Key=s3_path,
-            )
-            if remove_local:
-                os.remove(filepath)
-            print("Upload succeeded")
-        except ClientError as err:
-            print(f"Upload failed: {err}")
 
-    print(s3_client)
+    uploads = [(filepath_base + '/' + filename, s3filepath_base + '/' + filename) for filename in filenames]
+    upload_files(uploads, api_keys, max_workers, remove_local=remove_local)
 
 
 if __name__ == '__main__':
@@ -2,15 +2,26 @@
 Logging helper module for recording file and API operations.
 
 This module provides utility functions to return standard log description dictionaries
-and to append new log entries to a CSV file.
+and to append new log entries to CSV files.
+
+Logs are append-only: each entry is appended to `logs/amp_extract_logs_YYYYMMDD.csv`
+(rotated daily by entry time) without reading existing history, so the cost of a
+run does not grow with the size of the log.
 """
 
-import pandas as pd
+import csv
+import datetime as dt
 import os
-from typing import List, Tuple, Dict
+import threading
+from typing import Any, List, Tuple, Dict
+
+LOG_DIR = 'logs'
+LOG_PREFIX = 'amp_extract_logs'
+LOG_COLUMNS = ['log_time', 'log_item', 'log_description']
+
+# Serialises appends from buffers flushed on different threads (e.g. concurrent projects)
+_write_lock = threading.Lock()
 
-# Ensure the logs directory exists
-os.makedirs("logs", exist_ok=True)
 
 def get_log_descs_and_items_dict() -> Tuple[Dict[str, str], Dict[str, str]]:
     """
@@ -39,37 +50,120 @@ def get_log_descs_and_items_dict() -> Tuple[Dict[str, str], Dict[str, str]]:
     return log_descriptions_dict, log_items_dict
 
 
+def get_log_path(log_time: Any, log_dir: str = LOG_DIR) -> str:
+    """
+    Returns the daily log file an entry belongs to.
+
+    Args:
+        log_time (Any): Entry timestamp; non-datetimes are filed under today.
+        log_dir (str): Directory holding the log files.
+
+    Returns:
+        str: Path like `logs/amp_extract_logs_20250710.csv`.
+    """
+    day = log_time if isinstance(log_time, (dt.datetime, dt.date)) else dt.date.today()
+    return os.path.join(log_dir, f'{LOG_PREFIX}_{day:%Y%m%d}.csv')
+
+
+class LogBuffer:
+    """
+    Collects log entries in memory and appends them to the daily CSV in batches.
+
+    Adding an entry is a single list append; the file is only touched when
+    `batch_size` entries are pending or on `flush()`/`close()`, so stage loops can
+    log every unit as it finishes while memory stays bounded over long runs.
+    Not thread-safe: use one buffer per thread.
+    """
+
+    def __init__(self, batch_size: int = 1000, log_dir: str = LOG_DIR) -> None:
+        """
+        Args:
+            batch_size (int): Pending entries that trigger an automatic flush.
+            log_dir (str): Directory holding the log files.
+        """
+        self.batch_size = batch_size
+        self.log_dir = log_dir
+        self.written = 0
+        self._rows: List[Tuple[Any, Any, Any]] = []
+
+    def add(self, log_item: Any, log_description: Any, log_time: Any = None) -> None:
+        """
+        Adds one entry, timestamped now unless `log_time` is given.
+
+        Args:
+            log_item (Any): Item label (file path, 'API call', ...).
+            log_description (Any): What happened.
+            log_time (Any): Entry timestamp. Defaults to now.
+        """
+        self._rows.append((log_time or dt.datetime.now(), log_item, log_description))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def extend(self, log_times: List[Any], log_items: List[Any], log_descriptions: List[Any]) -> None:
+        """
+        Adds entries from the parallel lists used throughout the pipeline.
+
+        Args:
+            log_times (List[Any]): List of timestamps.
+            log_items (List[Any]): List of item labels.
+            log_descriptions (List[Any]): List of log descriptions.
+        """
+        self._rows.extend(zip(log_times, log_items, log_descriptions))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Appends all pending entries to their daily log files.
+
+        Returns:
+            int: Number of entries written.
+        """
+        if not self._rows:
+            return 0
+        rows, self._rows = self._rows, []
+
+        # Group by destination file so each file is opened once per flush
+        rows_by_path: Dict[str, List[Tuple[Any, Any, Any]]] = {}
+        for row in rows:
+            rows_by_path.setdefault(get_log_path(row[0], self.log_dir), []).append(row)
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        with _write_lock:
+            for log_path, path_rows in rows_by_path.items():
+                write_header = not os.path.exists(log_path) or os.path.getsize(log_path) == 0
+                with open(log_path, 'a', newline='') as file:
+                    writer = csv.writer(file)
+                    if write_header:
+                        writer.writerow(LOG_COLUMNS)
+                    writer.writerows(path_rows)
+        self.written += len(rows)
+        return len(rows)
+
+    def close(self) -> None:
+        """Flushes pending entries and reports how many the buffer wrote in total."""
+        self.flush()
+        print(f"Appended {self.written} new log entries to {self.log_dir}/")
+
+    def __enter__(self) -> 'LogBuffer':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
 def create_and_combine_logs(
     log_times: List[str],
     log_items: List[str],
     log_descriptions: List[str]
 ) -> None:
     """
-    Combines new log entries with existing log file and saves them as a CSV.
+    Appends new log entries to the daily log CSV, without reading existing logs.
 
     Args:
         log_times (List[str]): List of timestamps.
         log_items (List[str]): List of item labels.
         log_descriptions (List[str]): List of log descriptions.
     """
-    log_path = os.path.join("logs", "amp_extract_logs.csv")
-
-    # Create new log DataFrame
-    log_df = pd.DataFrame({
-        'log_time': log_times,
-        'log_item': log_items,
-        'log_description': log_descriptions
-    })
-
-    # Load existing logs if present
-    if os.path.exists(log_path) and os.path.getsize(log_path) > 0:
-        existing_log_df = pd.read_csv(log_path)
-    else:
-        existing_log_df = pd.DataFrame()
-
-    # Combine new logs with existing
-    combined_log_df = pd.concat([existing_log_df, log_df], ignore_index=True)
-
-    # Save combined logs to file
-    combined_log_df.to_csv(log_path, index=False)
-    print(f"Appended new logs to {log_path}")
+    with LogBuffer(batch_size=len(log_times) + 1) as log_buffer:
+        log_buffer.extend(log_times, log_items, log_descriptions)
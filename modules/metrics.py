@@ -0,0 +1,264 @@
+"""
+Per-run timing and throughput metrics.
+
+A single `RunMetrics` object is passed through the pipeline stages, which record
+stage and shard timers, byte and event counters, retry counts and gauges on it.
+At the end of a run it is written out as a JSON run summary and, optionally, as
+a Prometheus textfile (for node_exporter's textfile collector). Together these
+show which stage was the bottleneck on each hourly run.
+
+All methods are thread-safe.
+"""
+
+import datetime as dt
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+
+def peak_rss_bytes(children: bool = False) -> int:
+    """
+    Returns the peak resident set size of this process so far.
+
+    Args:
+        children (bool): Report the largest terminated child process instead, e.g. a
+            parse worker, whose memory `RUSAGE_SELF` does not include.
+
+    Returns:
+        int: Peak RSS in bytes, or 0 where the platform does not report it.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class RunMetrics:
+    """
+    Collects timers, counters and gauges for one pipeline run.
+    """
+
+    def __init__(self, run_id: Optional[str] = None, labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        Args:
+            run_id (Optional[str]): Identifier for the run. Defaults to the start time.
+            labels (Optional[Dict[str, str]]): Labels added to the summary and to every
+                Prometheus sample, e.g. `{'project': 'web'}` for per-project metrics.
+        """
+        self.started_at = dt.datetime.now()
+        self.run_id = run_id or self.started_at.strftime(r'%Y%m%dT%H%M%S')
+        self.labels = dict(labels or {})
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.timers: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Records one duration under a timer.
+
+        Args:
+            name (str): Timer name, e.g. 'stage.extract' or 'extract.shard'.
+            seconds (float): Duration to record.
+        """
+        with self._lock:
+            timer = self.timers.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            timer['count'] += 1
+            timer['total_seconds'] += seconds
+            timer['max_seconds'] = max(timer['max_seconds'], seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """
+        Times the enclosed block under `name`.
+
+        Args:
+            name (str): Timer name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): Counter name, e.g. 'bytes_downloaded'.
+            value (float): Amount to add.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """
+        Sets a gauge to its current value.
+
+        Args:
+            name (str): Gauge name.
+            value (float): Current value.
+        """
+        with self._lock:
+            self.gauges[name] = value
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns the run summary.
+
+        Returns:
+            Dict[str, Any]: Run id, start/finish times, duration, timers, counters,
+                gauges and peak RSS of this process and of its children.
+        """
+        with self._lock:
+            return {
+                'run_id': self.run_id,
+                'labels': dict(self.labels),
+                'started_at': self.started_at.isoformat(),
+                'finished_at': dt.datetime.now().isoformat(),
+                'duration_seconds': time.perf_counter() - self._start,
+                'peak_rss_bytes': peak_rss_bytes(),
+                'peak_rss_children_bytes': peak_rss_bytes(children=True),
+                'timers': {name: dict(timer) for name, timer in self.timers.items()},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+    def write_json(self, path: Optional[str] = None) -> str:
+        """
+        Writes the run summary as JSON.
+
+        Args:
+            path (Optional[str]): Output path. Defaults to `logs/amp_run_summary_<run_id>.json`.
+
+        Returns:
+            str: Path written.
+        """
+        path = path or os.path.join('logs', f'amp_run_summary_{self.run_id}.json')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+        print(f'Run summary written to {path}')
+        return path
+
+    def write_prometheus_textfile(self, path: str, prefix: str = 'amp_pipeline') -> str:
+        """
+        Writes the run summary in Prometheus text exposition format. The file is
+        replaced atomically so a collector never reads a partial file.
+
+        Args:
+            path (str): Output path, typically `<textfile dir>/amp_pipeline.prom`.
+            prefix (str): Metric name prefix.
+
+        Returns:
+            str: Path written.
+        """
+        summary = self.summary()
+
+        def metric_name(name: str) -> str:
+            return prefix + '_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+        label_set = ''
+        if self.labels:
+            escaped = {key: str(value).replace('\\', '\\\\').replace('"', '\\"') for key, value in self.labels.items()}
+            label_set = '{' + ','.join(f'{key}="{value}"' for key, value in escaped.items()) + '}'
+        lines = [
+            f'{prefix}_run_duration_seconds{label_set} {summary["duration_seconds"]:.6f}',
+            f'{prefix}_peak_rss_bytes{label_set} {summary["peak_rss_bytes"]}',
+            f'{prefix}_peak_rss_children_bytes{label_set} {summary["peak_rss_children_bytes"]}',
+            f'{prefix}_last_run_timestamp_seconds{label_set} {time.time():.0f}',
+        ]
+        for name, timer in sorted(summary['timers'].items()):
+            lines.append(f'{metric_name(name)}_seconds_total{label_set} {timer["total_seconds"]:.6f}')
+            lines.append(f'{metric_name(name)}_seconds_max{label_set} {timer["max_seconds"]:.6f}')
+            lines.append(f'{metric_name(name)}_count{label_set} {timer["count"]}')
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f'{metric_name(name)}_total{label_set} {value}')
+        for name, value in sorted(summary['gauges'].items()):
+            lines.append(f'{metric_name(name)}{label_set} {value}')
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+        print(f'Prometheus metrics written to {path}')
+        return path
+
+
+class CountingReader:
+    """
+    Wraps a readable binary stream and counts the bytes (and optionally lines)
+    read through it. Counts are kept locally and added to the `RunMetrics`
+    counters once, when the reader is closed, so hot read loops take no locks.
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        metrics: Optional[RunMetrics],
+        bytes_counter: str,
+        lines_counter: Optional[str] = None
+    ) -> None:
+        """
+        Args:
+            stream (BinaryIO): Stream to wrap.
+            metrics (Optional[RunMetrics]): Metrics to record into; None disables recording.
+            bytes_counter (str): Counter receiving the number of bytes read.
+            lines_counter (Optional[str]): Counter receiving the number of newlines read.
+        """
+        self.stream = stream
+        self.metrics = metrics
+        self.bytes_counter = bytes_counter
+        self.lines_counter = lines_counter
+        self.bytes = 0
+        self.lines = 0
+        self._closed = False
+
+    def _count(self, data: bytes) -> bytes:
+        self.bytes += len(data)
+        if self.lines_counter:
+            self.lines += data.count(b'\n')
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        return self._count(self.stream.read(size))
+
+    def readline(self, size: int = -1) -> bytes:
+        return self._count(self.stream.readline(size))
+
+    def __iter__(self) -> 'CountingReader':
+        return self
+
+    def __next__(self) -> bytes:
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def __enter__(self) -> 'CountingReader':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Closes the wrapped stream and records the counts."""
+        if self._closed:
+            return
+        self._closed = True
+        self.stream.close()
+        if self.metrics is not None:
+            self.metrics.increment(self.bytes_counter, self.bytes)
+            if self.lines_counter:
+                self.metrics.increment(self.lines_counter, self.lines)
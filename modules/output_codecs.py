@@ -0,0 +1,181 @@
+"""
+Output codecs for Amplitude event files.
+
+Amplitude delivers each hour as gzipped NDJSON. Rather than always inflating it to
+raw `.json`, the parse and upload stages can keep it gzipped (passthrough) or
+recompress it with zstd. The key suffix and S3 `Content-Encoding` follow the codec,
+so Snowflake's `COMPRESSION = AUTO` can read the objects directly.
+
+Codecs:
+- 'none': decompress to `.json`
+- 'gzip': pass the original gzip bytes through as `.json.gz`
+- 'zstd': recompress as `.json.zst` (requires the optional `zstandard` package)
+"""
+
+import gzip
+import io
+from typing import BinaryIO, Dict
+
+OUTPUT_CODECS = {
+    'none': {'suffix': '', 'content_encoding': None},
+    'gzip': {'suffix': '.gz', 'content_encoding': 'gzip'},
+    'zstd': {'suffix': '.zst', 'content_encoding': 'zstd'},
+}
+
+
+def check_codec(codec: str) -> None:
+    """
+    Validates a codec name, and that its optional dependency is installed.
+
+    Args:
+        codec (str): One of 'none', 'gzip' or 'zstd'.
+
+    Raises:
+        ValueError: If the codec is unknown.
+        ImportError: If 'zstd' is requested without `zstandard` installed.
+    """
+    if codec not in OUTPUT_CODECS:
+        raise ValueError(f"Unknown output codec '{codec}', expected one of {list(OUTPUT_CODECS)}")
+    if codec == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError as err:
+            raise ImportError("The 'zstd' output codec requires `pip install zstandard`") from err
+
+
+def encoded_filename(json_filename: str, codec: str) -> str:
+    """
+    Returns the output filename for a decompressed `.json` name under a codec.
+
+    Args:
+        json_filename (str): Filename without the `.gz` extension.
+        codec (str): Output codec.
+
+    Returns:
+        str: Filename with the codec's suffix.
+    """
+    return json_filename + OUTPUT_CODECS[codec]['suffix']
+
+
+def encode_stream(gz_stream: BinaryIO, codec: str, zstd_level: int = 3) -> BinaryIO:
+    """
+    Wraps a readable stream of gzipped NDJSON so that reading it yields the bytes
+    for the chosen codec. Nothing is buffered beyond each read.
+
+    Args:
+        gz_stream (BinaryIO): Readable stream of the original `.gz` bytes.
+        codec (str): Output codec.
+        zstd_level (int): Compression level for 'zstd'.
+
+    Returns:
+        BinaryIO: Readable stream of encoded bytes.
+    """
+    check_codec(codec)
+    if codec == 'gzip':
+        return gz_stream
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=zstd_level).stream_reader(gzip.GzipFile(fileobj=gz_stream, mode='rb'))
+    return gzip.GzipFile(fileobj=gz_stream, mode='rb')
+
+
+def codec_from_filename(filename: str) -> str:
+    """
+    Infers the output codec of an event file from its suffix.
+
+    Args:
+        filename (str): File name or path.
+
+    Returns:
+        str: 'gzip', 'zstd' or 'none'.
+    """
+    for codec in ('gzip', 'zstd'):
+        if filename.endswith(OUTPUT_CODECS[codec]['suffix']):
+            return codec
+    return 'none'
+
+
+def open_decoded(path: str, codec: str) -> BinaryIO:
+    """
+    Opens an event file for reading its decompressed NDJSON bytes.
+
+    Args:
+        path (str): File path.
+        codec (str): Codec the file was written with.
+
+    Returns:
+        BinaryIO: Readable stream of NDJSON bytes.
+    """
+    check_codec(codec)
+    if codec == 'gzip':
+        return gzip.open(path, 'rb')
+    if codec == 'zstd':
+        import zstandard
+        # Buffered so callers can iterate the stream line by line
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')))
+    return open(path, 'rb')
+
+
+def decode_stream(stream: BinaryIO, codec: str) -> BinaryIO:
+    """
+    Wraps a readable stream of encoded event data (e.g. an S3 object body) so that
+    reading it yields the decompressed NDJSON bytes.
+
+    Args:
+        stream (BinaryIO): Readable stream in the given codec.
+        codec (str): Codec the data was written with.
+
+    Returns:
+        BinaryIO: Readable stream of NDJSON bytes.
+    """
+    check_codec(codec)
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+    return stream
+
+
+def open_encoded_writer(path: str, codec: str, zstd_level: int = 3, gzip_level: int = 6) -> BinaryIO:
+    """
+    Opens an event file for writing NDJSON bytes in the given codec.
+
+    Args:
+        path (str): File path.
+        codec (str): Output codec.
+        zstd_level (int): Compression level for 'zstd'.
+        gzip_level (int): Compression level for 'gzip'. `gzip.open` alone would use 9,
+            which is several times slower than 6 for a few percent smaller output.
+
+    Returns:
+        BinaryIO: Writable stream that encodes on write.
+    """
+    check_codec(codec)
+    if codec == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=gzip_level)
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=zstd_level).stream_writer(open(path, 'wb'))
+    return open(path, 'wb')
+
+
+def get_upload_extra_args(key: str) -> Dict[str, str]:
+    """
+    Returns S3 `ExtraArgs` (content type and encoding) matching an object key.
+
+    Args:
+        key (str): S3 object key.
+
+    Returns:
+        Dict[str, str]: ExtraArgs for `upload_file`/`upload_fileobj`, empty for
+            files that are not event data.
+    """
+    for codec in ('gzip', 'zstd'):
+        if key.endswith('.json' + OUTPUT_CODECS[codec]['suffix']):
+            return {'ContentType': 'application/json', 'ContentEncoding': OUTPUT_CODECS[codec]['content_encoding']}
+    if key.endswith('.json'):
+        return {'ContentType': 'application/json'}
+    if key.endswith('.parquet'):
+        return {'ContentType': 'application/vnd.apache.parquet'}
+    return {}
@@ -0,0 +1,198 @@
+"""
+Convert Amplitude NDJSON event files to partitioned Parquet.
+
+Events are stream-parsed line by line and buffered in bounded-size record batches.
+Each batch is written to a Parquet file partitioned by event date and hour
+(`dt=YYYY-MM-DD/hour=HH/`). Core event fields get a stable, typed schema, with
+Amplitude's times as UTC timestamps. Nested property objects are kept as JSON
+strings, and any other top-level fields go into an `extra` JSON column so nothing
+is dropped; a time that does not parse is kept there too, as sent. Lines that are
+not JSON objects are skipped and handed to `on_bad_line` (e.g. a quarantine file)
+instead of failing the whole file.
+
+Requires the optional `pyarrow` package.
+"""
+
+import datetime as dt
+import os
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+from . import fast_json
+
+# Core Amplitude fields and their Parquet types ('int', 'timestamp' or 'string')
+CORE_FIELDS = {
+    'uuid': 'string',
+    'event_id': 'int',
+    'session_id': 'int',
+    'event_type': 'string',
+    'event_time': 'timestamp',
+    'server_upload_time': 'timestamp',
+    'client_event_time': 'timestamp',
+    'user_id': 'string',
+    'device_id': 'string',
+    'amplitude_id': 'int',
+    'platform': 'string',
+    'os_name': 'string',
+    'os_version': 'string',
+    'device_type': 'string',
+    'device_family': 'string',
+    'country': 'string',
+    'region': 'string',
+    'city': 'string',
+    'ip_address': 'string',
+    'language': 'string',
+}
+# Nested objects stored as JSON strings
+JSON_FIELDS = ['event_properties', 'user_properties', 'group_properties', 'groups', 'data']
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError("Parquet output requires `pip install pyarrow`") from err
+    return pyarrow, pyarrow.parquet
+
+
+def get_event_schema():
+    """
+    Returns the stable Arrow schema used for every event Parquet file.
+
+    Returns:
+        pyarrow.Schema: Core fields, JSON string fields and `extra`.
+    """
+    pa, _ = _require_pyarrow()
+    types = {'int': pa.int64(), 'timestamp': pa.timestamp('us', tz='UTC'), 'string': pa.string()}
+    fields = [pa.field(name, types[kind]) for name, kind in CORE_FIELDS.items()]
+    fields += [pa.field(name, pa.string()) for name in JSON_FIELDS]
+    fields.append(pa.field('extra', pa.string()))
+    return pa.schema(fields)
+
+
+def _to_int(value: Any) -> Any:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_timestamp(value: Any) -> Optional[dt.datetime]:
+    # Amplitude sends UTC times as 'YYYY-MM-DD HH:MM:SS.ffffff'
+    try:
+        return dt.datetime.fromisoformat(value).replace(tzinfo=dt.timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+def event_to_row(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flattens one Amplitude event into a row matching `get_event_schema()`.
+
+    Args:
+        event (Dict[str, Any]): Parsed event.
+
+    Returns:
+        Dict[str, Any]: Row with typed core fields and JSON string columns. A time
+            that does not parse is null, with the value as sent kept in `extra`.
+    """
+    row = {}
+    extra = {}
+    for name, kind in CORE_FIELDS.items():
+        value = event.get(name)
+        if kind == 'int':
+            row[name] = _to_int(value)
+        elif kind == 'timestamp':
+            row[name] = _to_timestamp(value)
+            if row[name] is None and value is not None:
+                extra[name] = value
+        else:
+            row[name] = None if value is None else str(value)
+    for name in JSON_FIELDS:
+        value = event.get(name)
+        row[name] = None if value is None else fast_json.dumps(value).decode()
+    extra.update((k, v) for k, v in event.items() if k not in CORE_FIELDS and k not in JSON_FIELDS)
+    row['extra'] = fast_json.dumps(extra).decode() if extra else None
+    return row
+
+
+def event_partition(event_time: Any) -> str:
+    """
+    Returns the Hive-style partition path for an Amplitude `event_time`.
+
+    Args:
+        event_time (Any): Timestamp such as '2025-07-10 13:45:12.123000'.
+
+    Returns:
+        str: 'dt=YYYY-MM-DD/hour=HH', or 'dt=unknown/hour=unknown' if unparseable.
+    """
+    if isinstance(event_time, str) and len(event_time) >= 13 and event_time[4] == '-':
+        return f'dt={event_time[:10]}/hour={event_time[11:13]}'
+    return 'dt=unknown/hour=unknown'
+
+
+def convert_ndjson_to_parquet(
+    ndjson_file: BinaryIO,
+    output_dir: str,
+    file_stem: str,
+    batch_size: int = 50000,
+    compression: str = 'snappy',
+    on_bad_line: Optional[Callable[[int, bytes, str], None]] = None
+) -> List[str]:
+    """
+    Stream-converts an NDJSON event stream to Parquet files partitioned by event
+    date and hour. At most `batch_size` rows are held in memory per partition.
+
+    Args:
+        ndjson_file (BinaryIO): Readable, decompressed NDJSON stream.
+        output_dir (str): Root directory for the partitioned output.
+        file_stem (str): Base filename (without extension) for the Parquet files.
+        batch_size (int): Rows buffered per partition before a record batch is written.
+        compression (str): Parquet compression codec.
+        on_bad_line (Optional[Callable[[int, bytes, str], None]]): Called with the line
+            number, line and reason ('invalid_json' or 'not_an_object') of each skipped
+            line, e.g. `EventValidator.quarantine`.
+
+    Returns:
+        List[str]: Paths of the Parquet files written.
+    """
+    pa, pq = _require_pyarrow()
+    schema = get_event_schema()
+    buffers: Dict[str, List[Dict[str, Any]]] = {}
+    writers: Dict[str, Any] = {}
+    paths: Dict[str, str] = {}
+
+    def flush(partition: str) -> None:
+        rows = buffers.pop(partition, [])
+        if not rows:
+            return
+        if partition not in writers:
+            partition_dir = os.path.join(output_dir, *partition.split('/'))
+            os.makedirs(partition_dir, exist_ok=True)
+            paths[partition] = os.path.join(partition_dir, file_stem + '.parquet')
+            writers[partition] = pq.ParquetWriter(paths[partition], schema, compression=compression)
+        writers[partition].write_table(pa.Table.from_pylist(rows, schema=schema))
+
+    try:
+        for line_number, line in enumerate(ndjson_file, 1):
+            if not line.strip():
+                continue
+            try:
+                event = fast_json.loads(line)
+                reason = None if isinstance(event, dict) else 'not_an_object'
+            except ValueError:
+                reason = 'invalid_json'
+            if reason is not None:
+                if on_bad_line is not None:
+                    on_bad_line(line_number, line, reason)
+                continue
+            partition = event_partition(event.get('event_time'))
+            buffers.setdefault(partition, []).append(event_to_row(event))
+            if len(buffers[partition]) >= batch_size:
+                flush(partition)
+        for partition in list(buffers):
+            flush(partition)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return sorted(paths.values())
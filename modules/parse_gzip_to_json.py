@@ -1,92 +1,492 @@
 """
 Parse and extract Amplitude Export API gzip files.
 
-This script unzips and decompresses the `.zip` and `.gz` files downloaded from
-Amplitude's Export API, places them into a structured `data/` directory,
+This script decompresses the hourly `.gz` members of the `.zip` files downloaded
+from Amplitude's Export API, places them into a structured `data/` directory,
 and optionally removes the original zip files after extraction.
+
+Members are read straight out of each zip (no temporary extraction), and are
+spread across a process pool so that large backfills use every core. Results and
+log records are merged in (zip, member) order, so output is deterministic.
+
+With `output_format='parquet'` the NDJSON events are instead converted to Parquet
+files partitioned by event date and hour under `data/` (see `parquet_writer`).
+With `fan_out`, each event is split into `data/events/`, `data/event_properties/`
+and `data/user_properties/` files (see `fanout_events`).
 """
 
 import datetime as dt
+import multiprocessing
 import os
-import time  # for waiting and retrying
-import zipfile
+import time
 import gzip
+import zipfile
 import shutil
-import tempfile
-from typing import List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from . import logginghelper as lgs
+from . import output_codecs as codecs
+from . import parquet_writer as pqw
+from .checkpoint import RunCheckpoint
+from .disk_budget import DiskBudget
+from .fanout_events import FANOUT_TABLES, EventFanout, get_property_cache
+from .metrics import CountingReader, RunMetrics
+from .validate_events import VALIDATION_DIR, EventValidator, SchemaTracker, skip_lines
+
+
+def parse_member(
+    filepathzip: str,
+    member: str,
+    data_dir: str = 'data',
+    output_codec: str = 'none',
+    zstd_level: int = 3,
+    gzip_level: int = 6,
+    output_format: str = 'json',
+    parquet_batch_size: int = 50000,
+    validate: bool = False,
+    fan_out: bool = False
+) -> Dict[str, Any]:
+    """
+    Decompresses one hourly `.gz` member of an Export API zip into `data_dir`.
+    Runs in a worker process, so it records counts in its result instead of a
+    `RunMetrics` object.
+
+    Args:
+        filepathzip (str): Path of the zip file.
+        member (str): Name of the `.gz` member inside the zip.
+        data_dir (str): Output directory.
+        output_codec (str): Output codec for JSON output.
+        zstd_level (int): Compression level when `output_codec` is 'zstd'.
+        gzip_level (int): Compression level when 'gzip' output is re-encoded (validation, fan-out).
+        output_format (str): 'json' or 'parquet'.
+        parquet_batch_size (int): Rows per Parquet record batch.
+        validate (bool): Check every event (see `validate_events`), leaving invalid lines
+            out of the output and writing them to a quarantine file. With 'gzip'/'zstd'
+            output the member is decompressed once to validate it, and passed through as
+            before unless some lines must be left out.
+        fan_out (bool): Split each event into event, event property and user property
+            files under `data_dir/<table>/` (JSON output only, see `fanout_events`).
+            Tables left with no rows get no file.
+
+    Returns:
+        Dict[str, Any]: Result with keys `member`, `outputs` (paths written),
+            `bytes_compressed`, `bytes_decompressed`, `bytes_written`, `events`
+            (decompressed counts are 0 when the data was passed through unvalidated),
+            `seconds`, `validation` (None, or `valid`, `quarantined`, `quarantine_path`
+            and `schema`), `fanout` (None, or `rows` by table and `blobs_skipped`) and
+            `logs`, a (log_times, log_items, log_descriptions) tuple.
+    """
+    started = time.perf_counter()
+    log_times: List[dt.datetime] = []
+    log_items: List[str] = []
+    log_descriptions: List[str] = []
+    log_descriptions_dict, _ = lgs.get_log_descs_and_items_dict()
+
+    json_filename = os.path.basename(member)[:-3]  # Remove .gz extension
+    outputs = []
+    counted = None
+    validator = None
+    fanout = None
+    quarantine_path = os.path.join(VALIDATION_DIR, os.path.splitext(json_filename)[0] + '.quarantine.jsonl')
+    if validate:
+        validator = EventValidator(member, quarantine_path)
+
+    with zipfile.ZipFile(filepathzip, 'r') as zip_ref:
+        bytes_compressed = zip_ref.getinfo(member).file_size
+
+        def open_lines() -> CountingReader:
+            # Decompressed NDJSON of the member, with bytes and lines counted
+            return CountingReader(
+                gzip.GzipFile(fileobj=zip_ref.open(member), mode='rb'), None, 'parse.bytes_decompressed', 'parse.events'
+            )
+
+        try:
+            if output_format == 'parquet':
+                # Stream-parse NDJSON into date/hour partitioned Parquet
+                file_stem = os.path.splitext(json_filename)[0]
+                # Lines that are not JSON objects are quarantined even without validation
+                quarantine = validator if validator is not None else EventValidator(member, quarantine_path)
+                try:
+                    with open_lines() as counted:
+                        lines = validator.filter_lines(counted) if validator is not None else counted
+                        outputs = pqw.convert_ndjson_to_parquet(
+                            lines, data_dir, file_stem, parquet_batch_size, on_bad_line=quarantine.quarantine
+                        )
+                finally:
+                    quarantine.close()
+                if quarantine is not validator and quarantine.quarantined:
+                    print(f'Skipped {quarantine.quarantined} unreadable lines of {member}, see {quarantine_path}')
+                for parquet_path in outputs:
+                    log_times.append(dt.datetime.now())
+                    log_items.append(parquet_path)
+                    log_descriptions.append(log_descriptions_dict['create'])
+            elif fan_out:
+                # Split each event into the normalized tables, one file per table
+                filename = codecs.encoded_filename(json_filename, output_codec)
+                table_paths = {table: os.path.join(data_dir, table, filename) for table in FANOUT_TABLES}
+                with ExitStack() as stack:
+                    writers = {}
+                    for table, path in table_paths.items():
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        writers[table] = stack.enter_context(codecs.open_encoded_writer(path, output_codec, zstd_level, gzip_level))
+                    fanout = EventFanout(writers, get_property_cache(os.path.abspath(data_dir)))
+                    counted = stack.enter_context(open_lines())
+                    fanout.write_lines(validator.filter_lines(counted) if validator is not None else counted)
+                # Every table file is closed, so later members may skip the blobs written here
+                fanout.commit()
+                for table, path in table_paths.items():
+                    if not fanout.rows[table]:
+                        os.remove(path)
+                        continue
+                    outputs.append(path)
+                    log_times.append(dt.datetime.now())
+                    log_items.append(path)
+                    log_descriptions.append(log_descriptions_dict['create'])
+            else:
+                output_path = os.path.join(data_dir, codecs.encoded_filename(json_filename, output_codec))
+
+                if validator is not None and output_codec == 'none':
+                    # Validate while writing the decompressed NDJSON
+                    with open_lines() as counted, open(output_path, 'wb') as out_file:
+                        for line in validator.filter_lines(counted):
+                            out_file.write(line)
+                elif validator is not None:
+                    # Validate first, then pass the original bytes through if every line is good
+                    with open_lines() as counted:
+                        for _ in validator.filter_lines(counted):
+                            pass
+                    if validator.bad_lines:
+                        with gzip.GzipFile(fileobj=zip_ref.open(member), mode='rb') as lines_file, \
+                                codecs.open_encoded_writer(output_path, output_codec, zstd_level, gzip_level) as out_file:
+                            for line in skip_lines(lines_file, validator.bad_lines):
+                                out_file.write(line)
+
+                if validator is None or (output_codec != 'none' and not validator.bad_lines):
+                    # Extract .gz to JSON in the chosen output codec
+                    with zip_ref.open(member) as raw_file, \
+                            codecs.encode_stream(raw_file, output_codec, zstd_level) as gz_file, \
+                            open(output_path, 'wb') as out_file:
+                        if output_codec == 'none':
+                            # Output is the decompressed NDJSON, so bytes and events can be counted
+                            with CountingReader(gz_file, None, 'parse.bytes_decompressed', 'parse.events') as counted:
+                                shutil.copyfileobj(counted, out_file)
+                        else:
+                            shutil.copyfileobj(gz_file, out_file)
+                log_times.append(dt.datetime.now())
+                log_items.append(output_path)
+                log_descriptions.append(log_descriptions_dict['copy'])
+                outputs = [output_path]
+        finally:
+            if validator is not None:
+                validator.close()
+
+    validation = None
+    if validator is not None:
+        validation = {
+            'valid': validator.valid,
+            'quarantined': validator.quarantined,
+            'quarantine_path': validator.quarantine_path,
+            'schema': validator.schema_summary(),
+        }
+    return {
+        'member': member,
+        'outputs': outputs,
+        'bytes_compressed': bytes_compressed,
+        'bytes_decompressed': counted.bytes if counted is not None else 0,
+        'bytes_written': sum(os.path.getsize(path) for path in outputs),
+        'events': counted.lines if counted is not None else 0,
+        'seconds': time.perf_counter() - started,
+        'validation': validation,
+        'fanout': {'rows': fanout.rows, 'blobs_skipped': fanout.blobs_skipped} if fanout is not None else None,
+        'logs': (log_times, log_items, log_descriptions),
+    }
+
+
+def _parse_member_task(args: Tuple[Any, ...]) -> Dict[str, Any]:
+    return parse_member(*args)
+
+
+def _get_mp_context() -> multiprocessing.context.BaseContext:
+    # Fork where available: workers start fast and do not re-import the calling script
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+
+def create_parse_executor(parse_workers: Optional[int] = None) -> Optional[ProcessPoolExecutor]:
+    """
+    Creates the process pool members are parsed on, with its workers already started.
+    Starting them up front means they are forked before the caller starts any other
+    threads, so no thread can be holding a lock at fork time.
+
+    Args:
+        parse_workers (Optional[int]): Worker processes. Defaults to the number of CPUs.
+
+    Returns:
+        Optional[ProcessPoolExecutor]: The pool, or None when a single worker is
+            needed (members are then parsed in this process).
+    """
+    workers = max(1, parse_workers or os.cpu_count() or 1)
+    if workers == 1:
+        return None
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=_get_mp_context())
+    executor.submit(os.getpid).result()
+    return executor
+
+
+def _budgeted_map(
+    tasks: List[Tuple[Any, ...]],
+    executor: Optional[ProcessPoolExecutor],
+    disk_budget: DiskBudget,
+    max_in_flight: int
+) -> Iterator[Dict[str, Any]]:
+    # Starts each member only once the disk budget allows, yielding results in task order
+    in_flight: deque = deque()
+    for task in tasks:
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+        disk_budget.wait_for_parse()
+        if executor is None:
+            yield _parse_member_task(task)
+        else:
+            in_flight.append(executor.submit(_parse_member_task, task))
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def _record_member_metrics(result: Dict[str, Any], metrics: Optional[RunMetrics]) -> None:
+    if metrics is None:
+        return
+    metrics.observe('parse.member', result['seconds'])
+    metrics.increment('parse.bytes_compressed', result['bytes_compressed'])
+    metrics.increment('parse.bytes_written', result['bytes_written'])
+    if result['bytes_decompressed']:
+        metrics.increment('parse.bytes_decompressed', result['bytes_decompressed'])
+        metrics.increment('parse.events', result['events'])
+    if result['validation'] is not None:
+        metrics.increment('validate.events_valid', result['validation']['valid'])
+        metrics.increment('validate.events_quarantined', result['validation']['quarantined'])
+    if result['fanout'] is not None:
+        for table, rows in result['fanout']['rows'].items():
+            metrics.increment(f'fanout.{table}_rows', rows)
+        metrics.increment('fanout.blobs_skipped', result['fanout']['blobs_skipped'])
+
+
+def parse_zip_file(
+    filepathzip: str,
+    data_dir: str = 'data',
+    output_codec: str = 'none',
+    zstd_level: int = 3,
+    gzip_level: int = 6,
+    output_format: str = 'json',
+    parquet_batch_size: int = 50000,
+    metrics: Optional[RunMetrics] = None,
+    executor: Optional[ProcessPoolExecutor] = None,
+    checkpoint: Optional[RunCheckpoint] = None,
+    schema_tracker: Optional[SchemaTracker] = None,
+    fan_out: bool = False,
+    on_member: Optional[Callable[[Dict[str, Any]], None]] = None,
+    disk_budget: Optional[DiskBudget] = None,
+    parse_workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Parses every `.gz` member of a single zip into `data_dir`, on `executor` if given.
+    Used by the pipelined runner, which parses each zip as soon as it is downloaded.
+    The zip itself is left in place.
+
+    Args:
+        filepathzip (str): Path of the zip file.
+        data_dir (str): Output directory.
+        output_codec (str): Output codec for JSON output.
+        zstd_level (int): Compression level when `output_codec` is 'zstd'.
+        gzip_level (int): Compression level when 'gzip' output is re-encoded (validation, fan-out).
+        output_format (str): 'json' or 'parquet'.
+        parquet_batch_size (int): Rows per Parquet record batch.
+        metrics (Optional[RunMetrics]): Receives the `parse.member` timer and byte/event counters.
+        executor (Optional[ProcessPoolExecutor]): Pool shared across zips. None parses
+            in this process.
+        checkpoint (Optional[RunCheckpoint]): Run journal. Members already parsed are
+            skipped (their journaled outputs are still returned), and parsed members are recorded.
+        schema_tracker (Optional[SchemaTracker]): If given, events are validated (see
+            `parse_member`) and each member's results are added to it.
+        fan_out (bool): Split events into normalized table files (see `parse_member`).
+        on_member (Optional[Callable[[Dict[str, Any]], None]]): Called with each newly
+            parsed member's result (see `parse_member`), in member order, as soon as it
+            is journaled, so its outputs can be uploaded before the rest of the zip.
+        disk_budget (Optional[DiskBudget]): If given, each member starts only once the
+            budget allows (see `DiskBudget.wait_for_parse`), with at most `parse_workers`
+            members in flight.
+        parse_workers (Optional[int]): Worker count of `executor`. Defaults to the number of CPUs.
+
+    Returns:
+        Dict[str, Any]: `outputs` (paths written, journaled ones first) and `logs`, a
+            (log_times, log_items, log_descriptions) tuple.
+    """
+    log_times: List[dt.datetime] = []
+    log_items: List[str] = []
+    log_descriptions: List[str] = []
+    log_descriptions_dict, _ = lgs.get_log_descs_and_items_dict()
+
+    with zipfile.ZipFile(filepathzip, 'r') as zip_ref:
+        members = sorted(name for name in zip_ref.namelist() if name.endswith('.gz'))
+    log_times.append(dt.datetime.now())
+    log_items.append(filepathzip)
+    log_descriptions.append(log_descriptions_dict['extract'])
+
+    outputs = []
+    tasks = []
+    for member in members:
+        if checkpoint is not None and checkpoint.parse_done(filepathzip, member):
+            outputs.extend(checkpoint.get('parse', f'{filepathzip}:{member}')['outputs'])
+        else:
+            tasks.append((
+                filepathzip, member, data_dir, output_codec, zstd_level, gzip_level, output_format, parquet_batch_size,
+                schema_tracker is not None, fan_out
+            ))
+    if disk_budget is not None:
+        max_in_flight = 1 if executor is None else max(1, parse_workers or os.cpu_count() or 1)
+        results = _budgeted_map(tasks, executor, disk_budget, max_in_flight)
+    elif executor is None:
+        results = map(_parse_member_task, tasks)
+    else:
+        results = executor.map(_parse_member_task, tasks, chunksize=1)
+
+    for result in results:
+        if checkpoint is not None:
+            checkpoint.record('parse', f"{filepathzip}:{result['member']}", outputs=result['outputs'])
+        member_times, member_items, member_descriptions = result['logs']
+        log_times.extend(member_times)
+        log_items.extend(member_items)
+        log_descriptions.extend(member_descriptions)
+        _record_member_metrics(result, metrics)
+        if schema_tracker is not None:
+            schema_tracker.add(result['validation'])
+        outputs.extend(result['outputs'])
+        if on_member is not None:
+            on_member(result)
+    return {'outputs': outputs, 'logs': (log_times, log_items, log_descriptions)}
 
 
-def parse_gzip_amplitude(delete_zip: bool = True) -> None:
+def parse_gzip_amplitude(
+    delete_zip: bool = True,
+    output_codec: str = 'none',
+    zstd_level: int = 3,
+    gzip_level: int = 6,
+    output_format: str = 'json',
+    parquet_batch_size: int = 50000,
+    metrics: Optional[RunMetrics] = None,
+    parse_workers: Optional[int] = None,
+    checkpoint: Optional[RunCheckpoint] = None,
+    schema_tracker: Optional[SchemaTracker] = None,
+    fan_out: bool = False,
+    zip_dir: str = 'datazip',
+    data_dir: str = 'data'
+) -> None:
     """
     Parses `.zip` and `.gz` files from Amplitude Export API, extracts JSON content,
-    and writes to the `data/` folder. Tracks and logs each file operation.
+    and writes to the `data/` folder. Every `.gz` member of every zip (whatever day
+    folder it sits in) is parsed, on a process pool. Tracks and logs each file operation.
 
     Args:
         delete_zip (bool): Whether to delete zip files after extraction. Defaults to True.
+        output_codec (str): 'none' writes raw `.json`, 'gzip' keeps the original
+            `.json.gz`, 'zstd' recompresses to `.json.zst`. Defaults to 'none'.
+        zstd_level (int): Compression level when `output_codec` is 'zstd'. Defaults to 3.
+        gzip_level (int): Compression level when 'gzip' output is re-encoded (validation,
+            fan-out) rather than passed through. Defaults to 6.
+        output_format (str): 'json' writes one NDJSON file per `.gz`; 'parquet' writes
+            Parquet partitioned by event date/hour (`output_codec` is then ignored).
+            Defaults to 'json'.
+        parquet_batch_size (int): Rows per Parquet record batch. Defaults to 50000.
+        metrics (Optional[RunMetrics]): Receives the `parse.member` timer and byte/event
+            counters. Events are only counted when the data is decompressed (codec
+            'none' or Parquet output).
+        parse_workers (Optional[int]): Processes decompressing members in parallel.
+            Defaults to the number of CPUs; 1 parses in this process.
+        checkpoint (Optional[RunCheckpoint]): Run journal. Members whose outputs are
+            still on disk or already uploaded are not parsed again, and parsed members
+            are recorded as they finish.
+        schema_tracker (Optional[SchemaTracker]): If given, events are validated as they
+            are decompressed (invalid lines are quarantined) and their schema is collected
+            for the drift report.
+        fan_out (bool): Split each event into `data/events/`, `data/event_properties/`
+            and `data/user_properties/` files, writing each distinct property blob
+            once (see `fanout_events`). JSON output only. Defaults to False.
+        zip_dir (str): Directory holding the downloaded zips. Defaults to 'datazip'.
+        data_dir (str): Output directory. Defaults to 'data'.
     """
-    # Static config
-    url = r'https://analytics.eu.amplitude.com/api/2/export'
-    start_current_day = dt.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if output_format not in ('json', 'parquet'):
+        raise ValueError(f"Unknown output_format '{output_format}', expected 'json' or 'parquet'")
+    if fan_out and output_format != 'json':
+        raise ValueError('Fan-out writes NDJSON tables and requires JSON output')
+    codecs.check_codec(output_codec)
 
     # Directory setup
-    directoryzip = 'datazip/'
-    data_dir = 'data'
+    directoryzip = os.path.join(zip_dir, '')
     os.makedirs("logs", exist_ok=True)
     os.makedirs(data_dir, exist_ok=True)
     os.makedirs(directoryzip, exist_ok=True)
 
-    # Load logging helper metadata
-    log_times: List[dt.datetime] = []
-    log_items: List[str] = []
-    log_descriptions: List[str] = []
+    # Entries are written in batches as members finish, not held until the end
+    log_buffer = lgs.LogBuffer()
     log_descriptions_dict, log_items_dict = lgs.get_log_descs_and_items_dict()
 
-    # Create a temporary directory for unzip/extraction
-    temp_dir = tempfile.mkdtemp()
-
-    # Process each ZIP file
-    filenameszip = os.listdir(directoryzip)
+    # List every .gz member of every zip, in a fixed order
+    # Skip `.part` files left by interrupted streaming downloads
+    filenameszip = sorted(f for f in os.listdir(directoryzip) if f.endswith('.zip'))
+    tasks = []
+    members_per_zip: Dict[str, int] = {}
     for filenamezip in filenameszip:
         filepathzip = os.path.join(directoryzip, filenamezip)
-
-        # Extract ZIP into temp dir
         with zipfile.ZipFile(filepathzip, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-            log_times.append(dt.datetime.now())
-            log_items.append(filepathzip)
-            log_descriptions.append(log_descriptions_dict['extract'])
-
-        # Assume first-level folder represents the date
-        day_folder = os.listdir(temp_dir)[0]
-        day_path = os.path.join(temp_dir, day_folder)
-
-        # Walk through folder, process all .gz files
-        for root, _, files in os.walk(day_path):
-            for file in files:
-                if file.endswith('.gz'):
-                    print(file)
-                    gz_path = os.path.join(root, file)
-                    json_filename = file[:-3]  # Remove .gz extension
-                    output_path = os.path.join(data_dir, json_filename)
-
-                    # Extract .gz to JSON
-                    with gzip.open(gz_path, 'rb') as gz_file, open(output_path, 'wb') as out_file:
-                        shutil.copyfileobj(gz_file, out_file)
-                        log_times.append(dt.datetime.now())
-                        log_items.append(output_path)
-                        log_descriptions.append(log_descriptions_dict['copy'])
-
-        # Optionally delete original zip
-        if delete_zip:
-            print('Removing temporary zip file')
+            members = sorted(name for name in zip_ref.namelist() if name.endswith('.gz'))
+        if checkpoint is not None:
+            members = [member for member in members if not checkpoint.parse_done(filepathzip, member)]
+        members_per_zip[filepathzip] = len(members)
+        log_buffer.add(filepathzip, log_descriptions_dict['extract'])
+        for member in members:
+            tasks.append((
+                filepathzip, member, data_dir, output_codec, zstd_level, gzip_level, output_format, parquet_batch_size,
+                schema_tracker is not None, fan_out
+            ))
+        if delete_zip and not members:
+            # Nothing to parse, so the zip can go straight away
             os.remove(filepathzip)
-            log_times.append(dt.datetime.now())
-            log_items.append(filepathzip)
-            log_descriptions.append(log_descriptions_dict['delete'])
+            log_buffer.add(filepathzip, log_descriptions_dict['delete'])
+
+    # Decompress members across processes; map yields results in task order
+    workers = max(1, min(parse_workers or os.cpu_count() or 1, len(tasks)))
+    print(f'Parsing {len(tasks)} files from {len(filenameszip)} zips with {workers} processes')
+    executor = create_parse_executor(workers)
+    if executor is None:
+        results = map(_parse_member_task, tasks)
+    else:
+        results = executor.map(_parse_member_task, tasks, chunksize=1)
+
+    try:
+        remaining = dict(members_per_zip)
+        for (filepathzip, *_), result in zip(tasks, results):
+            print(os.path.basename(result['member']))
+            if checkpoint is not None:
+                checkpoint.record('parse', f"{filepathzip}:{result['member']}", outputs=result['outputs'])
+            log_buffer.extend(*result['logs'])
+            _record_member_metrics(result, metrics)
+            if schema_tracker is not None:
+                schema_tracker.add(result['validation'])
+            remaining[filepathzip] -= 1
 
-    # Persist logs to disk
-    lgs.create_and_combine_logs(log_times, log_items, log_descriptions)
+            # Optionally delete original zip once all of its members are written
+            if delete_zip and remaining[filepathzip] == 0:
+                print('Removing temporary zip file')
+                os.remove(filepathzip)
+                log_buffer.add(filepathzip, log_descriptions_dict['delete'])
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        # Persist the rest of the logs, including those of members parsed before any failure
+        log_buffer.close()
 
 
 if __name__ == '__main__':
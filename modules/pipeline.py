@@ -0,0 +1,430 @@
+"""
+Pipelined extract -> parse -> upload runner.
+
+The sequential steps in `main.py` wait for every shard to download before parsing
+anything, and for every file to parse before uploading anything, so a run takes
+the sum of the three stages. Here each stage runs on its own thread(s) and hands
+work on through bounded queues:
+
+    download pool --(zip queue)--> parse thread --(upload queue)--> upload thread
+
+A shard is parsed as soon as its zip lands, and each of its members is queued
+for upload as soon as it is parsed, so wall-clock time approaches that of the
+slowest stage. The upload thread takes the parsed files waiting (up to one per
+upload worker) as one batch, with one manifest lookup and one concurrent
+`upload_files` call for the lot. When a stage falls behind, its input queue fills
+and the stage feeding it blocks (backpressure), so at most `queue_size` zips and
+`upload_workers` parsed members wait between stages at any time. With
+`max_local_bytes`, a `DiskBudget` also caps the bytes held on local disk:
+downloads and parsing wait while uploads drain.
+
+With `streaming=True` (JSON output only) there is no parse stage: upload threads
+stream zip members straight to S3, as `stream_zip_to_s3` does. Up to `queue_size`
+zips stream at once, sharing a pool of `upload_workers` member uploads. Streamed
+members are not checked against the upload manifest (`skip_unchanged`), since
+there is no local file to hash.
+
+Only zips downloaded by the run itself are processed. A zip whose files did not
+all upload is kept, and its hours are not marked complete, so the next run
+downloads them again.
+"""
+
+import datetime as dt
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+from . import logginghelper as lgs
+from . import output_codecs as codecs
+from .checkpoint import RunCheckpoint
+from .disk_budget import DiskBudget
+from .extract_amplitude_files import extract_gzip_amplitude
+from .http_client import HttpClient
+from .load_data_to_s3 import build_transfer_config, data_file_key, upload_files
+from .metrics import RunMetrics
+from .parse_gzip_to_json import create_parse_executor, parse_zip_file
+from .s3_layout import check_key_layout
+from .stream_zip_to_s3 import stream_zip_file_to_s3
+from .validate_events import SchemaTracker
+
+if TYPE_CHECKING:
+    from boto3.s3.transfer import TransferConfig
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+def run_pipeline(
+    daydiffs: List[int],
+    wait_time: int,
+    total_wait_time: int,
+    api_keys: Dict[str, str],
+    s3filepath_base: str,
+    s3_api_keys: Dict[str, str],
+    shard_hours: int = 24,
+    max_workers: int = 1,
+    max_requests_per_second: Optional[float] = None,
+    adaptive_rate_limit: bool = True,
+    completed_hours: Optional[Set[str]] = None,
+    availability_lag_hours: Optional[int] = None,
+    streaming: bool = False,
+    output_codec: str = 'none',
+    zstd_level: int = 3,
+    gzip_level: int = 6,
+    output_format: str = 'json',
+    parse_workers: Optional[int] = None,
+    upload_workers: int = 16,
+    transfer_config: Optional['TransferConfig'] = None,
+    key_layout: str = 'flat',
+    skip_unchanged: bool = False,
+    manifest_s3_key: Optional[str] = None,
+    delete_zip: bool = True,
+    queue_size: int = 2,
+    metrics: Optional[RunMetrics] = None,
+    url: Optional[str] = None,
+    checkpoint: Optional[RunCheckpoint] = None,
+    schema_tracker: Optional[SchemaTracker] = None,
+    fan_out: bool = False,
+    max_local_bytes: Optional[int] = None,
+    zip_dir: str = 'datazip',
+    data_dir: str = 'data',
+    manifest_path: Optional[str] = None,
+    manifest_retain_days: Optional[int] = None,
+    executor: Optional[ProcessPoolExecutor] = None,
+    on_plan: Optional[Callable[[List[Tuple[dt.datetime, dt.datetime]]], None]] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    http_client: Optional[HttpClient] = None
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Extracts, parses and uploads shards with the three stages overlapped.
+
+    Args:
+        daydiffs (List[int]): How many days back to extract (0 is today).
+        wait_time (int): Initial retry delay in seconds.
+        total_wait_time (int): Maximum total retry wait per shard in seconds.
+        api_keys (Dict[str, str]): Amplitude API credentials.
+        s3filepath_base (str): Base path in the S3 bucket to upload the files.
+        s3_api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
+            - 'Access_key_ID'
+            - 'Secret_access_key'
+            - 'AWS_BUCKET_NAME'
+        shard_hours (int): Hours per request shard (1-24).
+        max_workers (int): Shards downloaded at the same time.
+        max_requests_per_second (Optional[float]): Cap on request starts per second.
+        adaptive_rate_limit (bool): Adapt concurrency and rate to throttling.
+        completed_hours (Optional[Set[str]]): Hours (`%Y%m%dT%H`) already ingested.
+        availability_lag_hours (Optional[int]): Skip hours Amplitude has not exported yet.
+        streaming (bool): Stream zip members straight to S3 instead of parsing to `data_dir`.
+            Requires JSON output.
+        output_codec (str): 'none', 'gzip' or 'zstd'.
+        zstd_level (int): Compression level when `output_codec` is 'zstd'.
+        gzip_level (int): Compression level when 'gzip' output is re-encoded rather than passed through.
+        output_format (str): 'json' or 'parquet'.
+        parse_workers (Optional[int]): Processes decompressing members. Defaults to one per CPU.
+        upload_workers (int): Files uploaded at the same time, and the most parsed files
+            uploaded as one batch.
+        transfer_config (Optional[TransferConfig]): Multipart settings shared by all uploads.
+        key_layout (str): 'flat' or 'hive', see `s3_layout`.
+        skip_unchanged (bool): Skip files already in S3 with identical content (not streaming).
+        manifest_s3_key (Optional[str]): Key the upload manifest is synced to.
+        delete_zip (bool): Delete each zip once all its files are uploaded.
+        queue_size (int): Zips allowed to wait between the download and parse stages.
+        metrics (Optional[RunMetrics]): Receives the usual stage timers and counters, plus
+            `pipeline.*_blocked` timers (time a stage waited on a full queue),
+            `pipeline.*_queue_max` gauges and, with `max_local_bytes`, the `disk.*` metrics.
+        url (Optional[str]): Export API endpoint. Defaults to the endpoint of
+            `api_keys['AMP_DATA_REGION']`.
+        checkpoint (Optional[RunCheckpoint]): Run journal shared by all stages, so a rerun
+            after a crash skips shards, members and files that were already done.
+        schema_tracker (Optional[SchemaTracker]): If given, the parse stage validates events
+            and collects their schema (not available with `streaming`).
+        fan_out (bool): Split events into normalized table files in the parse stage, see
+            `fanout_events` (JSON output, not available with `streaming`).
+        max_local_bytes (Optional[int]): Cap on bytes of zips and parsed files held on
+            local disk, see `disk_budget`. Downloads and parsing wait near the cap until
+            uploads have drained files. None leaves disk use bounded only by the queues.
+        zip_dir (str): Directory the zips are downloaded to. Defaults to 'datazip'.
+        data_dir (str): Directory parsed files are written to. Defaults to 'data'.
+        manifest_path (Optional[str]): Local path of the upload manifest. Defaults to
+            `upload_manifest.MANIFEST_PATH`.
+        manifest_retain_days (Optional[int]): Days of event dates kept in the upload
+            manifest (see `UploadManifest`). None keeps every entry.
+        executor (Optional[ProcessPoolExecutor]): Parse process pool to use (see `create_parse_executor`),
+            e.g. one shared by several pipelines. It is left running. Defaults to a pool
+            owned by this run.
+        on_plan (Optional[Callable]): Called with the planned shards before any download.
+        on_result (Optional[Callable]): Called from the download threads with each shard
+            result (see `extract_shard`) once the shard is downloaded.
+        http_client (Optional[HttpClient]): Pooled client for Export API requests, see
+            `http_client`. Defaults to the process-wide client.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[str]]: Shard results (see `extract_shard`), and
+            the files (or `zip:member` names) that failed to upload.
+
+    Raises:
+        Exception: The first error raised by the parse or upload stage, once all
+            stages have stopped.
+    """
+    codecs.check_codec(output_codec)
+    check_key_layout(key_layout)
+    if output_format not in ('json', 'parquet'):
+        raise ValueError(f"Unknown output_format '{output_format}', expected 'json' or 'parquet'")
+    if streaming and output_format != 'json':
+        raise ValueError('Streaming uploads only support JSON output')
+    if streaming and schema_tracker is not None:
+        raise ValueError('Events are validated in the parse stage, which streaming uploads skip')
+    if fan_out and (streaming or output_format != 'json'):
+        raise ValueError('Fan-out runs in the parse stage and requires JSON output without streaming')
+
+    os.makedirs(data_dir, exist_ok=True)
+    log_descriptions_dict, _ = lgs.get_log_descs_and_items_dict()
+
+    manifest = None
+    if skip_unchanged and not streaming:
+        from .upload_manifest import MANIFEST_PATH, UploadManifest
+
+        transfer_config = transfer_config or build_transfer_config()
+        manifest = UploadManifest(
+            s3_api_keys, manifest_path=manifest_path or MANIFEST_PATH, s3_key=manifest_s3_key,
+            retain_days=manifest_retain_days
+        )
+
+    zip_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    # Room for a full upload batch, so the upload thread always has one file per worker ready
+    upload_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size, upload_workers))
+    queue_max = {'zip': 0, 'upload': 0}
+    errors: List[BaseException] = []
+    disk_budget = DiskBudget(max_local_bytes, metrics) if max_local_bytes else None
+    # Bytes of each zip counted against the disk budget, and files of each zip that failed to upload
+    zip_bytes: Dict[str, int] = {}
+    zip_failed: Dict[str, List[str]] = {}
+    # Parse logs wait for their zip to finish uploading; each finished zip's logs are
+    # then written in batches by the upload thread(s), one zip at a time
+    parse_logs: Dict[str, Tuple[list, list, list]] = {}
+    log_buffer = lgs.LogBuffer()
+    finish_lock = threading.Lock()
+    upload_results: List[Dict[str, Any]] = []
+    failed_uploads: List[str] = []
+
+    def put(stage_queue: queue.Queue, item: Any, name: str) -> None:
+        # Blocks while the next stage is behind; the wait is the backpressure
+        started = time.perf_counter()
+        stage_queue.put(item)
+        if metrics is not None:
+            metrics.observe(f'pipeline.{name}_blocked', time.perf_counter() - started)
+        queue_max[name] = max(queue_max[name], stage_queue.qsize())
+
+    def fail(err: BaseException) -> None:
+        errors.append(err)
+        # Nothing will be released any more, so nothing may wait for disk
+        if disk_budget is not None:
+            disk_budget.close()
+
+    def enqueue_shard(result: Dict[str, Any]) -> None:
+        if on_result is not None:
+            on_result(result)
+        # Runs on the download threads; failed and empty shards have no zip, and a
+        # resumed shard's zip is gone if it was fully processed before the crash
+        if result['status'] == 'success' and os.path.exists(result['filepath']) and not errors:
+            if disk_budget is not None:
+                zip_bytes[result['filepath']] = os.path.getsize(result['filepath'])
+                disk_budget.add(zip_bytes[result['filepath']])
+            put(zip_queue, result['filepath'], 'zip')
+
+    def finish_zip(filepathzip: str, failed: List[str], logs: Tuple[list, list, list]) -> None:
+        with finish_lock:
+            _finish_zip(filepathzip, failed, logs)
+
+    def _finish_zip(filepathzip: str, failed: List[str], logs: Tuple[list, list, list]) -> None:
+        failed_uploads.extend(failed)
+        # Keep the zip if anything failed so it can be inspected
+        if delete_zip and not failed:
+            os.remove(filepathzip)
+            logs[0].append(dt.datetime.now())
+            logs[1].append(filepathzip)
+            logs[2].append(log_descriptions_dict['delete'])
+        log_buffer.extend(*parse_logs.pop(filepathzip, ([], [], [])))
+        log_buffer.extend(*logs)
+        # A zip kept on disk is no longer counted: this run will not touch it again
+        if disk_budget is not None:
+            disk_budget.release(zip_bytes.pop(filepathzip, 0))
+
+    def parse_stage(executor: Any) -> None:
+        try:
+            while True:
+                filepathzip = zip_queue.get()
+                if filepathzip is _DONE:
+                    break
+                if errors:
+                    # Keep draining so the download threads never block on a dead stage
+                    continue
+                handed_over: Set[str] = set()
+
+                def hand_over(result: Dict[str, Any], filepathzip: str = filepathzip) -> None:
+                    # Each member is uploaded as soon as it is parsed
+                    if disk_budget is not None:
+                        disk_budget.add(result['bytes_written'], pending_upload=True)
+                    handed_over.update(result['outputs'])
+                    put(upload_queue, (filepathzip, result['outputs'], result['bytes_written'], False), 'upload')
+
+                try:
+                    with metrics.timer('pipeline.parse_zip') if metrics is not None else nullcontext():
+                        parsed = parse_zip_file(
+                            filepathzip, data_dir, output_codec, zstd_level, gzip_level, output_format,
+                            metrics=metrics, executor=executor, checkpoint=checkpoint,
+                            schema_tracker=schema_tracker, fan_out=fan_out,
+                            on_member=hand_over, disk_budget=disk_budget, parse_workers=parse_workers
+                        )
+                    parse_logs[filepathzip] = parsed['logs']
+                    # Last item of the zip, with outputs journaled before a crash and not yet uploaded
+                    resumed = [path for path in parsed['outputs'] if path not in handed_over and os.path.exists(path)]
+                    resumed_bytes = sum(os.path.getsize(path) for path in resumed)
+                    if disk_budget is not None:
+                        disk_budget.add(resumed_bytes, pending_upload=True)
+                    put(upload_queue, (filepathzip, resumed, resumed_bytes, True), 'upload')
+                except Exception as err:
+                    fail(err)
+        finally:
+            upload_queue.put(_DONE)
+
+    def upload_batch(items: List[Tuple[str, List[str], int, bool]]) -> None:
+        # One manifest lookup and one upload pool for the members of every queued item
+        zip_of: Dict[str, str] = {}
+        uploads = []
+        for filepathzip, outputs, _, _ in items:
+            zip_failed.setdefault(filepathzip, [])
+            for path in outputs:
+                zip_of[path] = filepathzip
+                uploads.append((path, data_file_key(path, s3filepath_base, data_dir, key_layout)))
+        if checkpoint is not None:
+            uploads = checkpoint.pending_uploads(uploads)
+        if manifest is not None and uploads:
+            uploads, skipped = manifest.filter_unchanged(uploads, transfer_config, upload_workers, metrics)
+            for filepath, s3_path in skipped:
+                if checkpoint is not None:
+                    checkpoint.record('upload', s3_path, filepath=filepath)
+                os.remove(filepath)
+        if uploads:
+            results = upload_files(
+                uploads, s3_api_keys, upload_workers, transfer_config,
+                remove_local=True, metrics=metrics, checkpoint=checkpoint
+            )
+            upload_results.extend(results)
+            for result in results:
+                if result['status'] != 'success':
+                    zip_failed[zip_of[result['filepath']]].append(result['filepath'])
+        for filepathzip, _, nbytes, last in items:
+            # Failed files stay on disk but are no longer counted, so the run cannot stall on them
+            if disk_budget is not None:
+                disk_budget.release(nbytes, pending_upload=True)
+            if last:
+                finish_zip(filepathzip, zip_failed.pop(filepathzip), ([], [], []))
+
+    def upload_stage(input_queue: queue.Queue) -> None:
+        done = False
+        while not done:
+            item = input_queue.get()
+            if item is _DONE:
+                break
+            batch = [item]
+            if not streaming:
+                # Take every member already waiting, up to one file per upload worker
+                files = len(item[1])
+                while files < upload_workers:
+                    try:
+                        item = input_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        done = True
+                        break
+                    batch.append(item)
+                    files += len(item[1])
+            if errors:
+                continue
+            try:
+                with metrics.timer('pipeline.upload_batch') if metrics is not None else nullcontext():
+                    if streaming:
+                        filepathzip = item
+                        result = stream_zip_file_to_s3(
+                            filepathzip, s3filepath_base, s3_api_keys, output_codec, zstd_level,
+                            transfer_config, metrics, key_layout, checkpoint,
+                            max_workers=upload_workers, executor=member_pool
+                        )
+                        finish_zip(filepathzip, result['failed'], result['logs'])
+                    else:
+                        upload_batch(batch)
+            except Exception as err:
+                fail(err)
+
+    # Worker processes are started before any other thread exists
+    owns_executor = executor is None and not streaming
+    if owns_executor:
+        executor = create_parse_executor(parse_workers)
+    member_pool = None
+    if streaming:
+        # Several zips stream at once through one pool of upload_workers threads, so the
+        # pool stays busy across zip boundaries and small zips still fill it
+        member_pool = ThreadPoolExecutor(max_workers=max(1, upload_workers), thread_name_prefix='pipeline-upload-member')
+        threads = [
+            threading.Thread(target=upload_stage, args=(zip_queue,), name=f'pipeline-upload-{n}')
+            for n in range(max(2, queue_size))
+        ]
+    else:
+        threads = [
+            threading.Thread(target=parse_stage, args=(executor,), name='pipeline-parse'),
+            threading.Thread(target=upload_stage, args=(upload_queue,), name='pipeline-upload'),
+        ]
+    for thread in threads:
+        thread.start()
+
+    shard_results: List[Dict[str, Any]] = []
+    try:
+        shard_results = extract_gzip_amplitude(
+            daydiffs, wait_time, total_wait_time, api_keys,
+            shard_hours=shard_hours,
+            max_workers=max_workers,
+            max_requests_per_second=max_requests_per_second,
+            adaptive_rate_limit=adaptive_rate_limit,
+            completed_hours=completed_hours,
+            availability_lag_hours=availability_lag_hours,
+            metrics=metrics,
+            url=url,
+            on_result=enqueue_shard,
+            checkpoint=checkpoint,
+            before_download=disk_budget.wait_for_download if disk_budget is not None else None,
+            zip_dir=zip_dir,
+            on_plan=on_plan,
+            http_client=http_client
+        )
+    finally:
+        # One end marker per thread reading the zip queue
+        for _ in range(len(threads) if streaming else 1):
+            zip_queue.put(_DONE)
+        for thread in threads:
+            thread.join()
+        if member_pool is not None:
+            member_pool.shutdown()
+        if owns_executor and executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+        # Persist the rest of the logs, including those of zips a failure left unfinished
+        for filepathzip in list(parse_logs):
+            log_buffer.extend(*parse_logs.pop(filepathzip))
+        log_buffer.close()
+
+        if metrics is not None:
+            metrics.set_gauge('pipeline.zip_queue_max', queue_max['zip'])
+            metrics.set_gauge('pipeline.upload_queue_max', queue_max['upload'])
+
+    if manifest is not None:
+        manifest.record_uploads(upload_results)
+    if errors:
+        raise errors[0]
+
+    print(f'Pipeline finished: {len(failed_uploads)} files failed to upload')
+    return shard_results, failed_uploads
@@ -0,0 +1,165 @@
+"""
+Several Amplitude projects, in one or more data regions, extracted by one run.
+
+Without `AMP_PROJECTS`, a run extracts the single project configured by
+`AMP_API_KEY`/`AMP_SECRET_KEY`/`AMP_DATA_REGION`, with the local paths and S3 keys
+it has always used. With `AMP_PROJECTS=web,ios`, each named project reads its own
+settings from suffixed variables (the name upper-cased, `-` as `_`):
+
+- `AMP_API_KEY_WEB`, `AMP_SECRET_KEY_WEB`: credentials (required)
+- `AMP_DATA_REGION_WEB`: 'us' or 'eu' (defaults to `AMP_DATA_REGION`, then EU)
+- `AMP_S3_PREFIX_WEB`: S3 prefix of its events (defaults to `<base>/web`)
+
+A named project downloads to `projects/<name>/datazip/`, parses to
+`projects/<name>/data/`, compacts in `projects/<name>/compact_tmp/`, and keeps its
+state, manifest and journal under `logs/<name>/` and `state/<name>/`, so projects
+never see each other's files.
+`run_projects` runs them on a thread pool; each project keeps its own rate limiter
+(Amplitude limits are per API key), while the S3 client and parse processes are
+shared by the caller.
+"""
+
+import os
+import posixpath
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+_PROJECT_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def _env_suffix(name: str) -> str:
+    return name.upper().replace('-', '_')
+
+
+def load_projects(s3filepath_base: str, environ: Optional[Mapping[str, str]] = None) -> List[Dict[str, Any]]:
+    """
+    Reads the projects to extract from the environment.
+
+    Args:
+        s3filepath_base (str): S3 prefix of the single project, and parent prefix of
+            named projects without `AMP_S3_PREFIX_<NAME>`.
+        environ (Optional[Mapping[str, str]]): Variables to read. Defaults to `os.environ`.
+
+    Returns:
+        List[Dict[str, Any]]: One dict per project, with `name` (None for the single
+            unnamed project), `api_keys` (as expected by `extract_gzip_amplitude`),
+            `s3filepath_base`, and its local `zip_dir`, `data_dir` and `compact_dir`.
+
+    Raises:
+        ValueError: If a project name is invalid or repeated, or its keys are missing.
+    """
+    environ = os.environ if environ is None else environ
+    default_region = environ.get('AMP_DATA_REGION')
+    names = [name.strip() for name in environ.get('AMP_PROJECTS', '').split(',') if name.strip()]
+    if not names:
+        return [{
+            'name': None,
+            'api_keys': {
+                'AMP_API_KEY': environ.get('AMP_API_KEY'),
+                'AMP_SECRET_KEY': environ.get('AMP_SECRET_KEY'),
+                'AMP_DATA_REGION': default_region,
+            },
+            's3filepath_base': s3filepath_base,
+            'zip_dir': 'datazip',
+            'data_dir': 'data',
+            'compact_dir': 'compact_tmp',
+        }]
+
+    projects = []
+    suffixes = set()
+    for name in names:
+        if not _PROJECT_NAME.match(name):
+            raise ValueError(f"Invalid project name '{name}', expected letters, digits, '_' or '-'")
+        suffix = _env_suffix(name)
+        if suffix in suffixes:
+            raise ValueError(f"Project '{name}' is listed more than once in AMP_PROJECTS")
+        suffixes.add(suffix)
+
+        api_keys = {
+            'AMP_API_KEY': environ.get(f'AMP_API_KEY_{suffix}'),
+            'AMP_SECRET_KEY': environ.get(f'AMP_SECRET_KEY_{suffix}'),
+            'AMP_DATA_REGION': environ.get(f'AMP_DATA_REGION_{suffix}') or default_region,
+        }
+        if not api_keys['AMP_API_KEY'] or not api_keys['AMP_SECRET_KEY']:
+            raise ValueError(f'Project {name} needs AMP_API_KEY_{suffix} and AMP_SECRET_KEY_{suffix}')
+        projects.append({
+            'name': name,
+            'api_keys': api_keys,
+            's3filepath_base': environ.get(f'AMP_S3_PREFIX_{suffix}') or f'{s3filepath_base}/{name}',
+            'zip_dir': os.path.join('projects', name, 'datazip'),
+            'data_dir': os.path.join('projects', name, 'data'),
+            'compact_dir': os.path.join('projects', name, 'compact_tmp'),
+        })
+    return projects
+
+
+def scoped_path(project: Dict[str, Any], path: str) -> str:
+    """
+    Returns a project's copy of a local path, e.g. `logs/web/amp_extract_state.json`.
+
+    Args:
+        project (Dict[str, Any]): Project, see `load_projects`.
+        path (str): Path used by a single-project run.
+
+    Returns:
+        str: The path itself for the unnamed project, else the path with the project
+            name as an extra directory before the file name.
+    """
+    if project['name'] is None:
+        return path
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, project['name'], filename)
+
+
+def scoped_key(project: Dict[str, Any], key: str) -> str:
+    """
+    Returns a project's copy of an S3 key, e.g. `state/web/amp_extract_state.json`.
+
+    Args:
+        project (Dict[str, Any]): Project, see `load_projects`.
+        key (str): Key used by a single-project run.
+
+    Returns:
+        str: The key itself for the unnamed project, else the key with the project
+            name as an extra prefix level before the file name.
+    """
+    if project['name'] is None:
+        return key
+    prefix, filename = posixpath.split(key)
+    return posixpath.join(prefix, project['name'], filename)
+
+
+def run_projects(
+    projects: List[Dict[str, Any]],
+    run_project: Callable[[Dict[str, Any]], Any],
+    max_concurrent: int = 1
+) -> Dict[Optional[str], Dict[str, Any]]:
+    """
+    Runs every project, several at a time. A project that raises does not stop the
+    others. With one project at a time, projects run in turn in the calling thread.
+
+    Args:
+        projects (List[Dict[str, Any]]): Projects, see `load_projects`.
+        run_project (Callable[[Dict[str, Any]], Any]): Runs one project and returns its result.
+        max_concurrent (int): Projects run at the same time.
+
+    Returns:
+        Dict[Optional[str], Dict[str, Any]]: Per project name, `status` ('success' or
+            'error'), and `result` or `error`.
+    """
+    def run(project: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return {'status': 'success', 'result': run_project(project)}
+        except Exception as err:
+            print(f"Project {project['name']} failed: {err!r}")
+            return {'status': 'error', 'error': err}
+
+    workers = max(1, min(max_concurrent, len(projects)))
+    if workers == 1:
+        # In the main thread, so parse process pools are not forked from a worker thread
+        outcomes = [run(project) for project in projects]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='project') as executor:
+            outcomes = list(executor.map(run, projects))
+    return {project['name']: outcome for project, outcome in zip(projects, outcomes)}
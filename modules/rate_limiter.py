@@ -0,0 +1,187 @@
+"""
+Adaptive rate and concurrency limiting for Export API requests.
+
+`AdaptiveRateLimiter` sits in front of every Export API call. It bounds requests
+in two ways:
+
+- A concurrency limit on requests in flight.
+- A request rate, enforced as a token bucket with a burst of one, i.e. evenly
+  spaced request starts.
+
+Both limits adapt AIMD-style (additive increase, multiplicative decrease), as TCP
+congestion control does:
+
+- Healthy responses grow the concurrency limit by 1/limit per response, and the
+  rate by a tenth of its ceiling.
+- A 429/503, a timeout or dropped connection, or a latency spike (time to response
+  headers several times the running baseline) halves both limits. Local failures
+  (e.g. a full disk while writing the body) are not congestion and change nothing.
+  Only requests started after the last decrease can trigger another, so a burst of
+  concurrent 429s counts as one signal.
+
+Extraction therefore runs close to the account's limit without tripping it.
+"""
+
+import threading
+import time
+from typing import Optional
+from .metrics import RunMetrics
+from .retry import is_transient_error
+
+THROTTLE_STATUSES = frozenset({429, 503})
+
+
+class AdaptiveRateLimiter:
+    """
+    Thread-safe AIMD controller for request concurrency and request rate.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_requests_per_second: Optional[float] = None,
+        min_concurrency: int = 1,
+        min_requests_per_second: float = 0.1,
+        decrease_factor: float = 0.5,
+        latency_spike_factor: float = 3.0,
+        adaptive: bool = True,
+        metrics: Optional[RunMetrics] = None
+    ) -> None:
+        """
+        Args:
+            max_concurrency (int): Ceiling (and starting value) for requests in flight.
+            max_requests_per_second (Optional[float]): Ceiling (and starting value) for
+                request starts per second. None or 0 leaves the rate unlimited.
+            min_concurrency (int): Floor for the concurrency limit.
+            min_requests_per_second (float): Floor for the request rate.
+            decrease_factor (float): Multiplier applied to both limits on a congestion signal.
+            latency_spike_factor (float): Latency above this multiple of the baseline counts
+                as a congestion signal.
+            adaptive (bool): Adjust the limits from responses. False keeps them fixed.
+            metrics (Optional[RunMetrics]): Receives the `extract.in_flight`,
+                `extract.concurrency_limit` and `extract.rate_limit_rps` gauges, and the
+                `extract.throttled`/`extract.rate_decreases` counters.
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.max_rate = max_requests_per_second or None
+        self.min_rate = min(min_requests_per_second, self.max_rate) if self.max_rate else None
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+        self.adaptive = adaptive
+        self.metrics = metrics
+
+        self.concurrency_limit = float(self.max_concurrency)
+        self.rate = self.max_rate
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latency_baseline: Optional[float] = None
+        self._latency_samples = 0
+        self._next_start = 0.0
+        self._last_decrease = float('-inf')
+        self._cond = threading.Condition()
+        self._publish()
+
+    def _publish(self) -> None:
+        # Called with the lock held (or before the limiter is shared)
+        if self.metrics is None:
+            return
+        self.metrics.set_gauge('extract.in_flight', self.in_flight)
+        self.metrics.set_gauge('extract.in_flight_max', self.max_in_flight)
+        self.metrics.set_gauge('extract.concurrency_limit', int(self.concurrency_limit))
+        if self.rate:
+            self.metrics.set_gauge('extract.rate_limit_rps', round(self.rate, 3))
+
+    def acquire(self) -> float:
+        """
+        Blocks until a request slot is free and the request rate allows a start.
+        Every `acquire()` must be paired with a `release()`.
+
+        Returns:
+            float: Monotonic start time of the request, to pass back to `release()`.
+        """
+        with self._cond:
+            while self.in_flight >= int(self.concurrency_limit):
+                self._cond.wait()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+            now = time.monotonic()
+            start = now
+            if self.rate:
+                start = max(now, self._next_start)
+                self._next_start = start + 1.0 / self.rate
+            self._publish()
+        time.sleep(max(0.0, start - now))
+        return start
+
+    def release(
+        self,
+        started: float,
+        status_code: Optional[int] = None,
+        latency: Optional[float] = None,
+        error: Optional[BaseException] = None
+    ) -> None:
+        """
+        Frees the request slot and adapts the limits to how the request went.
+
+        Args:
+            started (float): Start time returned by `acquire()`.
+            status_code (Optional[int]): HTTP status of the response, or None if the
+                request never got one.
+            latency (Optional[float]): Seconds until the response headers arrived.
+            error (Optional[BaseException]): Exception the request ended with, if any. Only
+                timeouts and connection errors (see `retry.is_transient_error`) count as
+                congestion; other errors without a throttling status leave the limits alone.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if self.adaptive:
+                if status_code in THROTTLE_STATUSES or (error is not None and is_transient_error(error)):
+                    if status_code == 429 and self.metrics is not None:
+                        self.metrics.increment('extract.throttled')
+                    self._decrease(started)
+                elif status_code is None:
+                    # Failed before any response for a local reason: no signal either way
+                    pass
+                elif status_code < 400 or status_code == 404:
+                    if latency is not None and self._is_latency_spike(latency):
+                        self._decrease(started)
+                    else:
+                        self._increase(latency)
+            self._publish()
+            self._cond.notify_all()
+
+    def _is_latency_spike(self, latency: float) -> bool:
+        return (
+            self.latency_baseline is not None
+            and self._latency_samples >= 3
+            and latency > self.latency_spike_factor * self.latency_baseline
+        )
+
+    def _increase(self, latency: Optional[float]) -> None:
+        if latency is not None:
+            # Exponentially weighted baseline of healthy latencies
+            if self.latency_baseline is None:
+                self.latency_baseline = latency
+            else:
+                self.latency_baseline = 0.8 * self.latency_baseline + 0.2 * latency
+            self._latency_samples += 1
+        self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1.0 / self.concurrency_limit)
+        if self.rate:
+            self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+    def _decrease(self, started: float) -> None:
+        if started < self._last_decrease:
+            # Sent before the last back-off took effect, so already accounted for
+            return
+        self._last_decrease = time.monotonic()
+        self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * self.decrease_factor)
+        if self.rate:
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        if self.metrics is not None:
+            self.metrics.increment('extract.rate_decreases')
+        print(
+            f'Backing off Export API requests: concurrency {int(self.concurrency_limit)}'
+            + (f', {self.rate:.2f} req/s' if self.rate else '')
+        )
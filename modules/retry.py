@@ -0,0 +1,196 @@
+"""
+Retry scheduling for Export API requests.
+
+`RetryPolicy` decides, after a failed request, whether to try again and how long
+to wait first:
+
+- 400/401/403 (bad window, bad credentials) fail fast, since retrying cannot help.
+- 404 means Amplitude has no data for the window. It is reported as 'no_data'
+  rather than retried.
+- 408/416/429/5xx, timeouts and dropped connections are retried with exponential
+  backoff and jitter, so concurrent shards do not retry in lockstep.
+- A `Retry-After` header on 429/503 is honoured. If it points past the remaining
+  retry budget, the request gives up instead of hammering the API.
+"""
+
+import datetime as dt
+import email.utils
+import random
+import sys
+from typing import Any, Iterable, Optional
+
+FAIL_FAST_STATUSES = frozenset({400, 401, 403})
+NO_DATA_STATUSES = frozenset({404})
+RETRY_STATUSES = frozenset({408, 416, 429, 500, 502, 503, 504})
+
+# Actions returned by RetryPolicy.classify
+RETRY = 'retry'
+FAIL = 'fail'
+NO_DATA = 'no_data'
+
+
+def retry_after_seconds(response: Any) -> Optional[float]:
+    """
+    Reads a `Retry-After` header (delay in seconds or an HTTP date).
+
+    Args:
+        response (Any): HTTP response with a `headers` mapping, or None.
+
+    Returns:
+        Optional[float]: Seconds to wait, or None if the header is absent or invalid.
+    """
+    value = getattr(response, 'headers', {}).get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - dt.datetime.now(dt.timezone.utc)).total_seconds())
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """
+    Returns the HTTP status attached to a request error, if there is one.
+
+    Args:
+        error (BaseException): Exception raised by the request.
+
+    Returns:
+        Optional[int]: Status code, or None if the request never got a response.
+    """
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Returns whether an exception that carries no HTTP status is worth retrying
+    (timeouts, refused or reset connections, truncated bodies).
+
+    Args:
+        error (BaseException): Exception raised by the request.
+
+    Returns:
+        bool: True for network-level failures.
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # Network failures of the optional HTTP/2 client; only loaded if that client was created
+    httpx = sys.modules.get('httpx')
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    import requests
+
+    return isinstance(error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+    ))
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter, bounded by a total wait budget and an
+    optional attempt cap, with per-status retry rules.
+    """
+
+    def __init__(
+        self,
+        base_delay: float = 2.0,
+        max_delay: float = 60.0,
+        max_elapsed: float = 300.0,
+        max_attempts: Optional[int] = None,
+        multiplier: float = 2.0,
+        jitter: float = 0.5,
+        retry_statuses: Iterable[int] = RETRY_STATUSES,
+        fail_fast_statuses: Iterable[int] = FAIL_FAST_STATUSES,
+        no_data_statuses: Iterable[int] = NO_DATA_STATUSES
+    ) -> None:
+        """
+        Args:
+            base_delay (float): Delay before the first retry, in seconds.
+            max_delay (float): Cap on a single backoff delay (not on `Retry-After`).
+            max_elapsed (float): Total seconds a request may spend waiting between attempts.
+            max_attempts (Optional[int]): Cap on attempts. None means the wait budget is the only limit.
+            multiplier (float): Growth factor of the delay per attempt.
+            jitter (float): Fraction of each delay randomised (0 disables jitter, 1 is full jitter).
+            retry_statuses (Iterable[int]): HTTP statuses that are retried.
+            fail_fast_statuses (Iterable[int]): HTTP statuses that are never retried.
+            no_data_statuses (Iterable[int]): HTTP statuses meaning the window has no data.
+        """
+        if not 0 <= jitter <= 1:
+            raise ValueError('jitter must be between 0 and 1')
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+        self.max_attempts = max_attempts
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.fail_fast_statuses = frozenset(fail_fast_statuses)
+        self.no_data_statuses = frozenset(no_data_statuses)
+
+    def classify(self, error: BaseException) -> str:
+        """
+        Decides what to do about a failed request.
+
+        Args:
+            error (BaseException): Exception raised by the request.
+
+        Returns:
+            str: `RETRY`, `FAIL` or `NO_DATA`.
+        """
+        status = error_status(error)
+        if status is None:
+            return RETRY if is_transient_error(error) else FAIL
+        if status in self.no_data_statuses:
+            return NO_DATA
+        if status in self.fail_fast_statuses:
+            return FAIL
+        if status in self.retry_statuses or status >= 500:
+            return RETRY
+        return FAIL
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Returns the jittered backoff delay after the given attempt.
+
+        Args:
+            attempt (int): Number of attempts made so far (1 after the first failure).
+
+        Returns:
+            float: Delay in seconds.
+        """
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** max(0, attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def next_delay(self, error: BaseException, attempt: int, waited: float) -> Optional[float]:
+        """
+        Returns how long to wait before retrying, or None to give up.
+
+        Args:
+            error (BaseException): Exception raised by the last attempt.
+            attempt (int): Number of attempts made so far.
+            waited (float): Seconds already spent waiting between attempts.
+
+        Returns:
+            Optional[float]: Seconds to sleep before the next attempt, or None if the
+                error is not retryable or the attempt/wait budget is spent.
+        """
+        if self.classify(error) != RETRY:
+            return None
+        if self.max_attempts is not None and attempt >= self.max_attempts:
+            return None
+        remaining = self.max_elapsed - waited
+        if remaining <= 0:
+            return None
+
+        retry_after = retry_after_seconds(getattr(error, 'response', None))
+        if retry_after is not None:
+            # The server said when to come back; waiting less would just be rejected again
+            return retry_after if retry_after <= remaining else None
+        return min(self.backoff(attempt), remaining)
@@ -0,0 +1,81 @@
+"""
+S3 key layout for event files.
+
+Amplitude names each hourly file `<project>_<YYYY-MM-DD>_<H>#<n>.json.gz`. With the
+'flat' layout every file is uploaded directly under the base prefix. With 'hive'
+it goes under `dt=YYYY-MM-DD/hour=HH/`, matching the Parquet partitions, so
+warehouse loads and the compaction job can list a single day or hour instead of
+the whole prefix.
+"""
+
+import re
+from typing import Optional, Tuple
+
+KEY_LAYOUTS = ('flat', 'hive')
+
+_EXPORT_FILENAME = re.compile(r'_(\d{4}-\d{2}-\d{2})_(\d{1,2})#')
+
+
+def check_key_layout(key_layout: str) -> None:
+    """
+    Validates a key layout name.
+
+    Args:
+        key_layout (str): 'flat' or 'hive'.
+
+    Raises:
+        ValueError: If the layout is unknown.
+    """
+    if key_layout not in KEY_LAYOUTS:
+        raise ValueError(f"Unknown key layout '{key_layout}', expected one of {list(KEY_LAYOUTS)}")
+
+
+def export_file_hour(filename: str) -> Optional[Tuple[str, int]]:
+    """
+    Reads the event date and hour from an Export API file name.
+
+    Args:
+        filename (str): File name such as '123456_2025-07-10_13#0.json.gz'.
+
+    Returns:
+        Optional[Tuple[str, int]]: ('YYYY-MM-DD', hour), or None if the name does not match.
+    """
+    match = _EXPORT_FILENAME.search(filename)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def hour_partition(day: str, hour: int) -> str:
+    """
+    Returns the Hive-style partition path for a day and hour.
+
+    Args:
+        day (str): 'YYYY-MM-DD'.
+        hour (int): Hour of the day.
+
+    Returns:
+        str: 'dt=YYYY-MM-DD/hour=HH'.
+    """
+    return f'dt={day}/hour={hour:02d}'
+
+
+def event_file_key(s3filepath_base: str, filename: str, key_layout: str = 'flat') -> str:
+    """
+    Returns the S3 key of an hourly event file under the chosen layout.
+
+    Args:
+        s3filepath_base (str): Base path in the bucket.
+        filename (str): Output file name.
+        key_layout (str): 'flat' or 'hive'.
+
+    Returns:
+        str: S3 key. Files whose name carries no date go to 'dt=unknown/hour=unknown'
+            under the 'hive' layout.
+    """
+    check_key_layout(key_layout)
+    if key_layout == 'flat':
+        return s3filepath_base + '/' + filename
+    day_hour = export_file_hour(filename)
+    partition = hour_partition(*day_hour) if day_hour else 'dt=unknown/hour=unknown'
+    return f'{s3filepath_base}/{partition}/{filename}'
@@ -0,0 +1,222 @@
+"""
+State store for incremental Amplitude extraction.
+
+Keeps a small JSON manifest of the (start, end) hour shards that have been fully
+ingested, so hourly runs only request hours that have not been loaded yet. The
+manifest lives under `logs/` and can be synced to and from S3 so that ephemeral
+containers share the same high-water mark.
+"""
+
+import datetime as dt
+import json
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .load_data_to_s3 import get_s3_client
+
+STATE_PATH = os.path.join('logs', 'amp_extract_state.json')
+HOUR_FORMAT = r'%Y%m%dT%H'
+# Hours after its end that an empty (404) shard is trusted to stay empty
+NO_DATA_SETTLE_HOURS = 24
+
+
+def load_state(state_path: str = STATE_PATH) -> Dict[str, Any]:
+    """
+    Loads the state manifest, returning an empty state if none exists yet.
+
+    Args:
+        state_path (str): Local path of the JSON manifest.
+
+    Returns:
+        Dict[str, Any]: State with a `completed_shards` list of
+            {'start', 'end', 'completed_at'} entries.
+    """
+    if not os.path.exists(state_path) or os.path.getsize(state_path) == 0:
+        return {'completed_shards': []}
+    with open(state_path, 'r') as file:
+        return json.load(file)
+
+
+def save_state(state: Dict[str, Any], state_path: str = STATE_PATH) -> None:
+    """
+    Writes the state manifest atomically (temp file + rename).
+
+    Args:
+        state (Dict[str, Any]): State to persist.
+        state_path (str): Local path of the JSON manifest.
+    """
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(state, file, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def shard_hours(start: str, end: str) -> List[str]:
+    """
+    Expands an inclusive (start, end) shard into its individual hours.
+
+    Args:
+        start (str): First hour, formatted `%Y%m%dT%H`.
+        end (str): Last hour (inclusive), formatted `%Y%m%dT%H`.
+
+    Returns:
+        List[str]: Every hour in the shard, formatted `%Y%m%dT%H`.
+    """
+    current = dt.datetime.strptime(start, HOUR_FORMAT)
+    last = dt.datetime.strptime(end, HOUR_FORMAT)
+    hours = []
+    while current <= last:
+        hours.append(dt.datetime.strftime(current, HOUR_FORMAT))
+        current += dt.timedelta(hours=1)
+    return hours
+
+
+def get_completed_hours(state: Dict[str, Any]) -> Set[str]:
+    """
+    Returns the set of hours already ingested according to the state.
+
+    Args:
+        state (Dict[str, Any]): State as returned by `load_state`.
+
+    Returns:
+        Set[str]: Completed hours, formatted `%Y%m%dT%H`.
+    """
+    completed_hours = set()
+    for shard in state.get('completed_shards', []):
+        completed_hours.update(shard_hours(shard['start'], shard['end']))
+    return completed_hours
+
+
+def _merge_shards(shards: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Merges overlapping or back-to-back shards into single ranges.
+
+    Args:
+        shards (List[Dict[str, str]]): {'start', 'end', 'completed_at'} entries.
+
+    Returns:
+        List[Dict[str, str]]: Merged entries sorted by start, each keeping its latest `completed_at`.
+    """
+    merged: List[Dict[str, str]] = []
+    for shard in sorted(shards, key=lambda shard: shard['start']):
+        if merged:
+            last = merged[-1]
+            next_hour = dt.datetime.strptime(last['end'], HOUR_FORMAT) + dt.timedelta(hours=1)
+            if shard['start'] <= dt.datetime.strftime(next_hour, HOUR_FORMAT):
+                last['end'] = max(last['end'], shard['end'])
+                last['completed_at'] = max(last['completed_at'], shard['completed_at'])
+                continue
+        merged.append(dict(shard))
+    return merged
+
+
+def mark_shards_completed(
+    shards: List[Tuple[str, str]],
+    state_path: str = STATE_PATH,
+    retain_hours: Optional[int] = None,
+    now: Optional[dt.datetime] = None
+) -> None:
+    """
+    Records shards as fully ingested.
+
+    Contiguous shards are merged into one range, and ranges that ended more than
+    `retain_hours` ago are dropped, so the manifest stays small however many runs
+    have recorded into it.
+
+    Args:
+        shards (List[Tuple[str, str]]): (start, end) hours, formatted `%Y%m%dT%H`.
+        state_path (str): Local path of the JSON manifest.
+        retain_hours (Optional[int]): Hours back that runs can still request. None keeps everything.
+        now (Optional[dt.datetime]): Current time. Defaults to now.
+    """
+    if not shards:
+        return
+    now = now or dt.datetime.now()
+    state = load_state(state_path)
+    completed_at = now.isoformat()
+    for start, end in shards:
+        state['completed_shards'].append({'start': start, 'end': end, 'completed_at': completed_at})
+    if retain_hours is not None:
+        oldest = dt.datetime.strftime(now - dt.timedelta(hours=retain_hours), HOUR_FORMAT)
+        state['completed_shards'] = [shard for shard in state['completed_shards'] if shard['end'] >= oldest]
+    state['completed_shards'] = _merge_shards(state['completed_shards'])
+    save_state(state, state_path)
+    print(f'Marked {len(shards)} shards as completed in {state_path}')
+
+
+def completed_shards(
+    shard_results: List[Dict[str, Any]],
+    no_data_settle_hours: int = NO_DATA_SETTLE_HOURS,
+    now: Optional[dt.datetime] = None
+) -> List[Tuple[str, str]]:
+    """
+    Picks the shards of a run that can be recorded as ingested.
+
+    A 404 ('no_data') only means nothing was exported yet: an hour answered early,
+    or while Amplitude is behind, can gain events later. Such shards are recorded
+    only once they ended `no_data_settle_hours` ago, so later runs ask again until then.
+
+    Args:
+        shard_results (List[Dict[str, Any]]): Shard results, see `extract_shard`.
+        no_data_settle_hours (int): Hours after its end that an empty shard is final.
+        now (Optional[dt.datetime]): Current time. Defaults to now.
+
+    Returns:
+        List[Tuple[str, str]]: (start, end) of each shard to pass to `mark_shards_completed`.
+    """
+    settled_before = (now or dt.datetime.now()) - dt.timedelta(hours=no_data_settle_hours)
+    shards = []
+    for result in shard_results:
+        end_of_shard = dt.datetime.strptime(result['end'], HOUR_FORMAT) + dt.timedelta(hours=1)
+        if result['status'] == 'success' or (result['status'] == 'no_data' and end_of_shard <= settled_before):
+            shards.append((result['start'], result['end']))
+    return shards
+
+
+def download_state_from_s3(s3_key: str, api_keys: Dict[str, str], state_path: str = STATE_PATH) -> bool:
+    """
+    Fetches the state manifest from S3, replacing the local copy.
+
+    Args:
+        s3_key (str): Key of the manifest in the bucket.
+        api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
+            - 'Access_key_ID'
+            - 'Secret_access_key'
+            - 'AWS_BUCKET_NAME'
+        state_path (str): Local path of the JSON manifest.
+
+    Returns:
+        bool: True if a manifest was downloaded, False if none exists in the bucket.
+    """
+    from botocore.exceptions import ClientError
+
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    s3_client = get_s3_client(api_keys)
+    try:
+        s3_client.download_file(api_keys['AWS_BUCKET_NAME'], s3_key, state_path)
+        print(f'Downloaded state from {s3_key}')
+        return True
+    except ClientError as err:
+        print(f'No state downloaded from {s3_key}: {err}')
+        return False
+
+
+def upload_state_to_s3(s3_key: str, api_keys: Dict[str, str], state_path: str = STATE_PATH) -> None:
+    """
+    Uploads the local state manifest to S3.
+
+    Args:
+        s3_key (str): Key of the manifest in the bucket.
+        api_keys (Dict[str, str]): Dictionary of AWS credentials (see `download_state_from_s3`).
+        state_path (str): Local path of the JSON manifest.
+    """
+    from botocore.exceptions import ClientError
+
+    if not os.path.exists(state_path):
+        return
+    s3_client = get_s3_client(api_keys)
+    try:
+        s3_client.upload_file(Filename=state_path, Bucket=api_keys['AWS_BUCKET_NAME'], Key=s3_key)
+        print(f'Uploaded state to {s3_key}')
+    except ClientError as err:
+        print(f'State upload failed: {err}')
@@ -0,0 +1,214 @@
+"""
+Streaming parse-and-upload for Amplitude Export API zip files.
+
+Instead of extracting each zip to a temp directory, decompressing every `.gz`
+into `data/` and re-reading those files for upload, each zip member is opened
+with `ZipFile.open`, optionally decompressed on the fly, and sent straight to S3
+as a multipart upload. Nothing but the downloaded zip touches local disk. The
+members of a zip upload concurrently on a bounded thread pool, each read through
+its own handle on the zip.
+"""
+
+import datetime as dt
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from . import logginghelper as lgs
+from . import output_codecs as codecs
+from .checkpoint import RunCheckpoint
+from .load_data_to_s3 import build_transfer_config, get_s3_client
+from .metrics import CountingReader, RunMetrics
+from .s3_layout import check_key_layout, event_file_key
+
+if TYPE_CHECKING:
+    from boto3.s3.transfer import TransferConfig
+
+
+def stream_zip_file_to_s3(
+    filepathzip: str,
+    s3filepath_base: str,
+    api_keys: Dict[str, str],
+    output_codec: str = 'none',
+    zstd_level: int = 3,
+    transfer_config: Optional['TransferConfig'] = None,
+    metrics: Optional[RunMetrics] = None,
+    key_layout: str = 'flat',
+    checkpoint: Optional[RunCheckpoint] = None,
+    max_workers: int = 8,
+    executor: Optional[ThreadPoolExecutor] = None
+) -> Dict[str, Any]:
+    """
+    Streams every `.gz` member of one zip to S3 without writing intermediate files,
+    several members at a time. The zip itself is left in place.
+
+    Args:
+        filepathzip (str): Path of the zip file.
+        s3filepath_base (str): Base path in the S3 bucket to upload the files.
+        api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
+            - 'Access_key_ID'
+            - 'Secret_access_key'
+            - 'AWS_BUCKET_NAME'
+        output_codec (str): Output codec, see `stream_zip_to_s3`.
+        zstd_level (int): Compression level when `output_codec` is 'zstd'.
+        transfer_config (Optional[TransferConfig]): Multipart settings. Defaults to 8 MiB parts.
+        metrics (Optional[RunMetrics]): Receives upload timers and counters.
+        key_layout (str): 'flat' or 'hive', see `s3_layout`.
+        checkpoint (Optional[RunCheckpoint]): Run journal. Members it records as uploaded
+            are skipped, and newly uploaded members are recorded.
+        max_workers (int): Members uploaded at the same time.
+        executor (Optional[ThreadPoolExecutor]): Upload threads to use instead of a pool of
+            `max_workers` owned by this call, e.g. one shared by several zips.
+
+    Returns:
+        Dict[str, Any]: `failed` (`zip:member` names that failed to upload) and `logs`,
+            a (log_times, log_items, log_descriptions) tuple, in member order.
+    """
+    from boto3.exceptions import Boto3Error
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    log_descriptions_dict, log_items_dict = lgs.get_log_descs_and_items_dict()
+    transfer_config = transfer_config or build_transfer_config(
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=8 * 1024 * 1024
+    )
+    s3_client = get_s3_client(api_keys, max_pool_connections=max(1, max_workers) * transfer_config.max_request_concurrency)
+
+    members = []
+    with zipfile.ZipFile(filepathzip, 'r') as zip_ref:
+        for member in zip_ref.infolist():
+            if member.is_dir() or not member.filename.endswith('.gz'):
+                continue
+            filename = os.path.basename(member.filename)
+            s3_path = event_file_key(
+                s3filepath_base, codecs.encoded_filename(filename[:-3], output_codec), key_layout
+            )
+            if checkpoint is not None and checkpoint.get('upload', s3_path) is not None:
+                continue
+            members.append((member.filename, s3_path))
+
+    def upload_member(upload: Tuple[str, str]) -> Tuple[dt.datetime, str, str, bool]:
+        member, s3_path = upload
+        print(f'{filepathzip}:{member} -> {s3_path}')
+        member_started = time.perf_counter()
+        try:
+            # One ZipFile per thread, so members are read through independent file handles
+            with zipfile.ZipFile(filepathzip, 'r') as zip_ref, \
+                    zip_ref.open(member) as member_file, \
+                    codecs.encode_stream(member_file, output_codec, zstd_level) as encoded_file, \
+                    CountingReader(
+                        encoded_file, metrics, 'upload.bytes_uploaded',
+                        'parse.events' if output_codec == 'none' else None
+                    ) as counted_file:
+                s3_client.upload_fileobj(
+                    counted_file, api_keys['AWS_BUCKET_NAME'], s3_path,
+                    ExtraArgs=codecs.get_upload_extra_args(s3_path),
+                    Config=transfer_config
+                )
+            if checkpoint is not None:
+                checkpoint.record('upload', s3_path, filepath=f'{filepathzip}:{member}')
+            if metrics is not None:
+                metrics.increment('upload.files_uploaded')
+            entry = (dt.datetime.now(), s3_path, log_descriptions_dict['copy'], True)
+        except (Boto3Error, BotoCoreError, ClientError, OSError, EOFError) as err:
+            if metrics is not None:
+                metrics.increment('upload.files_failed')
+            print(f'Upload failed: {err}')
+            entry = (dt.datetime.now(), log_items_dict['error'], str(err), False)
+        if metrics is not None:
+            metrics.observe('upload.file', time.perf_counter() - member_started)
+        return entry
+
+    with nullcontext(executor) if executor is not None else ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        entries = list(pool.map(upload_member, members))
+
+    failed = [f'{filepathzip}:{member}' for (member, _), entry in zip(members, entries) if not entry[3]]
+    logs = ([entry[0] for entry in entries], [entry[1] for entry in entries], [entry[2] for entry in entries])
+    return {'failed': failed, 'logs': logs}
+
+
+def stream_zip_to_s3(
+    s3filepath_base: str,
+    api_keys: Dict[str, str],
+    output_codec: str = 'none',
+    zstd_level: int = 3,
+    delete_zip: bool = True,
+    multipart_chunksize: int = 8 * 1024 * 1024,
+    metrics: Optional[RunMetrics] = None,
+    key_layout: str = 'flat',
+    checkpoint: Optional[RunCheckpoint] = None,
+    zip_dir: str = 'datazip',
+    max_workers: int = 8
+) -> List[str]:
+    """
+    Streams every `.gz` member of the zips in `zip_dir` to S3 without writing
+    intermediate files. Each member becomes one object under `s3filepath_base`.
+
+    Args:
+        s3filepath_base (str): Base path in the S3 bucket to upload the files.
+        api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
+            - 'Access_key_ID'
+            - 'Secret_access_key'
+            - 'AWS_BUCKET_NAME'
+        output_codec (str): 'none' gunzips members on the fly and uploads `.json`,
+            'gzip' passes the gzipped bytes through as `.json.gz`, and 'zstd' recompresses
+            to `.json.zst`. Defaults to 'none'.
+        zstd_level (int): Compression level when `output_codec` is 'zstd'. Defaults to 3.
+        delete_zip (bool): Delete each zip once all its members uploaded. Defaults to True.
+        multipart_chunksize (int): Part size for the multipart upload. Defaults to 8 MiB.
+        metrics (Optional[RunMetrics]): Receives the `upload.file` timer and byte/file
+            counters (plus `parse.events` when `output_codec` is 'none').
+        key_layout (str): 'flat' or 'hive' (`dt=YYYY-MM-DD/hour=HH/`), see `s3_layout`.
+            Defaults to 'flat'.
+        checkpoint (Optional[RunCheckpoint]): Run journal of members already uploaded.
+        zip_dir (str): Directory holding the downloaded zips. Defaults to 'datazip'.
+        max_workers (int): Members uploaded at the same time. Defaults to 8.
+
+    Returns:
+        List[str]: `zip:member` names that failed to upload.
+    """
+    codecs.check_codec(output_codec)
+    check_key_layout(key_layout)
+    directoryzip = os.path.join(zip_dir, '')
+    os.makedirs(directoryzip, exist_ok=True)
+
+    log_descriptions_dict, _ = lgs.get_log_descs_and_items_dict()
+
+    transfer_config = build_transfer_config(
+        multipart_threshold=multipart_chunksize,
+        multipart_chunksize=multipart_chunksize
+    )
+
+    failed = []
+    # Skip `.part` files left by interrupted streaming downloads
+    filenameszip = [f for f in os.listdir(directoryzip) if f.endswith('.zip')]
+    with lgs.LogBuffer() as log_buffer:
+        for filenamezip in filenameszip:
+            filepathzip = os.path.join(directoryzip, filenamezip)
+            result = stream_zip_file_to_s3(
+                filepathzip, s3filepath_base, api_keys, output_codec, zstd_level, transfer_config, metrics,
+                key_layout, checkpoint, max_workers
+            )
+            log_buffer.extend(*result['logs'])
+            failed.extend(result['failed'])
+
+            # Keep the zip if anything failed so a rerun can retry it
+            if delete_zip and not result['failed']:
+                print('Removing temporary zip file')
+                os.remove(filepathzip)
+                log_buffer.add(filepathzip, log_descriptions_dict['delete'])
+    return failed
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    api_keys = {
+        'Access_key_ID': os.getenv('S3_USER_ACCESS_KEY'),
+        'Secret_access_key': os.getenv('S3_USER_SECRET_KEY'),
+        'AWS_BUCKET_NAME': os.getenv('AWS_BUCKET_NAME')
+    }
+    stream_zip_to_s3('python-import', api_keys, delete_zip=False)
@@ -0,0 +1,269 @@
+"""
+Skip-if-unchanged uploads for event files.
+
+Before uploading, `UploadManifest` hashes each local file. It then lists the
+target prefixes with batched `ListObjectsV2` calls (1000 keys per request, not a
+`HEAD` per file) and skips any file whose key already exists with the same content.
+A rerun after a partial failure therefore costs listing time, not upload time.
+
+Content is matched in two ways:
+
+- The S3 ETag is computed locally, as S3 derives it for a single-part or multipart
+  upload with the same TransferConfig.
+- Where the ETag is not an MD5 (e.g. SSE-KMS buckets, or a different part size), the
+  manifest records each key's MD5 and the ETag it had after upload. If the file's
+  MD5 and the object's ETag both match the manifest, the object is unchanged.
+
+The manifest lives in `logs/amp_upload_manifest.json` and can be synced to and
+from S3, like the extraction state. With `retain_days`, entries whose key holds an
+event date older than the extraction window are dropped on save, so the manifest
+does not grow with every hour ever uploaded.
+"""
+
+import datetime as dt
+import hashlib
+import os
+import re
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from . import state_store as sts
+from .load_data_to_s3 import get_s3_client
+from .metrics import RunMetrics
+
+if TYPE_CHECKING:
+    from boto3.s3.transfer import TransferConfig
+
+MANIFEST_PATH = os.path.join('logs', 'amp_upload_manifest.json')
+# Event date in a key, e.g. `..._2025-07-10_13#0.json.gz` or `dt=2025-07-10/hour=13/...`
+_KEY_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def file_checksums(path: str, multipart_threshold: int, multipart_chunksize: int) -> Dict[str, Any]:
+    """
+    Hashes a file, and predicts the ETag S3 gives it when uploaded with the given
+    multipart settings.
+
+    Args:
+        path (str): Local file.
+        multipart_threshold (int): Files at least this size are uploaded in parts.
+        multipart_chunksize (int): Part size of multipart uploads.
+
+    Returns:
+        Dict[str, Any]: `md5` (hex digest of the content), `etag` and `size`.
+    """
+    md5 = hashlib.md5()
+    part_digests = []
+    size = 0
+    with open(path, 'rb') as file:
+        while True:
+            part = file.read(multipart_chunksize)
+            if not part:
+                break
+            md5.update(part)
+            part_digests.append(hashlib.md5(part).digest())
+            size += len(part)
+
+    if size < multipart_threshold:
+        etag = md5.hexdigest()
+    else:
+        # Multipart ETag: MD5 of the concatenated part MD5s, suffixed with the part count
+        etag = f'{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}'
+    return {'md5': md5.hexdigest(), 'etag': etag, 'size': size}
+
+
+def listing_prefixes(keys: List[str]) -> List[str]:
+    """
+    Returns a few narrow prefixes that together cover `keys`: one per "directory",
+    narrowed to the common start of the file names in it, so listings only return
+    objects near the ones being uploaded.
+
+    Args:
+        keys (List[str]): S3 keys.
+
+    Returns:
+        List[str]: Sorted prefixes to list.
+    """
+    names_by_dir: Dict[str, List[str]] = {}
+    for key in keys:
+        directory, _, name = key.rpartition('/')
+        names_by_dir.setdefault(directory, []).append(name)
+    return sorted(
+        (directory + '/' if directory else '') + os.path.commonprefix(names)
+        for directory, names in names_by_dir.items()
+    )
+
+
+def list_objects(s3_client: Any, bucket: str, prefixes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Lists objects under each prefix with paginated `ListObjectsV2` calls.
+
+    Args:
+        s3_client (Any): boto3 S3 client.
+        bucket (str): Bucket name.
+        prefixes (List[str]): Key prefixes to list.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: `etag` (without quotes) and `size` by key.
+    """
+    objects = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                objects[item['Key']] = {'etag': item['ETag'].strip('"'), 'size': item['Size']}
+    return objects
+
+
+class UploadManifest:
+    """
+    Content-hash manifest of uploaded event files, used to skip re-uploading
+    objects that already exist in S3 with identical content.
+    """
+
+    def __init__(
+        self,
+        api_keys: Dict[str, str],
+        manifest_path: str = MANIFEST_PATH,
+        s3_key: Optional[str] = None,
+        retain_days: Optional[int] = None
+    ) -> None:
+        """
+        Args:
+            api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
+                - 'Access_key_ID'
+                - 'Secret_access_key'
+                - 'AWS_BUCKET_NAME'
+            manifest_path (str): Local path of the JSON manifest.
+            s3_key (Optional[str]): Key the manifest is synced to in the bucket. None keeps it local.
+            retain_days (Optional[int]): Days back, by the event date in each key, that entries
+                are kept when saving. Keys without a date are always kept. None keeps every entry.
+        """
+        self.api_keys = api_keys
+        self.manifest_path = manifest_path
+        self.s3_key = s3_key
+        self.retain_days = retain_days
+        if s3_key:
+            sts.download_state_from_s3(s3_key, api_keys, manifest_path)
+        self.objects: Dict[str, Dict[str, Any]] = sts.load_state(manifest_path).get('objects', {})
+        self._checksums: Dict[str, Dict[str, Any]] = {}
+
+    def is_unchanged(self, key: str, checksums: Dict[str, Any], remote: Optional[Dict[str, Any]]) -> bool:
+        """
+        Returns whether the object at `key` already holds the content described by `checksums`.
+
+        Args:
+            key (str): S3 key.
+            checksums (Dict[str, Any]): Local `md5`, `etag` and `size`.
+            remote (Optional[Dict[str, Any]]): Listed `etag` and `size`, or None if the key is absent.
+
+        Returns:
+            bool: True if the upload can be skipped.
+        """
+        if remote is None or remote['size'] != checksums['size']:
+            return False
+        if remote['etag'] == checksums['etag']:
+            return True
+        recorded = self.objects.get(key)
+        return recorded is not None and recorded['md5'] == checksums['md5'] and recorded['etag'] == remote['etag']
+
+    def filter_unchanged(
+        self,
+        uploads: List[Tuple[str, str]],
+        transfer_config: 'TransferConfig',
+        max_workers: int = 8,
+        metrics: Optional[RunMetrics] = None
+    ) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """
+        Splits uploads into those that still need uploading and those already in S3.
+
+        Args:
+            uploads (List[Tuple[str, str]]): (local path, S3 key) pairs.
+            transfer_config (TransferConfig): Multipart settings the files will be uploaded with.
+            max_workers (int): Files hashed at the same time.
+            metrics (Optional[RunMetrics]): Receives the `upload.hash`/`upload.list` timers and
+                `upload.files_skipped`/`upload.bytes_skipped` counters.
+
+        Returns:
+            Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]: (to upload, skipped), each in input order.
+        """
+        if not uploads:
+            return [], []
+
+        def checksum(upload: Tuple[str, str]) -> Dict[str, Any]:
+            return file_checksums(upload[0], transfer_config.multipart_threshold, transfer_config.multipart_chunksize)
+
+        with metrics.timer('upload.hash') if metrics is not None else nullcontext():
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                checksums = list(executor.map(checksum, uploads))
+        with metrics.timer('upload.list') if metrics is not None else nullcontext():
+            remote = list_objects(
+                get_s3_client(self.api_keys), self.api_keys['AWS_BUCKET_NAME'], listing_prefixes([k for _, k in uploads])
+            )
+
+        to_upload = []
+        skipped = []
+        for upload, sums in zip(uploads, checksums):
+            key = upload[1]
+            if self.is_unchanged(key, sums, remote.get(key)):
+                skipped.append(upload)
+                if key not in self.objects:
+                    # Uploaded before the manifest knew about it (e.g. by a run that crashed)
+                    self.objects[key] = {'md5': sums['md5'], 'etag': remote[key]['etag'], 'size': sums['size']}
+                if metrics is not None:
+                    metrics.increment('upload.files_skipped')
+                    metrics.increment('upload.bytes_skipped', sums['size'])
+            else:
+                to_upload.append(upload)
+                self._checksums[key] = sums
+        print(f'Skipping {len(skipped)}/{len(uploads)} files already in S3 with the same content')
+        return to_upload, skipped
+
+    def record_uploads(self, results: List[Dict[str, Any]]) -> None:
+        """
+        Records successful uploads (with the ETag S3 actually assigned, from one more
+        batched listing), then saves the manifest locally and to S3.
+
+        Args:
+            results (List[Dict[str, Any]]): Results from `load_data_to_s3.upload_files`.
+        """
+        uploaded = [r['key'] for r in results if r['status'] == 'success' and r['key'] in self._checksums]
+        if uploaded:
+            remote = list_objects(get_s3_client(self.api_keys), self.api_keys['AWS_BUCKET_NAME'], listing_prefixes(uploaded))
+            uploaded_at = dt.datetime.now().isoformat()
+            for key in uploaded:
+                sums = self._checksums.pop(key)
+                etag = remote[key]['etag'] if key in remote else sums['etag']
+                self.objects[key] = {'md5': sums['md5'], 'etag': etag, 'size': sums['size'], 'uploaded_at': uploaded_at}
+        self.save()
+
+    def prune(self, today: Optional[dt.date] = None) -> int:
+        """
+        Drops entries for event dates older than `retain_days`, which no run in the
+        current window uploads again.
+
+        Args:
+            today (Optional[dt.date]): Current date. Defaults to today.
+
+        Returns:
+            int: Entries dropped.
+        """
+        if self.retain_days is None:
+            return 0
+        oldest = str((today or dt.date.today()) - dt.timedelta(days=self.retain_days))
+        stale = []
+        for key in self.objects:
+            match = _KEY_DATE.search(key)
+            if match is not None and match.group() < oldest:
+                stale.append(key)
+        for key in stale:
+            del self.objects[key]
+        return len(stale)
+
+    def save(self) -> None:
+        """Prunes the manifest, then writes it locally and, if configured, to S3."""
+        self.prune()
+        sts.save_state({'objects': self.objects}, self.manifest_path)
+        if self.s3_key:
+            sts.upload_state_to_s3(self.s3_key, self.api_keys, self.manifest_path)
+
@@ -0,0 +1,338 @@
+"""
+Streaming validation and schema-drift tracking for Amplitude events.
+
+Runs inside the parse step, one NDJSON line at a time, so nothing larger than a
+line is held in memory. Each event must parse as a JSON object with non-empty
+`uuid`, `event_time` and `event_type`. Lines that fail are left out of the output
+and written, with the reason, to a quarantine file under `logs/validation/`.
+They are not silently dropped later by Snowflake's `ON_ERROR = CONTINUE`.
+
+For valid events, the top-level keys and their JSON types are tracked per event
+hour. To keep this cheap, an event's (keys, types) signature is checked against
+the signatures already seen, and only a new signature is merged key by key.
+`SchemaTracker` collects these observations across members (and processes) and
+compares them with a baseline schema (`logs/amp_event_schema.json`, optionally
+synced to S3). It writes a drift report of new fields, new types and missing
+fields per hour, then widens the baseline.
+
+Uses `orjson` when installed (see `fast_json`).
+"""
+
+import datetime as dt
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from . import fast_json
+from . import state_store as sts
+from .load_data_to_s3 import upload_files
+from .metrics import RunMetrics
+
+REQUIRED_FIELDS = ('uuid', 'event_time', 'event_type')
+VALIDATION_DIR = os.path.join('logs', 'validation')
+SCHEMA_PATH = os.path.join('logs', 'amp_event_schema.json')
+
+_TYPE_NAMES = {
+    str: 'string', int: 'integer', float: 'number', bool: 'boolean',
+    type(None): 'null', list: 'array', dict: 'object',
+}
+# Distinct (keys, types) signatures remembered per hour; beyond this, events are merged key by key
+_MAX_SIGNATURES = 4096
+
+
+class EventValidator:
+    """
+    Validates the NDJSON lines of one file, quarantining bad lines and recording
+    the top-level schema of good ones.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        quarantine_path: str,
+        required_fields: Tuple[str, ...] = REQUIRED_FIELDS
+    ) -> None:
+        """
+        Args:
+            source (str): Name of the file being validated, recorded with quarantined lines.
+            quarantine_path (str): JSONL file bad lines are written to (created on the first one).
+            required_fields (Tuple[str, ...]): Fields every event must have, non-empty.
+        """
+        self.source = source
+        self.quarantine_path = quarantine_path
+        self.required_fields = required_fields
+        self.valid = 0
+        self.quarantined = 0
+        self.bad_lines: Set[int] = set()
+        # Event hour (`%Y%m%dT%H`) -> key -> JSON type names
+        self.schema: Dict[str, Dict[str, Set[str]]] = {}
+        self._signatures: Dict[str, Set[Tuple[Tuple[str, ...], Tuple[type, ...]]]] = {}
+        self._quarantine_file = None
+
+    def check(self, line: bytes) -> Optional[str]:
+        """
+        Validates one line, recording its schema if it is valid.
+
+        Args:
+            line (bytes): One NDJSON line.
+
+        Returns:
+            Optional[str]: The reason the line is invalid, or None.
+        """
+        try:
+            event = fast_json.loads(line)
+        except ValueError:
+            return 'invalid_json'
+        if not isinstance(event, dict):
+            return 'not_an_object'
+        missing = [field for field in self.required_fields if event.get(field) in (None, '')]
+        if missing:
+            return 'missing_' + '_'.join(missing)
+        event_time = event['event_time']
+        if not isinstance(event_time, str) or len(event_time) < 13:
+            return 'bad_event_time'
+
+        hour = event_time[:10].replace('-', '') + 'T' + event_time[11:13]
+        signature = (tuple(event), tuple(map(type, event.values())))
+        seen = self._signatures.setdefault(hour, set())
+        if signature not in seen:
+            if len(seen) < _MAX_SIGNATURES:
+                seen.add(signature)
+            hour_schema = self.schema.setdefault(hour, {})
+            for key, kind in zip(*signature):
+                hour_schema.setdefault(key, set()).add(_TYPE_NAMES.get(kind, kind.__name__))
+        return None
+
+    def quarantine(self, line_number: int, line: bytes, reason: str) -> None:
+        """
+        Writes a bad line to the quarantine file.
+
+        Args:
+            line_number (int): 1-based line number in the source.
+            line (bytes): The raw line.
+            reason (str): Why it failed validation.
+        """
+        if self._quarantine_file is None:
+            os.makedirs(os.path.dirname(self.quarantine_path) or '.', exist_ok=True)
+            self._quarantine_file = open(self.quarantine_path, 'w')
+        record = {
+            'source': self.source,
+            'line_number': line_number,
+            'reason': reason,
+            'line': line.decode('utf-8', 'replace').rstrip('\r\n'),
+        }
+        self._quarantine_file.write(json.dumps(record) + '\n')
+        self.quarantined += 1
+        self.bad_lines.add(line_number)
+
+    def filter_lines(self, lines: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Yields the valid lines, in order, quarantining the rest. Blank lines are skipped.
+
+        Args:
+            lines (Iterable[bytes]): NDJSON lines, e.g. a decompressed file object.
+
+        Yields:
+            bytes: Valid lines, newline-terminated.
+        """
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            reason = self.check(line)
+            if reason is None:
+                self.valid += 1
+                yield line if line.endswith(b'\n') else line + b'\n'
+            else:
+                self.quarantine(line_number, line, reason)
+
+    def schema_summary(self) -> Dict[str, Dict[str, List[str]]]:
+        """
+        Returns the observed schema in a picklable, JSON-ready form.
+
+        Returns:
+            Dict[str, Dict[str, List[str]]]: Sorted type names by key, by event hour.
+        """
+        return {
+            hour: {key: sorted(types) for key, types in keys.items()}
+            for hour, keys in self.schema.items()
+        }
+
+    def close(self) -> None:
+        """Closes the quarantine file, if any line was quarantined."""
+        if self._quarantine_file is not None:
+            self._quarantine_file.close()
+            self._quarantine_file = None
+
+
+def skip_lines(lines: Iterable[bytes], line_numbers: Set[int]) -> Iterator[bytes]:
+    """
+    Replays a stream without the given (quarantined) lines and blank lines.
+
+    Args:
+        lines (Iterable[bytes]): NDJSON lines.
+        line_numbers (Set[int]): 1-based line numbers to leave out.
+
+    Yields:
+        bytes: Remaining lines, newline-terminated.
+    """
+    for line_number, line in enumerate(lines, 1):
+        if line_number in line_numbers or not line.strip():
+            continue
+        yield line if line.endswith(b'\n') else line + b'\n'
+
+
+def schema_drift(
+    baseline: Dict[str, List[str]],
+    observed: Dict[str, Dict[str, List[str]]]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Compares the schema observed per hour with the baseline. A type counts as new
+    only if it is not 'null', since fields are routinely null in some events.
+
+    Args:
+        baseline (Dict[str, List[str]]): Known type names by key.
+        observed (Dict[str, Dict[str, List[str]]]): Type names by key, by event hour.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: For each hour with drift: `new_fields` (key -> types),
+            `new_types` (key -> types) and `missing_fields` (keys). Empty if the
+            baseline is empty (the first run only establishes it).
+    """
+    if not baseline:
+        return {}
+    drift = {}
+    for hour, keys in sorted(observed.items()):
+        new_fields = {key: types for key, types in keys.items() if key not in baseline}
+        new_types = {
+            key: [kind for kind in types if kind != 'null' and kind not in baseline[key]]
+            for key, types in keys.items() if key in baseline
+        }
+        new_types = {key: types for key, types in new_types.items() if types}
+        missing_fields = sorted(key for key in baseline if key not in keys)
+        if new_fields or new_types or missing_fields:
+            drift[hour] = {'new_fields': new_fields, 'new_types': new_types, 'missing_fields': missing_fields}
+    return drift
+
+
+class SchemaTracker:
+    """
+    Collects validation results from every parsed file in a run and reports schema
+    drift against the stored baseline.
+    """
+
+    def __init__(self) -> None:
+        self.valid = 0
+        self.quarantined = 0
+        self.quarantine_files: List[str] = []
+        self.observed: Dict[str, Dict[str, Set[str]]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, validation: Dict[str, Any]) -> None:
+        """
+        Merges one file's validation result (see `parse_gzip_to_json.parse_member`).
+
+        Args:
+            validation (Dict[str, Any]): `valid`, `quarantined`, `quarantine_path` and `schema`.
+        """
+        with self._lock:
+            self.valid += validation['valid']
+            self.quarantined += validation['quarantined']
+            if validation['quarantined']:
+                self.quarantine_files.append(validation['quarantine_path'])
+            for hour, keys in validation['schema'].items():
+                hour_schema = self.observed.setdefault(hour, {})
+                for key, types in keys.items():
+                    hour_schema.setdefault(key, set()).update(types)
+
+    def write_report(
+        self,
+        schema_path: str = SCHEMA_PATH,
+        report_dir: str = VALIDATION_DIR,
+        api_keys: Optional[Dict[str, str]] = None,
+        schema_s3_key: Optional[str] = None,
+        metrics: Optional[RunMetrics] = None
+    ) -> Dict[str, Any]:
+        """
+        Compares this run's schema with the baseline, writes the drift report and
+        widens the baseline with anything new.
+
+        Args:
+            schema_path (str): Local path of the baseline schema.
+            report_dir (str): Directory the report is written to.
+            api_keys (Optional[Dict[str, str]]): AWS credentials, to sync the baseline.
+            schema_s3_key (Optional[str]): Key the baseline is synced to. None keeps it local.
+            metrics (Optional[RunMetrics]): Receives the `validate.hours_drifted` gauge.
+
+        Returns:
+            Dict[str, Any]: The report: run totals, quarantine files and `drift` by hour.
+        """
+        if schema_s3_key:
+            sts.download_state_from_s3(schema_s3_key, api_keys, schema_path)
+        baseline = sts.load_state(schema_path).get('fields', {})
+
+        with self._lock:
+            observed = {
+                hour: {key: sorted(types) for key, types in keys.items()}
+                for hour, keys in self.observed.items()
+            }
+            report = {
+                'generated_at': dt.datetime.now().isoformat(),
+                'events_valid': self.valid,
+                'events_quarantined': self.quarantined,
+                'quarantine_files': sorted(self.quarantine_files),
+                'drift': schema_drift(baseline, observed),
+            }
+
+        os.makedirs(report_dir, exist_ok=True)
+        report_path = os.path.join(report_dir, f'amp_schema_drift_{dt.datetime.now():%Y%m%dT%H%M%S}.json')
+        with open(report_path, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Validated {self.valid} events, quarantined {self.quarantined}; "
+              f"schema drift in {len(report['drift'])} hours (report: {report_path})")
+        for hour, changes in report['drift'].items():
+            print(f'Schema drift {hour}: {changes}')
+        if metrics is not None:
+            metrics.set_gauge('validate.hours_drifted', len(report['drift']))
+
+        # Widen the baseline so each change is reported once
+        for keys in observed.values():
+            for key, types in keys.items():
+                baseline[key] = sorted(set(baseline.get(key, [])) | set(types))
+        if observed:
+            sts.save_state({'fields': baseline}, schema_path)
+            if schema_s3_key:
+                sts.upload_state_to_s3(schema_s3_key, api_keys, schema_path)
+        return report
+
+
+def upload_validation_files(
+    api_keys: Dict[str, str],
+    s3_prefix: str = 'validation',
+    validation_dir: str = VALIDATION_DIR
+) -> List[str]:
+    """
+    Uploads quarantine files and drift reports, removing each local copy once uploaded.
+    Keep `s3_prefix` outside the event prefix so warehouse loads do not pick them up.
+    Subdirectories (e.g. per-project reports) keep their relative path under the prefix.
+
+    Args:
+        api_keys (Dict[str, str]): Dictionary of AWS credentials, including:
+            - 'Access_key_ID'
+            - 'Secret_access_key'
+            - 'AWS_BUCKET_NAME'
+        s3_prefix (str): Prefix in the bucket.
+        validation_dir (str): Local directory holding the files.
+
+    Returns:
+        List[str]: Local paths that failed to upload.
+    """
+    if not os.path.isdir(validation_dir):
+        return []
+    uploads = []
+    for dirpath, _, filenames in sorted(os.walk(validation_dir)):
+        for filename in sorted(filenames):
+            filepath = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(filepath, validation_dir).replace(os.sep, '/')
+            uploads.append((filepath, f'{s3_prefix}/{relpath}'))
+    results = upload_files(uploads, api_keys, max_workers=4, remove_local=True)
+    return [r['filepath'] for r in results if r['status'] != 'success']
@@ -335,3 +335,63 @@ FROM amp_events AS e
 LEFT JOIN amp_events_list AS el ON e.events_list_id = el.events_list_id;
 
 SELECT * FROM vw_gold_layer_everything;
+
+-- Fan-out tables (main.py fan_out_events = True): the parse step writes events/,
+-- event_properties/ and user_properties/ NDJSON under the upload prefix, with the
+-- property blobs already split out and keyed by a content hash. Loads become appends.
+CREATE OR REPLACE STAGE amplitude_fanout_stage
+  STORAGE_INTEGRATION = JT_DENG3_AMPLITUDE_AIRBYTE_SYNC
+  URL = 's3://deng3-jt/python-import/'
+  FILE_FORMAT = (TYPE = 'JSON' COMPRESSION = AUTO);
+
+CREATE TABLE IF NOT EXISTS amp_events_fanout_raw (event VARIANT);
+CREATE TABLE IF NOT EXISTS amp_event_properties_blobs (event_properties_id STRING, event_properties VARIANT);
+CREATE TABLE IF NOT EXISTS amp_user_properties_blobs (user_properties_id STRING, user_properties VARIANT);
+
+-- Read only one copy of each hour. The default 'flat' layout puts files straight
+-- under events/. With key_layout = 'hive' and compaction, a compacted day exists as
+-- hourly objects (dt=.../hour=.../) until its parts (dt=.../part-NNNNN) are written,
+-- and COPY remembers the hourly files it loaded, so load the parts only:
+--   PATTERN = '.*/dt=[^/]+/part-[0-9]+[.]json.*'
+-- (and the same pattern in the property COPYs below). Without compaction, use
+--   PATTERN = '.*/dt=[^/]+/hour=[0-9]+/[^/]+[.]json.*'
+COPY INTO amp_events_fanout_raw
+FROM @amplitude_fanout_stage/events/
+PATTERN = '.*/events/[^/]+[.]json.*';
+
+-- Property files go through staging tables, so COPY's load history limits each run
+-- to the files uploaded since the last one instead of re-scanning the whole stage.
+-- Use the same PATTERN as the events COPY above.
+CREATE TABLE IF NOT EXISTS amp_event_properties_staged (blob VARIANT);
+CREATE TABLE IF NOT EXISTS amp_user_properties_staged (blob VARIANT);
+
+COPY INTO amp_event_properties_staged
+FROM @amplitude_fanout_stage/event_properties/
+PATTERN = '.*/event_properties/[^/]+[.]json.*';
+
+COPY INTO amp_user_properties_staged
+FROM @amplitude_fanout_stage/user_properties/
+PATTERN = '.*/user_properties/[^/]+[.]json.*';
+
+-- A blob can be written by more than one file, so insert only unseen ids
+MERGE INTO amp_event_properties_blobs AS tgt
+USING (
+    SELECT blob:event_properties_id::STRING AS event_properties_id, ANY_VALUE(blob:event_properties) AS event_properties
+    FROM amp_event_properties_staged
+    GROUP BY 1
+) AS src
+ON tgt.event_properties_id = src.event_properties_id
+WHEN NOT MATCHED THEN INSERT (event_properties_id, event_properties) VALUES (src.event_properties_id, src.event_properties);
+
+MERGE INTO amp_user_properties_blobs AS tgt
+USING (
+    SELECT blob:user_properties_id::STRING AS user_properties_id, ANY_VALUE(blob:user_properties) AS user_properties
+    FROM amp_user_properties_staged
+    GROUP BY 1
+) AS src
+ON tgt.user_properties_id = src.user_properties_id
+WHEN NOT MATCHED THEN INSERT (user_properties_id, user_properties) VALUES (src.user_properties_id, src.user_properties);
+
+-- DELETE, not TRUNCATE: TRUNCATE also clears the load history, so the next COPY would reload every file
+DELETE FROM amp_event_properties_staged;
+DELETE FROM amp_user_properties_staged;
@@ -0,0 +1,45 @@
+"""
+Backfill date ranges and progress reporting.
+"""
+
+import datetime as dt
+import pytest
+from modules.backfill import BackfillProgress, backfill_daydiffs
+
+TODAY = dt.date(2025, 7, 12)
+
+
+def test_ranges_become_daydiffs_in_download_order():
+    assert backfill_daydiffs(dt.date(2025, 7, 8), dt.date(2025, 7, 10), today=TODAY) == [2, 3, 4]
+    assert backfill_daydiffs(dt.date(2025, 7, 8), dt.date(2025, 7, 10), 'oldest', today=TODAY) == [4, 3, 2]
+    assert backfill_daydiffs(TODAY, TODAY, today=TODAY) == [0]
+
+
+@pytest.mark.parametrize('start, end, order', [
+    (dt.date(2025, 7, 10), dt.date(2025, 7, 8), 'newest'),
+    (dt.date(2025, 7, 10), dt.date(2025, 7, 13), 'newest'),
+    (dt.date(2025, 7, 8), dt.date(2025, 7, 10), 'random'),
+])
+def test_invalid_ranges_are_rejected(start, end, order):
+    with pytest.raises(ValueError):
+        backfill_daydiffs(start, end, order, today=TODAY)
+
+
+def test_progress_counts_hours_and_estimates_completion(tmp_path, capsys):
+    zip_path = tmp_path / 'amp.zip'
+    zip_path.write_bytes(b'x' * 1000)
+    progress = BackfillProgress(label='web', report_every=3600)
+    day = dt.datetime(2025, 7, 10)
+    progress.plan([(day, day + dt.timedelta(hours=5)), (day + dt.timedelta(hours=6), day + dt.timedelta(hours=23))])
+    assert (progress.total_shards, progress.total_hours) == (2, 24)
+
+    progress.shard_done({'start': '20250710T00', 'end': '20250710T05', 'status': 'success', 'filepath': str(zip_path)})
+    assert (progress.shards_done, progress.hours_done, progress.bytes_downloaded) == (1, 6, 1000)
+    line = progress.report_line(progress._started + 60)
+    assert line.startswith('web: backfill 1/2 shards (25.0%), 6/24 hours')
+    # 6 hours a minute, 18 to go
+    assert 'ETA 3m00s' in line
+
+    progress.shard_done({'start': '20250710T06', 'end': '20250710T23', 'status': 'failed', 'filepath': 'missing.zip'})
+    # The last shard is always reported
+    assert 'backfill 2/2 shards (100.0%), 1 failed' in capsys.readouterr().out
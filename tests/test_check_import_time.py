@@ -0,0 +1,27 @@
+"""
+Startup imports stay light: heavy dependencies are only imported by the stage that needs them.
+"""
+
+import ast
+import os
+from check_import_time import HEAVY_MODULES, STARTUP_MODULES, measure_imports
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_startup_modules_cover_main_imports():
+    with open(os.path.join(REPO_ROOT, 'main.py')) as file:
+        tree = ast.parse(file.read())
+    imported = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imported.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            imported.add(node.module)
+    assert {name for name in imported if name.startswith('modules.')} <= set(STARTUP_MODULES)
+
+
+def test_no_heavy_module_is_imported_at_startup():
+    _, cumulative = measure_imports(STARTUP_MODULES)
+    assert 'modules.pipeline' in cumulative
+    assert sorted(name for name in cumulative if name.split('.')[0] in HEAVY_MODULES) == []
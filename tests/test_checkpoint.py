@@ -0,0 +1,78 @@
+"""
+Resuming a crashed run from the `RunCheckpoint` journal.
+"""
+
+import os
+from benchmarks.fake_amplitude import FakeExportServer
+from modules.checkpoint import RunCheckpoint
+from modules.extract_amplitude_files import extract_gzip_amplitude
+
+FINGERPRINT = {'output_codec': 'gzip', 'key_layout': 'hive'}
+
+
+def test_units_survive_a_crash_with_the_same_settings(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    checkpoint = RunCheckpoint(path, FINGERPRINT)
+    checkpoint.record('extract', '20250710T00-20250710T05', filepath='a.zip', status='success')
+    checkpoint.record('upload', 'events/a.json.gz', filepath='data/a.json.gz')
+    checkpoint.close()
+    # A torn last line (crash mid-write) only loses that unit
+    with open(path, 'a') as file:
+        file.write('{"stage": "upload", "unit": "events/b.js')
+
+    resumed = RunCheckpoint(path, FINGERPRINT)
+    assert resumed.get('extract', '20250710T00-20250710T05')['filepath'] == 'a.zip'
+    assert [record['unit'] for record in resumed.records('upload')] == ['events/a.json.gz']
+    resumed.close()
+
+    # Different output settings would make different files: start over
+    fresh = RunCheckpoint(path, dict(FINGERPRINT, output_codec='zstd'))
+    assert fresh.get('extract', '20250710T00-20250710T05') is None
+    fresh.complete()
+    assert not os.path.exists(path)
+
+
+def test_parsed_members_and_uploads_are_not_redone(tmp_path):
+    checkpoint = RunCheckpoint(str(tmp_path / 'checkpoint.jsonl'))
+    kept = tmp_path / 'kept.json.gz'
+    uploaded = tmp_path / 'uploaded.json.gz'
+    lost = tmp_path / 'lost.json.gz'
+    kept.write_bytes(b'')
+    uploaded.write_bytes(b'')
+    checkpoint.record('parse', 'a.zip:h0.gz', outputs=[str(kept)])
+    checkpoint.record('parse', 'a.zip:h1.gz', outputs=[str(uploaded)])
+    checkpoint.record('parse', 'a.zip:h2.gz', outputs=[str(lost)])
+    checkpoint.record('upload', 'events/uploaded.json.gz', filepath=str(uploaded))
+
+    # Uploaded, but the crash came before the local delete
+    pending = checkpoint.pending_uploads([(str(kept), 'events/kept.json.gz'), (str(uploaded), 'events/uploaded.json.gz')])
+    assert pending == [(str(kept), 'events/kept.json.gz')]
+    assert not uploaded.exists()
+
+    assert checkpoint.parse_done('a.zip', 'h0.gz')
+    assert checkpoint.parse_done('a.zip', 'h1.gz')
+    # Parsed, but its output is gone and was never uploaded
+    assert not checkpoint.parse_done('a.zip', 'h2.gz')
+    assert not checkpoint.parse_done('a.zip', 'h3.gz')
+    checkpoint.close()
+
+
+def test_extraction_resumes_after_the_downloaded_shards(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'fake_cache').mkdir()
+    path = str(tmp_path / 'checkpoint.jsonl')
+    api_keys = {'AMP_API_KEY': 'key', 'AMP_SECRET_KEY': 'secret'}
+    with FakeExportServer(events_per_hour=2, cache_dir=str(tmp_path / 'fake_cache')) as server:
+        checkpoint = RunCheckpoint(path)
+        first = extract_gzip_amplitude([1], 1, 1, api_keys, shard_hours=6, url=server.url, checkpoint=checkpoint)
+        checkpoint.close()
+        requests_before = server.requests
+
+        checkpoint = RunCheckpoint(path)
+        second = extract_gzip_amplitude([1], 1, 1, api_keys, shard_hours=6, url=server.url, checkpoint=checkpoint)
+        checkpoint.close()
+
+    assert [r['status'] for r in first] == ['success'] * 4
+    assert server.requests == requests_before
+    assert [(r['status'], r['attempts'], r['filepath']) for r in second] == \
+        [('success', 0, r['filepath']) for r in first]
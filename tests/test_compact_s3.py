@@ -0,0 +1,62 @@
+"""
+Merging a day's hourly S3 objects into target-size parts.
+"""
+
+import gzip
+import pytest
+from modules import load_data_to_s3
+from modules.compact_s3 import compact_day, plan_batches
+
+moto = pytest.importorskip('moto')
+
+API_KEYS = {
+    'Access_key_ID': 'testing',
+    'Secret_access_key': 'testing',
+    'AWS_BUCKET_NAME': 'bkt1',
+}
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    import boto3
+
+    monkeypatch.setattr(load_data_to_s3, '_s3_clients', {})
+    with moto.mock_aws():
+        s3 = boto3.client('s3', region_name='eu-north-1')
+        s3.create_bucket(Bucket='bkt1', CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'})
+        yield s3
+
+
+def keys(bucket):
+    return sorted(obj['Key'] for obj in bucket.list_objects_v2(Bucket='bkt1').get('Contents', []))
+
+
+def test_batches_fill_up_to_the_target_size():
+    objects = [{'key': str(n), 'size': size} for n, size in enumerate([40, 40, 30, 100, 10])]
+    batches = plan_batches(objects, 100)
+    assert [[obj['key'] for obj in batch] for batch in batches] == [['0', '1'], ['2'], ['3'], ['4']]
+    assert plan_batches([], 100) == []
+
+
+def test_hourly_objects_are_merged_into_parts(bucket, tmp_path):
+    for hour in range(4):
+        key = f'events/dt=2025-07-10/hour={hour:02d}/123456_2025-07-10_{hour}#0.json.gz'
+        # The last line of hour 1 has no newline; parts must still hold one event per line
+        body = f'{{"uuid": "{hour}a"}}\n{{"uuid": "{hour}b"}}' + ('' if hour == 1 else '\n')
+        bucket.put_object(Bucket='bkt1', Key=key, Body=gzip.compress(body.encode()))
+    bucket.put_object(Bucket='bkt1', Key='events/dt=2025-07-11/hour=00/123456_2025-07-11_0#0.json.gz', Body=b'')
+
+    parts = compact_day('events', API_KEYS, '2025-07-10', target_size=10 ** 6, temp_dir=str(tmp_path / 'compact'))
+
+    assert parts == ['events/dt=2025-07-10/part-00000.json.gz']
+    assert keys(bucket) == ['events/dt=2025-07-10/part-00000.json.gz', 'events/dt=2025-07-11/hour=00/123456_2025-07-11_0#0.json.gz']
+    part = bucket.get_object(Bucket='bkt1', Key=parts[0])
+    assert part['ContentEncoding'] == 'gzip'
+    lines = gzip.decompress(part['Body'].read()).decode().splitlines()
+    assert lines == [f'{{"uuid": "{hour}{n}"}}' for hour in range(4) for n in 'ab']
+
+    # Later hours of the same day become the next part
+    bucket.put_object(Bucket='bkt1', Key='events/dt=2025-07-10/hour=05/123456_2025-07-10_5#0.json.gz',
+                      Body=gzip.compress(b'{"uuid": "5a"}\n'))
+    assert compact_day('events', API_KEYS, '2025-07-10', temp_dir=str(tmp_path / 'compact')) == \
+        ['events/dt=2025-07-10/part-00001.json.gz']
@@ -0,0 +1,94 @@
+"""
+Seen-uuid index of `UuidDeduplicator`: per-file commits and S3 sync.
+"""
+
+import gzip
+import json
+import pytest
+from modules import load_data_to_s3
+from modules.dedupe import UuidDeduplicator, dedupe_data_dir
+
+S3_API_KEYS = {
+    'Access_key_ID': 'testing',
+    'Secret_access_key': 'testing',
+    'AWS_BUCKET_NAME': 'bkt1',
+}
+
+
+def write_events(path, uuids):
+    with open(path, 'w') as file:
+        for event_uuid in uuids:
+            file.write(json.dumps({'uuid': event_uuid, 'event_time': '2025-07-10 13:00:00.000'}) + '\n')
+    return str(path)
+
+
+def uuid_of(n):
+    return f'00000000-0000-4000-8000-{n:012d}'
+
+
+def test_only_failed_files_are_emitted_again(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    deduplicator = UuidDeduplicator(index_dir)
+    uploaded = write_events(tmp_path / 'a.json', [uuid_of(1), uuid_of(2)])
+    failed = write_events(tmp_path / 'b.json', [uuid_of(2), uuid_of(3)])
+    assert deduplicator.dedupe_file(uploaded) == (2, 0)
+    assert deduplicator.dedupe_file(failed) == (1, 1)
+    deduplicator.rollback([failed])
+    deduplicator.commit()
+    deduplicator.close()
+
+    deduplicator = UuidDeduplicator(index_dir)
+    rerun = write_events(tmp_path / 'c.json', [uuid_of(1), uuid_of(2), uuid_of(3)])
+    assert deduplicator.dedupe_file(rerun) == (1, 2)
+    deduplicator.close()
+
+
+def test_uuids_pending_at_a_crash_are_forgotten(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    deduplicator = UuidDeduplicator(index_dir)
+    deduplicator.dedupe_file(write_events(tmp_path / 'a.json', [uuid_of(1)]))
+    deduplicator.close()
+
+    deduplicator = UuidDeduplicator(index_dir)
+    assert deduplicator.dedupe_file(write_events(tmp_path / 'b.json', [uuid_of(1)])) == (1, 0)
+    deduplicator.close()
+
+
+def test_gzip_files_are_rewritten_at_the_given_level(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    path = data_dir / 'a.json.gz'
+    with gzip.open(path, 'wb') as file:
+        file.write(b''.join(
+            json.dumps({'uuid': uuid_of(n % 2), 'event_time': '2025-07-10 13:00:00.000'}).encode() + b'\n'
+            for n in range(3)
+        ))
+
+    deduplicator = UuidDeduplicator(str(tmp_path / 'index'))
+    assert dedupe_data_dir(deduplicator, str(data_dir), gzip_level=1) == (2, 1)
+    deduplicator.close()
+    with open(path, 'rb') as file:
+        # XFL 4: written at the fastest level, not gzip.open's default of 9
+        assert file.read()[8] == 4
+    with gzip.open(path, 'rb') as file:
+        assert len(file.read().splitlines()) == 2
+
+def test_index_is_shared_through_s3(tmp_path, monkeypatch):
+    moto = pytest.importorskip('moto')
+    import boto3
+
+    monkeypatch.setattr(load_data_to_s3, '_s3_clients', {})
+    with moto.mock_aws():
+        boto3.client('s3', region_name='eu-north-1').create_bucket(
+            Bucket='bkt1', CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'}
+        )
+        first = UuidDeduplicator(str(tmp_path / 'host1'), api_keys=S3_API_KEYS, s3_prefix='state/dedupe')
+        first.dedupe_file(write_events(tmp_path / 'a.json', [uuid_of(1)]))
+        first.commit()
+        first.upload_to_s3()
+        first.close()
+
+        # A fresh container with no local index
+        second = UuidDeduplicator(str(tmp_path / 'host2'), api_keys=S3_API_KEYS, s3_prefix='state/dedupe')
+        assert second.dedupe_file(write_events(tmp_path / 'b.json', [uuid_of(1), uuid_of(2)])) == (1, 1)
+        second.close()
@@ -0,0 +1,115 @@
+"""
+Shard planning, concurrent sharded extraction, and resumed Export API downloads
+(`stream_export_to_file`).
+"""
+
+import datetime as dt
+import zipfile
+import pytest
+from benchmarks.fake_amplitude import FakeExportServer
+from modules.extract_amplitude_files import extract_gzip_amplitude, plan_shards, stream_export_to_file
+
+DAY = dt.datetime(2025, 7, 10)
+
+BODY = bytes(range(256)) * 4
+
+
+class FakeResponse:
+    def __init__(self, status_code, body, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+
+    def raise_for_status(self):
+        assert self.status_code < 400
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class RangeClient:
+    """Answers Range requests from `first_byte` instead of the requested offset."""
+
+    def __init__(self, first_byte=None):
+        self.first_byte = first_byte
+        self.ranges = []
+
+    def get(self, url, params=None, auth=None, headers=None, stream=False, timeout=None):
+        requested = (headers or {}).get('Range')
+        self.ranges.append(requested)
+        if requested is None:
+            return FakeResponse(200, BODY)
+        first = int(requested[len('bytes='):-1]) if self.first_byte is None else self.first_byte
+        content_range = f'bytes {first}-{len(BODY) - 1}/{len(BODY)}'
+        return FakeResponse(206, BODY[first:], {'Content-Range': content_range})
+
+
+def download(tmp_path, client, partial):
+    filepathzip = str(tmp_path / 'amp20250710T00-20250710T05.zip')
+    with open(filepathzip + '.part', 'wb') as file:
+        file.write(partial)
+    size = stream_export_to_file('https://example.invalid/export', {}, ('key', 'secret'), filepathzip, client=client)
+    with open(filepathzip, 'rb') as file:
+        return size, file.read()
+
+
+def test_resumes_from_partial_file(tmp_path):
+    client = RangeClient()
+    assert download(tmp_path, client, BODY[:300]) == (len(BODY), BODY)
+    assert client.ranges == ['bytes=300-']
+
+
+def test_mismatched_content_range_starts_over(tmp_path):
+    client = RangeClient(first_byte=256)
+    assert download(tmp_path, client, BODY[:300]) == (len(BODY), BODY)
+    assert client.ranges == ['bytes=300-', None]
+
+
+def hours(shards):
+    return [(f'{start:%d %H}', f'{end:%d %H}') for start, end in shards]
+
+
+def test_days_split_into_shards_of_at_most_shard_hours():
+    assert hours(plan_shards([0, 1], 8, start_current_day=DAY)) == [
+        ('10 00', '10 07'), ('10 08', '10 15'), ('10 16', '10 23'),
+        ('09 00', '09 07'), ('09 08', '09 15'), ('09 16', '09 23'),
+    ]
+    assert hours(plan_shards([0], 24, start_current_day=DAY)) == [('10 00', '10 23')]
+
+
+def test_completed_and_unavailable_hours_are_left_out():
+    completed = {'20250710T02', '20250710T03', '20250710T10'}
+    latest = DAY + dt.timedelta(hours=13)
+    shards = plan_shards([0], 6, start_current_day=DAY, completed_hours=completed, latest_hour=latest)
+    assert hours(shards) == [('10 00', '10 01'), ('10 04', '10 09'), ('10 11', '10 13')]
+
+
+def test_shard_hours_must_fit_in_a_day():
+    with pytest.raises(ValueError):
+        plan_shards([0], 25, start_current_day=DAY)
+
+
+def test_shards_download_concurrently_in_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'fake_cache').mkdir()
+    with FakeExportServer(events_per_hour=2, latency_seconds=0.1, cache_dir=str(tmp_path / 'fake_cache')) as server:
+        started = dt.datetime.now()
+        results = extract_gzip_amplitude(
+            [1], 1, 1, {'AMP_API_KEY': 'key', 'AMP_SECRET_KEY': 'secret'},
+            shard_hours=3, max_workers=8, url=server.url, zip_dir=str(tmp_path / 'datazip')
+        )
+        elapsed = (dt.datetime.now() - started).total_seconds()
+
+    assert [r['status'] for r in results] == ['success'] * 8
+    assert [r['start'][-2:] for r in results] == ['00', '03', '06', '09', '12', '15', '18', '21']
+    # Eight 100 ms responses on eight workers, not one after another
+    assert elapsed < 0.5
+    with zipfile.ZipFile(results[1]['filepath']) as zip_ref:
+        assert len(zip_ref.namelist()) == 3
@@ -0,0 +1,59 @@
+"""
+Property ids and the written-id cache of `EventFanout`.
+"""
+
+import io
+import json
+from modules.fanout_events import FANOUT_TABLES, EventFanout, PropertyCache
+
+
+def event(n, user_properties):
+    return json.dumps({
+        'uuid': f'u{n}', 'event_type': 'click',
+        'event_properties': {'page': 'home', 'n': n % 2},
+        'user_properties': user_properties,
+    }).encode() + b'\n'
+
+
+def fan_out(lines, cache):
+    writers = {table: io.BytesIO() for table in FANOUT_TABLES}
+    fanout = EventFanout(writers, cache)
+    fanout.write_lines(lines)
+    rows = {table: [json.loads(line) for line in writer.getvalue().splitlines()] for table, writer in writers.items()}
+    return fanout, rows
+
+
+def test_ids_do_not_depend_on_key_order():
+    _, rows = fan_out([event(1, {'plan': 'pro', 'seats': 3}), event(3, {'seats': 3, 'plan': 'pro'})], PropertyCache())
+    assert len(rows['user_properties']) == 1
+    assert rows['events'][0]['user_properties_id'] == rows['events'][1]['user_properties_id']
+    assert rows['events'][0]['user_properties_id'] == rows['user_properties'][0]['user_properties_id']
+    assert len(rows['events'][0]['user_properties_id']) == 32
+
+
+def test_each_blob_is_written_once_per_file():
+    fanout, rows = fan_out([event(n, {'plan': 'pro'}) for n in range(4)], PropertyCache())
+    assert [len(rows[table]) for table in FANOUT_TABLES] == [4, 2, 1]
+    assert fanout.blobs_skipped == 5
+    assert 'event_properties' not in rows['events'][0]
+
+
+def test_ids_are_cached_only_once_the_file_is_committed():
+    cache = PropertyCache()
+    first, _ = fan_out([event(1, {'plan': 'pro'})], cache)
+    # Not committed (e.g. the member failed): the next file writes the blobs again
+    _, rows = fan_out([event(1, {'plan': 'pro'})], cache)
+    assert len(rows['user_properties']) == 1
+
+    first.commit()
+    _, rows = fan_out([event(1, {'plan': 'pro'})], cache)
+    assert rows['user_properties'] == [] and rows['event_properties'] == []
+    assert len(rows['events']) == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = PropertyCache(max_size=2)
+    cache.add(['a', 'b'])
+    assert cache.seen('a')
+    cache.add(['c'])
+    assert cache.seen('a') and cache.seen('c') and not cache.seen('b')
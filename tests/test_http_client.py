@@ -0,0 +1,137 @@
+"""
+Connection pooling of `HttpClient` and Export API requests through its HTTP/2 response wrapper.
+"""
+
+import datetime as dt
+import sys
+import threading
+import pytest
+from benchmarks.fake_amplitude import FakeExportServer
+from modules import http_client, retry
+from modules.extract_amplitude_files import extract_shard
+from modules.http_client import HttpClient, _Http2Response
+
+SHARD = (dt.datetime(2025, 7, 10, 0), dt.datetime(2025, 7, 10, 5))
+BODY = b'PK\x05\x06' + b'\x00' * 18
+
+
+class FakeStatusError(Exception):
+    """Stands in for `httpx.HTTPStatusError`, which carries the response."""
+
+    def __init__(self, response: 'FakeHttpxResponse') -> None:
+        super().__init__(f'{response.status_code} error')
+        self.response = response
+
+
+class FakeHttpxResponse:
+    """The parts of `httpx.Response` the wrapper uses; `elapsed` is unset, as on a streamed response."""
+
+    def __init__(self, status_code: int, body: bytes = b'') -> None:
+        self.status_code = status_code
+        self.headers = {}
+        self._body = body
+
+    def read(self) -> bytes:
+        return self._body
+
+    def iter_bytes(self, chunk_size: int):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise FakeStatusError(self)
+
+    def close(self) -> None:
+        pass
+
+
+class FakeHttp2Client:
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+
+    def get(self, url, params=None, auth=None, headers=None, stream=False, timeout=None):
+        return _Http2Response(FakeHttpxResponse(self.status_code, BODY), dt.timedelta(milliseconds=5))
+
+
+@pytest.mark.parametrize('stream', [True, False])
+def test_extract_shard_through_http2_wrapper(tmp_path, stream):
+    result = extract_shard(
+        *SHARD, 'https://example.invalid/export', ('key', 'secret'), retry.RetryPolicy(max_elapsed=0),
+        directoryzip=f'{tmp_path}/', stream=stream, client=FakeHttp2Client(200)
+    )
+    assert result['status'] == 'success'
+    with open(result['filepath'], 'rb') as f:
+        assert f.read() == BODY
+
+
+def test_extract_shard_no_data_through_http2_wrapper(tmp_path):
+    result = extract_shard(
+        *SHARD, 'https://example.invalid/export', ('key', 'secret'), retry.RetryPolicy(max_elapsed=0),
+        directoryzip=f'{tmp_path}/', client=FakeHttp2Client(404)
+    )
+    assert result['status'] == 'no_data'
+
+
+def test_http_client_httpx_backend(tmp_path):
+    httpx = pytest.importorskip('httpx')
+
+    def handler(request):
+        if request.url.params['start'] == '20250710T00':
+            return httpx.Response(200, content=BODY)
+        return httpx.Response(404)
+
+    client = HttpClient()
+    client._httpx_client = httpx.Client(transport=httpx.MockTransport(handler))
+    ok = extract_shard(
+        *SHARD, 'https://example.invalid/export', ('key', 'secret'), retry.RetryPolicy(max_elapsed=0),
+        directoryzip=f'{tmp_path}/', client=client
+    )
+    empty = extract_shard(
+        dt.datetime(2025, 7, 11, 0), dt.datetime(2025, 7, 11, 5), 'https://example.invalid/export',
+        ('key', 'secret'), retry.RetryPolicy(max_elapsed=0), directoryzip=f'{tmp_path}/', client=client
+    )
+    assert ok['status'] == 'success'
+    assert empty['status'] == 'no_data'
+
+
+def test_get_http_client_shares_one_client_per_settings(monkeypatch):
+    monkeypatch.setattr(http_client, '_clients', {})
+    client = http_client.get_http_client(4)
+    assert http_client.get_http_client(4) is client
+    assert http_client.get_http_client(8) is not client
+    assert client.pool_size == 4
+
+
+def test_requests_backend_reuses_connection(tmp_path):
+    (tmp_path / 'fake_cache').mkdir()
+    client = HttpClient(pool_size=2)
+    with FakeExportServer(events_per_hour=2, cache_dir=str(tmp_path / 'fake_cache')) as server:
+        for _ in range(3):
+            with client.get(server.url, params={'start': '20250710T00', 'end': '20250710T01'}) as response:
+                response.raise_for_status()
+                assert response.request.headers['Accept-Encoding'] == 'identity'
+        pools = list(client._adapter.poolmanager.pools._container.values())
+        assert server.requests == 3
+        assert [pool.num_connections for pool in pools] == [1]
+    client.close()
+
+
+def test_requests_backend_session_per_thread_shares_adapter():
+    client = HttpClient()
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(client._session()))
+    thread.start()
+    thread.join()
+    assert client._session() is client._session()
+    assert sessions[0] is not client._session()
+    assert sessions[0].get_adapter('https://example.invalid') is client._adapter
+    assert client._session().get_adapter('https://example.invalid') is client._adapter
+
+
+def test_http2_falls_back_to_requests_without_httpx(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'httpx', None)
+    client = HttpClient(http2=True)
+    assert client.http2 is False
+    assert client._httpx_client is None
+    assert client._adapter is not None
@@ -0,0 +1,62 @@
+"""
+Per-file results of `upload_files` when S3 rejects an upload, and which `logs/`
+files `load_logs_csv` ships.
+"""
+
+import pytest
+from modules import load_data_to_s3
+from modules.load_data_to_s3 import load_logs_csv, upload_files
+
+moto = pytest.importorskip('moto')
+
+API_KEYS = {
+    'Access_key_ID': 'testing',
+    'Secret_access_key': 'testing',
+    'AWS_BUCKET_NAME': 'bkt1',
+}
+
+
+@pytest.fixture(autouse=True)
+def fresh_s3_clients(monkeypatch):
+    # Clients made outside the mock would talk to real S3
+    monkeypatch.setattr(load_data_to_s3, '_s3_clients', {})
+
+
+@moto.mock_aws
+def test_failed_uploads_are_reported_per_file(tmp_path):
+    import boto3
+
+    boto3.client('s3', region_name='eu-north-1').create_bucket(
+        Bucket='bkt1', CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'}
+    )
+    good = tmp_path / 'amp_2025-07-10_0.json'
+    good.write_text('{}\n')
+    missing = tmp_path / 'missing.json'
+
+    results = upload_files(
+        [(str(good), 'events/amp_2025-07-10_0.json'), (str(missing), 'events/missing.json')],
+        API_KEYS, max_workers=2
+    )
+    assert [r['status'] for r in results] == ['success', 'failed']
+
+    # upload_file raises S3UploadFailedError, not ClientError, when the bucket rejects it
+    results = upload_files([(str(good), 'events/amp_2025-07-10_0.json')], dict(API_KEYS, AWS_BUCKET_NAME='no-such-bucket'))
+    assert results[0]['status'] == 'failed'
+    assert results[0]['error']
+
+
+@moto.mock_aws
+def test_logs_upload_includes_run_summaries(tmp_path, monkeypatch):
+    import boto3
+
+    s3 = boto3.client('s3', region_name='eu-north-1')
+    s3.create_bucket(Bucket='bkt1', CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'})
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir()
+    for filename in ('amp_log.csv', 'amp_run_summary_20250710T000000.json', 'amp_extract_state.json'):
+        (tmp_path / 'logs' / filename).write_text('{}\n')
+
+    load_logs_csv('events', API_KEYS)
+
+    keys = sorted(obj['Key'] for obj in s3.list_objects_v2(Bucket='bkt1')['Contents'])
+    assert keys == ['events/amp_log.csv', 'events/amp_run_summary_20250710T000000.json']
@@ -0,0 +1,29 @@
+"""
+Batched appends of `LogBuffer`.
+"""
+
+import csv
+import datetime as dt
+from modules.logginghelper import LogBuffer, get_log_path
+
+
+def read_rows(path):
+    with open(path, newline='') as file:
+        return list(csv.reader(file))
+
+
+def test_buffer_flushes_every_batch_and_on_close(tmp_path):
+    log_time = dt.datetime(2025, 7, 10, 13)
+    log_path = get_log_path(log_time, str(tmp_path))
+    log_buffer = LogBuffer(batch_size=3, log_dir=str(tmp_path))
+    for n in range(4):
+        log_buffer.add(f'file{n}', 'File created', log_time)
+    # The first three went out with the batch, the fourth waits for close()
+    assert len(read_rows(log_path)) == 1 + 3
+
+    log_buffer.extend([log_time], ['file4'], ['File deleted'])
+    log_buffer.close()
+    rows = read_rows(log_path)
+    assert rows[0] == ['log_time', 'log_item', 'log_description']
+    assert [row[1] for row in rows[1:]] == ['file0', 'file1', 'file2', 'file3', 'file4']
+    assert log_buffer.written == 5
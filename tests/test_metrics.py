@@ -0,0 +1,30 @@
+"""
+Peak RSS reporting in the run summary and Prometheus textfile.
+"""
+
+import multiprocessing
+import sys
+import pytest
+from modules.metrics import RunMetrics
+
+
+def _allocate(size):
+    buffer = bytearray(size)
+    return len(buffer)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='resource is not available on Windows')
+def test_summary_reports_child_process_memory(tmp_path):
+    # A child that allocates 64 MiB is invisible to RUSAGE_SELF
+    process = multiprocessing.get_context('spawn').Process(target=_allocate, args=(64 * 1024 * 1024,))
+    process.start()
+    process.join()
+
+    metrics = RunMetrics(run_id='test', labels={'project': 'web'})
+    summary = metrics.summary()
+    assert summary['peak_rss_children_bytes'] >= 64 * 1024 * 1024
+    assert summary['peak_rss_bytes'] > 0
+
+    textfile = metrics.write_prometheus_textfile(str(tmp_path / 'amp.prom'))
+    with open(textfile) as file:
+        assert 'amp_pipeline_peak_rss_children_bytes{project="web"} ' in file.read()
@@ -0,0 +1,44 @@
+"""
+Typed Parquet output of `convert_ndjson_to_parquet`.
+"""
+
+import datetime as dt
+import io
+import json
+import pytest
+from modules.parquet_writer import convert_ndjson_to_parquet
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def event(event_uuid, event_time):
+    return json.dumps({
+        'uuid': event_uuid, 'event_type': 'click', 'event_time': event_time,
+        'server_upload_time': '2025-07-10 13:45:14.000000', 'client_event_time': '2025-07-10 13:45:12.123',
+    }).encode() + b'\n'
+
+
+def test_times_are_utc_timestamps_and_bad_lines_are_skipped(tmp_path):
+    bad_lines = []
+    lines = io.BytesIO(
+        event('a', '2025-07-10 13:45:12.123000') + b'{"uuid": "b", "event_time": \n' + b'[1, 2]\n'
+        + event('c', '2025-07-10 13:59:59')
+    )
+    paths = convert_ndjson_to_parquet(
+        lines, str(tmp_path), 'amp_2025-07-10_13', on_bad_line=lambda *bad: bad_lines.append(bad)
+    )
+
+    table = pq.read_table(paths[0])
+    assert str(table.schema.field('event_time').type) == 'timestamp[us, tz=UTC]'
+    rows = table.to_pylist()
+    assert [row['uuid'] for row in rows] == ['a', 'c']
+    assert rows[0]['event_time'] == dt.datetime(2025, 7, 10, 13, 45, 12, 123000, tzinfo=dt.timezone.utc)
+    assert rows[0]['client_event_time'] == dt.datetime(2025, 7, 10, 13, 45, 12, 123000, tzinfo=dt.timezone.utc)
+    assert [(number, reason) for number, _, reason in bad_lines] == [(2, 'invalid_json'), (3, 'not_an_object')]
+
+
+def test_unparseable_time_is_kept_in_extra(tmp_path):
+    paths = convert_ndjson_to_parquet(io.BytesIO(event('a', '2025-07-10 13:xx')), str(tmp_path), 'amp')
+    row = pq.read_table(paths[0]).to_pylist()[0]
+    assert row['event_time'] is None
+    assert json.loads(row['extra']) == {'event_time': '2025-07-10 13:xx'}
@@ -0,0 +1,27 @@
+"""
+Zip handling of the non-pipelined parse step.
+"""
+
+import datetime as dt
+import os
+from benchmarks.fake_amplitude import build_export_zip
+from modules.parse_gzip_to_json import parse_gzip_amplitude
+
+
+def test_parsed_zips_are_not_parsed_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    zip_dir = tmp_path / 'datazip'
+    data_dir = tmp_path / 'data'
+    zip_dir.mkdir()
+    build_export_zip(str(zip_dir / 'amp20250710T00-20250710T02.zip'), dt.datetime(2025, 7, 10, 0), dt.datetime(2025, 7, 10, 2), 5)
+
+    parse_gzip_amplitude(output_codec='gzip', parse_workers=1, zip_dir=str(zip_dir), data_dir=str(data_dir))
+    assert os.listdir(zip_dir) == []
+    parsed = sorted(os.listdir(data_dir))
+    assert parsed == [f'123456_2025-07-10_{hour}#0.json.gz' for hour in range(3)]
+
+    # The next run (after the upload removed the files) finds nothing left over
+    for filename in parsed:
+        os.remove(data_dir / filename)
+    parse_gzip_amplitude(output_codec='gzip', parse_workers=1, zip_dir=str(zip_dir), data_dir=str(data_dir))
+    assert os.listdir(data_dir) == []
@@ -0,0 +1,97 @@
+"""
+End-to-end pipeline runs against the local fake Export API and a mocked S3 bucket.
+"""
+
+import threading
+import time
+import pytest
+from benchmarks.fake_amplitude import FakeExportServer
+from modules import load_data_to_s3
+from modules.pipeline import run_pipeline
+from modules.upload_manifest import UploadManifest
+
+moto = pytest.importorskip('moto')
+
+S3_API_KEYS = {
+    'Access_key_ID': 'testing',
+    'Secret_access_key': 'testing',
+    'AWS_BUCKET_NAME': 'bkt1',
+}
+AMP_API_KEYS = {'AMP_API_KEY': 'key', 'AMP_SECRET_KEY': 'secret'}
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+    import boto3
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(load_data_to_s3, '_s3_clients', {})
+    with moto.mock_aws():
+        s3 = boto3.client('s3', region_name='eu-north-1')
+        s3.create_bucket(Bucket='bkt1', CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'})
+        yield s3
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / 'fake_cache').mkdir()
+    with FakeExportServer(events_per_hour=20, cache_dir=str(tmp_path / 'fake_cache')) as fake:
+        yield fake
+
+
+def test_uploads_are_batched(bucket, server, monkeypatch):
+    lookups = []
+    filter_unchanged = UploadManifest.filter_unchanged
+
+    def counting_filter(self, uploads, *args, **kwargs):
+        lookups.append(len(uploads))
+        if len(lookups) == 1:
+            # A slow first batch lets the parsed members that follow queue up
+            time.sleep(0.2)
+        return filter_unchanged(self, uploads, *args, **kwargs)
+
+    monkeypatch.setattr(UploadManifest, 'filter_unchanged', counting_filter)
+    shard_results, failed = run_pipeline(
+        [2], 1, 1, AMP_API_KEYS, 'events', S3_API_KEYS,
+        url=server.url, skip_unchanged=True, upload_workers=8, parse_workers=1, queue_size=1
+    )
+
+    keys = [obj['Key'] for obj in bucket.list_objects_v2(Bucket='bkt1', Prefix='events/')['Contents']]
+    assert [r['status'] for r in shard_results] == ['success']
+    assert failed == []
+    assert len(keys) == 24
+    # 24 hourly files in batches of up to 8, not one lookup per file
+    assert sum(lookups) == 24
+    assert len(lookups) <= 4
+    assert max(lookups) <= 8
+
+
+def test_streaming_uploads_concurrently(bucket, server, monkeypatch):
+    active = []
+    peak = []
+    lock = threading.Lock()
+    client_class = type(load_data_to_s3.get_s3_client(S3_API_KEYS, 16))
+    upload_fileobj = client_class.upload_fileobj
+
+    def tracked_upload(self, *args, **kwargs):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.02)
+        try:
+            return upload_fileobj(self, *args, **kwargs)
+        finally:
+            with lock:
+                active.pop()
+
+    monkeypatch.setattr(client_class, 'upload_fileobj', tracked_upload)
+    shard_results, failed = run_pipeline(
+        [2], 1, 1, AMP_API_KEYS, 'events', S3_API_KEYS,
+        url=server.url, upload_workers=4, shard_hours=6, max_workers=2, streaming=True, queue_size=2
+    )
+
+    keys = [obj['Key'] for obj in bucket.list_objects_v2(Bucket='bkt1', Prefix='events/')['Contents']]
+    assert [r['status'] for r in shard_results] == ['success'] * 4
+    assert failed == []
+    assert len(keys) == 24
+    assert 1 < max(peak) <= 4
@@ -0,0 +1,74 @@
+"""
+Project loading and concurrent project runs.
+"""
+
+import os
+import threading
+import time
+import pytest
+from modules.projects import load_projects, run_projects, scoped_key, scoped_path
+
+
+def test_projects_get_their_own_keys_prefixes_and_paths():
+    environ = {
+        'AMP_PROJECTS': 'web, ios-app',
+        'AMP_DATA_REGION': 'eu',
+        'AMP_API_KEY_WEB': 'k1', 'AMP_SECRET_KEY_WEB': 's1', 'AMP_DATA_REGION_WEB': 'us',
+        'AMP_API_KEY_IOS_APP': 'k2', 'AMP_SECRET_KEY_IOS_APP': 's2', 'AMP_S3_PREFIX_IOS_APP': 'ios',
+    }
+    web, ios = load_projects('python-import', environ)
+
+    assert web['api_keys'] == {'AMP_API_KEY': 'k1', 'AMP_SECRET_KEY': 's1', 'AMP_DATA_REGION': 'us'}
+    assert (web['s3filepath_base'], ios['s3filepath_base']) == ('python-import/web', 'ios')
+    assert ios['api_keys']['AMP_DATA_REGION'] == 'eu'
+    assert ios['data_dir'] == os.path.join('projects', 'ios-app', 'data')
+    assert scoped_path(web, os.path.join('logs', 'state.json')) == os.path.join('logs', 'web', 'state.json')
+    assert scoped_key(web, 'state/state.json') == 'state/web/state.json'
+
+
+def test_single_project_keeps_the_unscoped_layout():
+    [project] = load_projects('python-import', {'AMP_API_KEY': 'k', 'AMP_SECRET_KEY': 's'})
+    assert project['name'] is None
+    assert project['data_dir'] == 'data'
+    assert scoped_key(project, 'state/state.json') == 'state/state.json'
+
+
+def test_projects_without_keys_are_rejected():
+    with pytest.raises(ValueError):
+        load_projects('python-import', {'AMP_PROJECTS': 'web'})
+
+
+def test_projects_run_concurrently_and_errors_stay_per_project():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def run_project(project):
+        with lock:
+            active.append(project['name'])
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(project['name'])
+        if project['name'] == 'ios':
+            raise RuntimeError('export failed')
+        return project['name'].upper()
+
+    projects = [{'name': 'web'}, {'name': 'ios'}, {'name': 'android'}]
+    outcomes = run_projects(projects, run_project, max_concurrent=3)
+
+    assert list(outcomes) == ['web', 'ios', 'android']
+    assert outcomes['web'] == {'status': 'success', 'result': 'WEB'}
+    assert outcomes['ios']['status'] == 'error'
+    assert str(outcomes['ios']['error']) == 'export failed'
+    assert outcomes['android'] == {'status': 'success', 'result': 'ANDROID'}
+    assert max(peak) > 1
+
+
+def test_projects_run_in_the_calling_thread_one_at_a_time():
+    threads = []
+    outcomes = run_projects(
+        [{'name': None}, {'name': 'web'}], lambda project: threads.append(threading.current_thread()), max_concurrent=1
+    )
+    assert threads == [threading.main_thread()] * 2
+    assert [outcome['status'] for outcome in outcomes.values()] == ['success', 'success']
@@ -0,0 +1,67 @@
+"""
+AIMD behaviour of `AdaptiveRateLimiter`.
+"""
+
+import requests
+from modules.rate_limiter import AdaptiveRateLimiter
+
+
+def request(limiter, status_code=None, latency=0.1, error=None):
+    started = limiter.acquire()
+    limiter.release(started, status_code, latency, error)
+
+
+def test_healthy_responses_increase_additively():
+    limiter = AdaptiveRateLimiter(max_concurrency=8, max_requests_per_second=100)
+    limiter.concurrency_limit = 4.0
+    limiter.rate = 50.0
+    request(limiter, 200)
+    assert limiter.concurrency_limit == 4.25
+    assert limiter.rate == 60.0
+    for _ in range(100):
+        request(limiter, 200)
+    assert (limiter.concurrency_limit, limiter.rate) == (8, 100)
+
+
+def test_throttling_and_network_errors_halve_the_limits():
+    for status_code, error in [(429, None), (503, None), (None, requests.exceptions.ConnectTimeout()),
+                               (200, requests.exceptions.ChunkedEncodingError())]:
+        limiter = AdaptiveRateLimiter(max_concurrency=8, max_requests_per_second=100)
+        request(limiter, status_code, error=error)
+        assert (limiter.concurrency_limit, limiter.rate) == (4, 50)
+
+
+def test_local_and_client_errors_are_not_congestion():
+    limiter = AdaptiveRateLimiter(max_concurrency=8, max_requests_per_second=100)
+    request(limiter, None, error=OSError(28, 'No space left on device'))
+    request(limiter, None, error=ValueError('bad zip'))
+    request(limiter, 400, error=requests.exceptions.HTTPError('400'))
+    request(limiter, 500)
+    assert (limiter.concurrency_limit, limiter.rate) == (8, 100)
+
+
+def test_concurrent_throttles_count_as_one_signal():
+    limiter = AdaptiveRateLimiter(max_concurrency=8)
+    started = [limiter.acquire() for _ in range(4)]
+    for start in started:
+        limiter.release(start, 429)
+    assert limiter.concurrency_limit == 4
+    assert limiter.in_flight == 0
+    request(limiter, 429)
+    assert limiter.concurrency_limit == 2
+
+
+def test_latency_spike_backs_off():
+    limiter = AdaptiveRateLimiter(max_concurrency=8, latency_spike_factor=3.0)
+    limiter.concurrency_limit = 4.0
+    for _ in range(3):
+        request(limiter, 200, latency=0.1)
+    limit = limiter.concurrency_limit
+    request(limiter, 200, latency=1.0)
+    assert limiter.concurrency_limit == limit / 2
+
+
+def test_fixed_limits_do_not_adapt():
+    limiter = AdaptiveRateLimiter(max_concurrency=8, adaptive=False)
+    request(limiter, 429)
+    assert limiter.concurrency_limit == 8
@@ -0,0 +1,62 @@
+"""
+Error classification and backoff delays of `RetryPolicy`.
+"""
+
+import datetime as dt
+import email.utils
+import pytest
+import requests
+from modules import retry
+from modules.retry import RetryPolicy
+
+
+def http_error(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return requests.exceptions.HTTPError(f'{status_code} error', response=response)
+
+
+@pytest.mark.parametrize('error, action', [
+    (http_error(404), retry.NO_DATA),
+    (http_error(400), retry.FAIL),
+    (http_error(401), retry.FAIL),
+    (http_error(403), retry.FAIL),
+    (http_error(418), retry.FAIL),
+    (http_error(408), retry.RETRY),
+    (http_error(429), retry.RETRY),
+    (http_error(503), retry.RETRY),
+    (http_error(599), retry.RETRY),
+    (requests.exceptions.ConnectionError(), retry.RETRY),
+    (requests.exceptions.ReadTimeout(), retry.RETRY),
+    (requests.exceptions.ChunkedEncodingError(), retry.RETRY),
+    (TimeoutError(), retry.RETRY),
+    (OSError(28, 'No space left on device'), retry.FAIL),
+    (ValueError('bad zip'), retry.FAIL),
+])
+def test_errors_are_classified(error, action):
+    assert RetryPolicy().classify(error) == action
+
+
+def test_backoff_grows_exponentially_up_to_the_cap():
+    policy = RetryPolicy(base_delay=2, max_delay=10, jitter=0)
+    assert [policy.backoff(attempt) for attempt in range(1, 6)] == [2, 4, 8, 10, 10]
+    jittered = RetryPolicy(base_delay=2, jitter=0.5)
+    assert all(1 <= jittered.backoff(1) <= 2 for _ in range(50))
+
+
+def test_retry_after_is_honoured_within_the_budget():
+    policy = RetryPolicy(max_elapsed=60, jitter=0)
+    assert policy.next_delay(http_error(429, {'Retry-After': '30'}), 1, 0) == 30
+    # Past the remaining budget: give up rather than retry early
+    assert policy.next_delay(http_error(429, {'Retry-After': '30'}), 1, 40) is None
+    retry_at = email.utils.format_datetime(dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=20), usegmt=True)
+    assert 15 <= policy.next_delay(http_error(503, {'Retry-After': retry_at}), 1, 0) <= 20
+
+
+def test_budget_and_attempt_cap_end_retries():
+    policy = RetryPolicy(base_delay=2, max_elapsed=5, max_attempts=3, jitter=0)
+    assert policy.next_delay(http_error(500), 1, 4) == 1
+    assert policy.next_delay(http_error(500), 1, 5) is None
+    assert policy.next_delay(http_error(500), 3, 0) is None
+    assert policy.next_delay(http_error(400), 1, 0) is None
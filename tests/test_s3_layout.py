@@ -0,0 +1,35 @@
+"""
+S3 keys of hourly event files under the flat and hive layouts.
+"""
+
+import os
+import pytest
+from modules.load_data_to_s3 import data_file_key
+from modules.s3_layout import event_file_key, export_file_hour
+
+FILENAME = '123456_2025-07-10_7#0.json.gz'
+
+
+def test_export_file_names_give_their_date_and_hour():
+    assert export_file_hour(FILENAME) == ('2025-07-10', 7)
+    assert export_file_hour('amp_log.csv') is None
+
+
+def test_hive_layout_partitions_by_date_and_hour():
+    assert event_file_key('events', FILENAME) == f'events/{FILENAME}'
+    assert event_file_key('events', FILENAME, 'hive') == f'events/dt=2025-07-10/hour=07/{FILENAME}'
+    assert event_file_key('events', 'other.json', 'hive') == 'events/dt=unknown/hour=unknown/other.json'
+    with pytest.raises(ValueError):
+        event_file_key('events', FILENAME, 'daily')
+
+
+def test_data_files_keep_table_and_partition_directories():
+    data_dir = os.path.join('projects', 'web', 'data')
+    assert data_file_key(os.path.join(data_dir, FILENAME), 'events', data_dir, 'hive') == \
+        f'events/dt=2025-07-10/hour=07/{FILENAME}'
+    # Fan-out tables get their own prefix
+    assert data_file_key(os.path.join(data_dir, 'user_properties', FILENAME), 'events', data_dir, 'hive') == \
+        f'events/user_properties/dt=2025-07-10/hour=07/{FILENAME}'
+    # Parquet output is already partitioned locally
+    parquet = os.path.join(data_dir, 'dt=2025-07-10', 'hour=07', 'part.parquet')
+    assert data_file_key(parquet, 'events', data_dir, 'hive') == 'events/dt=2025-07-10/hour=07/part.parquet'
@@ -0,0 +1,53 @@
+"""
+Which shard results the state store records as ingested.
+"""
+
+import datetime as dt
+from modules.state_store import completed_shards, get_completed_hours, load_state, mark_shards_completed
+
+NOW = dt.datetime(2025, 7, 12, 10, 30)
+
+
+def shard(start, end, status):
+    return {'start': start, 'end': end, 'status': status}
+
+
+def test_recent_empty_shards_are_asked_again():
+    results = [
+        shard('20250712T00', '20250712T05', 'success'),
+        shard('20250712T06', '20250712T08', 'no_data'),
+        shard('20250711T06', '20250711T09', 'no_data'),
+        shard('20250710T00', '20250710T23', 'failed'),
+    ]
+    assert completed_shards(results, no_data_settle_hours=24, now=NOW) == [
+        ('20250712T00', '20250712T05'),
+        ('20250711T06', '20250711T09'),
+    ]
+
+
+def test_empty_shard_settles_once_it_ended_long_enough_ago():
+    results = [shard('20250711T10', '20250711T10', 'no_data')]
+    assert completed_shards(results, no_data_settle_hours=24, now=NOW) == []
+    assert completed_shards(results, no_data_settle_hours=24, now=NOW + dt.timedelta(minutes=30)) == [
+        ('20250711T10', '20250711T10')
+    ]
+
+
+def test_contiguous_shards_merge_into_one_range(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    mark_shards_completed([('20250712T00', '20250712T05'), ('20250712T12', '20250712T17')], state_path, now=NOW)
+    mark_shards_completed([('20250712T06', '20250712T11')], state_path, now=NOW)
+    mark_shards_completed([('20250712T03', '20250712T04')], state_path, now=NOW)
+
+    shards = load_state(state_path)['completed_shards']
+    assert [(s['start'], s['end']) for s in shards] == [('20250712T00', '20250712T17')]
+    assert len(get_completed_hours(load_state(state_path))) == 18
+
+
+def test_shards_outside_the_window_are_pruned(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    mark_shards_completed([('20250701T00', '20250701T23')], state_path, now=NOW)
+    mark_shards_completed([('20250711T00', '20250711T23')], state_path, retain_hours=48, now=NOW)
+
+    shards = load_state(state_path)['completed_shards']
+    assert [(s['start'], s['end']) for s in shards] == [('20250711T00', '20250711T23')]
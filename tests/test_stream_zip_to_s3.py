@@ -0,0 +1,89 @@
+"""
+Streaming zip members straight to S3 (`stream_zip_file_to_s3`).
+"""
+
+import datetime as dt
+import threading
+import time
+import pytest
+from benchmarks.fake_amplitude import build_export_zip
+from modules import load_data_to_s3
+from modules.checkpoint import RunCheckpoint
+from modules.stream_zip_to_s3 import stream_zip_file_to_s3
+
+moto = pytest.importorskip('moto')
+
+S3_API_KEYS = {
+    'Access_key_ID': 'testing',
+    'Secret_access_key': 'testing',
+    'AWS_BUCKET_NAME': 'bkt1',
+}
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    import boto3
+
+    monkeypatch.setattr(load_data_to_s3, '_s3_clients', {})
+    with moto.mock_aws():
+        s3 = boto3.client('s3', region_name='eu-north-1')
+        s3.create_bucket(Bucket='bkt1', CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'})
+        yield s3
+
+
+@pytest.fixture
+def export_zip(tmp_path):
+    path = str(tmp_path / 'amp20250710T00-20250710T05.zip')
+    build_export_zip(path, dt.datetime(2025, 7, 10, 0), dt.datetime(2025, 7, 10, 5), events_per_hour=10)
+    return path
+
+
+def keys(bucket):
+    return sorted(obj['Key'] for obj in bucket.list_objects_v2(Bucket='bkt1').get('Contents', []))
+
+
+def test_members_upload_concurrently(bucket, export_zip, monkeypatch):
+    active = []
+    peak = []
+    lock = threading.Lock()
+    upload_fileobj = type(load_data_to_s3.get_s3_client(S3_API_KEYS, 16)).upload_fileobj
+
+    def tracked_upload(self, *args, **kwargs):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        try:
+            return upload_fileobj(self, *args, **kwargs)
+        finally:
+            with lock:
+                active.pop()
+
+    monkeypatch.setattr(type(load_data_to_s3.get_s3_client(S3_API_KEYS, 16)), 'upload_fileobj', tracked_upload)
+    result = stream_zip_file_to_s3(export_zip, 'events', S3_API_KEYS, output_codec='gzip', max_workers=4)
+
+    assert result['failed'] == []
+    assert keys(bucket) == [f'events/123456_2025-07-10_{hour}#0.json.gz' for hour in (0, 1, 2, 3, 4, 5)]
+    assert max(peak) > 1
+    # Logs stay in member order whatever order the uploads finish in
+    assert result['logs'][1] == [f'events/123456_2025-07-10_{hour}#0.json.gz' for hour in range(6)]
+
+
+def test_journaled_members_are_skipped(bucket, export_zip, tmp_path):
+    checkpoint = RunCheckpoint(str(tmp_path / 'journal.jsonl'))
+    checkpoint.record('upload', 'events/123456_2025-07-10_0#0.json', filepath='done before a crash')
+
+    result = stream_zip_file_to_s3(export_zip, 'events', S3_API_KEYS, checkpoint=checkpoint, max_workers=2)
+
+    assert result['failed'] == []
+    assert len(keys(bucket)) == 5
+    assert checkpoint.get('upload', 'events/123456_2025-07-10_5#0.json') is not None
+
+
+def test_failed_members_are_reported(export_zip, monkeypatch):
+    monkeypatch.setattr(load_data_to_s3, '_s3_clients', {})
+    with moto.mock_aws():
+        # No bucket: every upload is rejected
+        result = stream_zip_file_to_s3(export_zip, 'events', S3_API_KEYS, max_workers=3)
+    assert len(result['failed']) == 6
+    assert result['failed'][0].endswith(':123456/123456_2025-07-10_0#0.json.gz')
@@ -0,0 +1,69 @@
+"""
+Skip-if-unchanged checks of `UploadManifest`, and pruning of its entries.
+"""
+
+import datetime as dt
+import json
+import pytest
+from modules import load_data_to_s3
+from modules.load_data_to_s3 import build_transfer_config, upload_files
+from modules.upload_manifest import UploadManifest
+
+moto = pytest.importorskip('moto')
+
+API_KEYS = {
+    'Access_key_ID': 'testing',
+    'Secret_access_key': 'testing',
+    'AWS_BUCKET_NAME': 'bkt1',
+}
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    import boto3
+
+    monkeypatch.setattr(load_data_to_s3, '_s3_clients', {})
+    with moto.mock_aws():
+        s3 = boto3.client('s3', region_name='eu-north-1')
+        s3.create_bucket(Bucket='bkt1', CreateBucketConfiguration={'LocationConstraint': 'eu-north-1'})
+        yield s3
+
+
+def test_unchanged_files_are_skipped(bucket, tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    transfer_config = build_transfer_config()
+    same = tmp_path / 'a.json'
+    changed = tmp_path / 'b.json'
+    same.write_text('{"uuid": "1"}\n')
+    changed.write_text('{"uuid": "2"}\n')
+    uploads = [(str(same), 'events/amp_2025-07-10_0.json'), (str(changed), 'events/amp_2025-07-10_1.json')]
+
+    manifest = UploadManifest(API_KEYS, manifest_path=manifest_path)
+    to_upload, skipped = manifest.filter_unchanged(uploads, transfer_config)
+    assert (to_upload, skipped) == (uploads, [])
+    manifest.record_uploads(upload_files(to_upload, API_KEYS, transfer_config=transfer_config))
+
+    changed.write_text('{"uuid": "2", "late": true}\n')
+    manifest = UploadManifest(API_KEYS, manifest_path=manifest_path)
+    to_upload, skipped = manifest.filter_unchanged(uploads, transfer_config)
+    assert to_upload == [uploads[1]]
+    assert skipped == [uploads[0]]
+
+
+def test_entries_outside_the_window_are_pruned(tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    entry = {'md5': 'x', 'etag': 'x', 'size': 1}
+    manifest_path.write_text(json.dumps({'objects': {
+        'events/123456_2025-07-01_3#0.json.gz': entry,
+        'events/dt=2025-07-09/hour=13/123456_2025-07-09_13#0.json.gz': entry,
+        'events/123456_2025-07-10_0#0.json.gz': entry,
+        'events/undated.json': entry,
+    }}))
+
+    manifest = UploadManifest(API_KEYS, manifest_path=str(manifest_path), retain_days=1)
+    assert manifest.prune(today=dt.date(2025, 7, 10)) == 1
+    assert sorted(manifest.objects) == [
+        'events/123456_2025-07-10_0#0.json.gz',
+        'events/dt=2025-07-09/hour=13/123456_2025-07-09_13#0.json.gz',
+        'events/undated.json',
+    ]
@@ -0,0 +1,68 @@
+"""
+Line validation and quarantine in `EventValidator`, with and without orjson.
+"""
+
+import importlib
+import json
+import sys
+import pytest
+from modules import fast_json
+from modules.validate_events import EventValidator, schema_drift
+
+GOOD = b'{"uuid": "u1", "event_time": "2025-07-10 13:05:00.000", "event_type": "click", "n": 1}\n'
+LINES = [
+    GOOD,
+    b'not json\n',
+    b'\n',
+    b'[1, 2]\n',
+    b'{"uuid": "u2", "event_time": "2025-07-10 13:06:00.000", "event_type": ""}\n',
+    b'{"uuid": "u3", "event_time": "2025", "event_type": "view"}',
+]
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def json_backend(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        # Reload fast_json as if orjson were not installed
+        monkeypatch.setitem(sys.modules, 'orjson', None)
+    backend = importlib.reload(fast_json)
+    yield backend
+    monkeypatch.undo()
+    importlib.reload(fast_json)
+
+
+def test_bad_lines_are_quarantined_with_their_reason(tmp_path, json_backend):
+    quarantine_path = tmp_path / 'validation' / 'amp.quarantine.jsonl'
+    validator = EventValidator('amp.json', str(quarantine_path))
+    assert list(validator.filter_lines(LINES)) == [GOOD]
+    validator.close()
+
+    with open(quarantine_path) as file:
+        records = [json.loads(line) for line in file]
+    assert [(r['line_number'], r['reason']) for r in records] == [
+        (2, 'invalid_json'), (4, 'not_an_object'), (5, 'missing_event_type'), (6, 'bad_event_time')
+    ]
+    assert records[0] == {'source': 'amp.json', 'line_number': 2, 'reason': 'invalid_json', 'line': 'not json'}
+    assert (validator.valid, validator.quarantined, validator.bad_lines) == (1, 4, {2, 4, 5, 6})
+    assert validator.schema_summary() == {
+        '20250710T13': {'uuid': ['string'], 'event_time': ['string'], 'event_type': ['string'], 'n': ['integer']}
+    }
+
+
+def test_no_quarantine_file_without_bad_lines(tmp_path):
+    quarantine_path = tmp_path / 'amp.quarantine.jsonl'
+    validator = EventValidator('amp.json', str(quarantine_path))
+    assert list(validator.filter_lines([GOOD])) == [GOOD]
+    validator.close()
+    assert not quarantine_path.exists()
+
+
+def test_drift_reports_new_fields_and_types_but_not_nulls():
+    baseline = {'uuid': ['string'], 'n': ['integer'], 'gone': ['string']}
+    observed = {'20250710T13': {'uuid': ['string'], 'n': ['null', 'string'], 'added': ['boolean']}}
+    assert schema_drift(baseline, observed) == {
+        '20250710T13': {'new_fields': {'added': ['boolean']}, 'new_types': {'n': ['string']}, 'missing_fields': ['gone']}
+    }
+    assert schema_drift({}, observed) == {}